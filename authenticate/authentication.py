@@ -1,4 +1,8 @@
+import hmac
+import time
+
 import jwt
+from django.core.cache import caches
 from django.utils.encoding import smart_text, smart_str
 from django.utils.translation import ugettext as _
 from rest_framework import exceptions
@@ -6,7 +10,11 @@ from rest_framework.authentication import (
     BaseAuthentication, get_authorization_header
 )
 from rest_framework_jwt.settings import api_settings
-from authenticate.utils import jwt_get_label_from_payload_handler, jwt_get_username_from_payload_handler
+from authenticate.cache import principal_cache
+from authenticate.utils import jwt_get_label_from_payload_handler, jwt_get_username_from_payload_handler, \
+    request_signature
+from cloud_platform import settings
+from cloud_platform.helpers import is_objectid_valid
 from supernodes.models import Supernodes
 from users.models import User
 
@@ -46,20 +54,21 @@ class BaseJSONWebTokenAuthentication(BaseAuthentication):
     def authenticate_credentials(payload):
         """
         Returns an active user that matches the payload's user id and email.
+        Principals are resolved through principal_cache, not on every request.
         """
         label = jwt_get_label_from_payload_handler(payload)
         username = jwt_get_username_from_payload_handler(payload)
 
         if label:
             try:
-                node = Supernodes.objects.get(id=payload.get('id'))
+                node = principal_cache.get_supernode(payload.get('id'))
             except Supernodes.DoesNotExist:
                 msg = _('Invalid signature.')
                 raise exceptions.AuthenticationFailed(msg)
             return node
         elif username:
             try:
-                user = User.objects.get(username=username)
+                user = principal_cache.get_user(username)
             except User.DoesNotExist:
                 msg = _('Invalid signature.')
                 raise exceptions.AuthenticationFailed(msg)
@@ -105,6 +114,66 @@ class JSONWebTokenAuthentication(BaseJSONWebTokenAuthentication):
         return '{0} realm="{1}"'.format(api_settings.JWT_AUTH_HEADER_PREFIX, self.www_authenticate_realm)
 
 
+class SignatureAuthentication(BaseAuthentication):
+    """
+    Stateless signed request authentication for supernodes, no token round trip is needed.
+    Clients sign every request with their secret key, see authenticate.utils.request_signature:
+
+        Authorization: AGRIHUB-HMAC <supernode-id>:<signature>
+        X-Agrihub-Timestamp: <unix time>
+
+    Supernode key material is resolved through principal_cache. A request older than
+    the replay window, or a signature already used within it, is rejected.
+    """
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        options = settings.HMAC_AUTH
+
+        if not auth or smart_text(auth[0].lower()) != options['HEADER_PREFIX'].lower():
+            return None
+
+        if len(auth) != 2 or b':' not in auth[1]:
+            msg = _('Invalid Authorization header. Expected <key id>:<signature>.')
+            raise exceptions.AuthenticationFailed(msg)
+        key_id, signature = smart_text(auth[1]).split(':', 1)
+
+        try:
+            timestamp = int(request.META.get('HTTP_X_AGRIHUB_TIMESTAMP'))
+        except (TypeError, ValueError):
+            msg = _('Invalid X-Agrihub-Timestamp header.')
+            raise exceptions.AuthenticationFailed(msg)
+        if abs(time.time() - timestamp) > options['REPLAY_WINDOW']:
+            msg = _('Request timestamp is outside replay window.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        if not is_objectid_valid(key_id):
+            msg = _('Invalid signature.')
+            raise exceptions.AuthenticationFailed(msg)
+        try:
+            supernode = principal_cache.get_supernode(key_id)
+        except Supernodes.DoesNotExist:
+            msg = _('Invalid signature.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        expected = request_signature(supernode.secretkey, request.method, request.get_full_path(),
+                                     timestamp, request.body)
+        if not hmac.compare_digest(smart_str(expected), smart_str(signature)):
+            msg = _('Invalid signature.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        # every signature is accepted once, remember it a little longer than the window it is valid for
+        if not caches[options['REPLAY_CACHE']].add('hmac-signature:%s' % signature, 1,
+                                                   2 * options['REPLAY_WINDOW']):
+            msg = _('Request has already been used.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        return supernode, None
+
+    def authenticate_header(self, request):
+        return settings.HMAC_AUTH['HEADER_PREFIX']
+
+
 try:
     from django.contrib.auth.hashers import check_password, make_password
 except ImportError:
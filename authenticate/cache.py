@@ -0,0 +1,180 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.encoding import smart_bytes
+from mongoengine import signals
+
+from cloud_platform import settings
+from supernodes.models import Supernodes
+from users.models import User
+
+
+class LocalLRUBackend(object):
+    """
+    In-process LRU with per entry expiration time.
+    """
+    name = 'local'
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[1] < time.time():
+                return None
+            # re-insert to mark it as most recently used
+            self.entries[key] = entry
+            return entry[0]
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, time.time() + timeout)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class DjangoCacheBackend(object):
+    """
+    Shared backend on top of one of settings.CACHES, invalidation is then visible to every process.
+    """
+
+    def __init__(self, alias):
+        self.name = alias
+        self.cache = caches[alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout):
+        self.cache.set(key, value, timeout)
+
+    def delete_many(self, keys):
+        self.cache.delete_many(keys)
+
+
+class PrincipalCache(object):
+    """
+    Cache of authenticated principals (Supernodes or User) keyed by JWT subject.
+
+    Documents are stored as raw SON and rebuilt on every hit, so requests never share
+    a mutable instance. Keys are prefixed with a digest of JWT secret key,
+    rotating the secret key leaves every previous entry unreachable.
+    """
+
+    def __init__(self, backend, timeout, secret):
+        self.backend = backend
+        self.timeout = timeout
+        self.prefix = 'principal:%s:' % hashlib.sha1(smart_bytes(secret)).hexdigest()[:8]
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_supernode(self, supernode_id):
+        """
+        Raise Supernodes.DoesNotExist when supernode is not exist.
+        """
+        return self.get(Supernodes, 'supernode:%s' % supernode_id,
+                        lambda: Supernodes.objects.get(id=supernode_id))
+
+    def get_user(self, username):
+        """
+        Raise User.DoesNotExist when user is not exist.
+        """
+        return self.get(User, 'user:%s' % username, lambda: self.load_user(username))
+
+    def load_user(self, username):
+        user = User.objects.get(username=username)
+        # remember which username the user id was cached with, username may change later
+        self.backend.set(self.prefix + 'user-id:%s' % user.id, username, self.timeout)
+        return user
+
+    def get(self, document, key, loader):
+        son = self.backend.get(self.prefix + key)
+        with self.lock:
+            if son is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if son is not None:
+            return document._from_son(son)
+
+        principal = loader()
+        self.backend.set(self.prefix + key, principal.to_mongo(), self.timeout)
+        return principal
+
+    def invalidate_supernode(self, supernode_id):
+        self.backend.delete_many([self.prefix + 'supernode:%s' % supernode_id])
+
+    def invalidate_user(self, user):
+        keys = [self.prefix + 'user:%s' % user.username, self.prefix + 'user-id:%s' % user.id]
+        username = self.backend.get(self.prefix + 'user-id:%s' % user.id)
+        if username:
+            keys.append(self.prefix + 'user:%s' % username)
+        self.backend.delete_many(keys)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {
+            'backend': self.backend.name,
+            'timeout': self.timeout,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0
+        }
+        if isinstance(self.backend, LocalLRUBackend):
+            stats['size'] = len(self.backend)
+            stats['evictions'] = self.backend.evictions
+        return stats
+
+
+def create_principal_cache():
+    options = getattr(settings, 'AUTH_PRINCIPAL_CACHE', {})
+    alias = options.get('BACKEND', 'default')
+    if 'local' == alias:
+        backend = LocalLRUBackend(options.get('MAX_ENTRIES', 10000))
+    else:
+        backend = DjangoCacheBackend(alias)
+    # invalidation would only reach the process that saved the document, a deleted user or
+    # a rotated supernode secretkey would still be accepted by the others until TIMEOUT
+    local = isinstance(backend, LocalLRUBackend) or isinstance(backend.cache, LocMemCache)
+    if local and not settings.DEBUG:
+        raise ImproperlyConfigured("AUTH_PRINCIPAL_CACHE backend '%s' is local to one process." % alias)
+    return PrincipalCache(backend, options.get('TIMEOUT', 300), settings.JWT_AUTH.get('JWT_SECRET_KEY'))
+
+
+principal_cache = create_principal_cache()
+
+
+def invalidate_principal(sender, document, **kwargs):
+    """
+    mongoengine signal receiver, drop principal cache entry of the saved or deleted document.
+    Sensors are embedded in Supernodes, so changing them via save() is covered as well.
+    """
+    if isinstance(document, Supernodes):
+        principal_cache.invalidate_supernode(document.id)
+    elif isinstance(document, User):
+        principal_cache.invalidate_user(document)
+
+
+for _sender in (Supernodes, User):
+    signals.post_save.connect(invalidate_principal, sender=_sender)
+    signals.post_delete.connect(invalidate_principal, sender=_sender)
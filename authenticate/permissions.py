@@ -1,3 +1,6 @@
+from mongoengine.errors import ValidationError
+from mongoengine.queryset.visitor import Q
+from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.permissions import BasePermission
 from django.contrib.auth.models import AnonymousUser
 from supernodes.models import Supernodes
@@ -63,3 +66,41 @@ class IsResearcher(BasePermission):
     def has_permission(self, request, view):
         is_user = IsUser()
         return is_user.has_permission(request, view) and 0 == request.user.is_admin
+
+
+def owned_by(user):
+    """
+    Permission predicate: document owned by user.
+    Ownership is compared with raw ObjectId inside the query, no User is dereferenced.
+    """
+    return Q(user=user.id)
+
+
+def visible_to(user):
+    """
+    Permission predicate: document owned by user or flagged as public.
+    """
+    return Q(user=user.id) | Q(is_public=1)
+
+
+def get_permitted(document, lookup, predicate=None, fields=None, denied=None, not_found=None):
+    """
+    Load one document matching lookup and permission predicate with a single query,
+    projected to fields when they are given.
+
+    Raise NotFound when nothing match, a private document is then indistinguishable from
+    a missing one. With denied message, an existing document that fails the predicate
+    raise PermissionDenied instead; that costs one id-only query on the failure path only.
+    """
+    try:
+        queryset = document.objects(predicate or Q(), **lookup)
+        if fields:
+            queryset = queryset.only(*fields)
+        obj = queryset.first()
+        if obj is None and denied and document.objects(**lookup).only('id').first():
+            raise PermissionDenied(denied)
+    except ValidationError:
+        obj = None
+    if obj is None:
+        raise NotFound(not_found)
+    return obj
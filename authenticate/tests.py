@@ -0,0 +1,31 @@
+from django.test import SimpleTestCase
+
+from authenticate.cache import LocalLRUBackend
+from authenticate.utils import request_signature
+
+
+class LocalLRUBackendTest(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        backend = LocalLRUBackend(max_entries=2)
+        backend.set('a', 1, 60)
+        backend.set('b', 2, 60)
+        backend.get('a')
+        backend.set('c', 3, 60)
+        self.assertEqual(backend.get('a'), 1)
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.evictions, 1)
+
+    def test_expired_entry(self):
+        backend = LocalLRUBackend(max_entries=2)
+        backend.set('a', 1, -1)
+        self.assertIsNone(backend.get('a'))
+        self.assertEqual(len(backend), 0)
+
+
+class RequestSignatureTest(SimpleTestCase):
+    def test_signature_covers_request(self):
+        signature = request_signature('secret', 'post', '/sensordatas/', 1500000000, b'{}')
+        self.assertEqual(signature, request_signature('secret', 'POST', '/sensordatas/', 1500000000, b'{}'))
+        self.assertNotEqual(signature, request_signature('other', 'POST', '/sensordatas/', 1500000000, b'{}'))
+        self.assertNotEqual(signature, request_signature('secret', 'POST', '/sensordatas/', 1500000001, b'{}'))
+        self.assertNotEqual(signature, request_signature('secret', 'POST', '/sensordatas/', 1500000000, b'[]'))
@@ -1,6 +1,10 @@
+import base64
+import hashlib
+import hmac
 import uuid
 from calendar import timegm
 from datetime import datetime
+from django.utils.encoding import smart_bytes
 from rest_framework_jwt.settings import api_settings
 
 
@@ -68,3 +72,14 @@ def jwt_get_username_from_payload_handler(payload):
     Override this function if label is formatted differently in payload
     """
     return payload.get('username')
+
+
+def request_signature(secret, method, path, timestamp, body):
+    """
+    Signature of signed request authentication, shared by server and supernode clients:
+    base64 HMAC-SHA256 with supernode secret key over METHOD, path, timestamp and
+    sha256 hex digest of body, joined by newline.
+    """
+    message = '\n'.join([method.upper(), path, str(timestamp), hashlib.sha256(smart_bytes(body)).hexdigest()])
+    digest = hmac.new(smart_bytes(secret), smart_bytes(message), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('ascii')
@@ -2,8 +2,11 @@ import jwt
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from authenticate.cache import principal_cache
 from authenticate.forms import SuperNodeAuthForm, UserAuthForm
 from authenticate.utils import supernode_jwt_payload_handler, user_jwt_payload_handler
+from authenticate.permissions import IsAdmin
+from authenticate.authentication import JSONWebTokenAuthentication
 from authenticate.serializers import UserSerializer
 from supernodes.serializers import SuperNodesSerializer
 from cloud_platform import settings
@@ -49,3 +52,15 @@ class NodeTokenCreator(APIView):
         payload = supernode_jwt_payload_handler(node)
         token = jwt.encode(payload, settings.SECRET_KEY)
         return token.decode('unicode_escape')
+
+
+class PrincipalCacheStats(APIView):
+    """
+    Hit-rate metrics of authenticated principal cache of this process.
+    """
+    authentication_classes = (JSONWebTokenAuthentication,)
+    permission_classes = (IsAdmin,)
+
+    @staticmethod
+    def get(request, format=None):
+        return Response(principal_cache.stats())
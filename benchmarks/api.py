@@ -0,0 +1,349 @@
+"""
+Latency and throughput of the API hot paths, served in process by the Django test client
+against a seeded fleet.
+
+Seeds users, supernodes, nodes with sensors and readings spread over --days into a bench
+database (dropped first), then measures token creation (/user-auth/, /node-auth/),
+POST /sensordatas/ throughput, and latency of the sensordatas filter views (supernode,
+supernode sensor, node, node sensor, user) and of /nodes/ (own and role=global).
+
+Against a local mongod:
+$ python benchmarks/api.py --mongo mongodb://localhost:27017 --nodes 2000 --readings 5000000
+In process, without mongod (requires mongomock, keep the fleet small):
+$ python benchmarks/api.py --mongo mongomock --nodes 100 --readings 50000
+
+Prints one JSON document per scenario, the first one describes the fleet, so runs can be compared
+line by line. The bench database is dropped at the end unless --keep.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+PREFIX = 'bench'
+PASSWORD = 'bench-password'
+BATCH = 10000
+SENSOR_LABELS = ['TEMP', 'HUMIDITY', 'SOIL', 'RADIANCE', 'RAIN', 'WIND', 'PH', 'LIGHT']
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summary(scenario, latencies, statuses):
+    return {
+        'scenario': scenario,
+        'requests': len(latencies),
+        'status': dict((str(code), statuses.count(code)) for code in set(statuses)),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def setup(args):
+    """
+    Load the project, then move the default mongoengine connection to the bench database.
+    Nothing has been queried yet, so no document class holds a collection of the old connection.
+    """
+    import django
+    import mongoengine
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cloud_platform.settings')
+    django.setup()
+
+    from django.test.utils import setup_test_environment
+
+    # allows the 'testserver' host of the test client
+    setup_test_environment()
+
+    mongoengine.disconnect()
+    if args.mongo == 'mongomock':
+        # mongomock is imported by mongoengine
+        mongoengine.connect(args.db, host='mongomock://localhost')
+    else:
+        mongoengine.connect(args.db, host=args.mongo)
+
+    from mongoengine.connection import get_db
+
+    db = get_db()
+    db.client.drop_database(args.db)
+    return db
+
+
+def sensors(rand, count):
+    from sensors.models import Sensors
+
+    return [Sensors(label=label) for label in rand.sample(SENSOR_LABELS, min(count, len(SENSOR_LABELS)))]
+
+
+def seed(args, rand):
+    """
+    Fleet of args.users owners, supernodes and nodes dealt round robin to them, every node
+    attached to a supernode of its owner. Returns {user id: fleet of that user}.
+    """
+    from authenticate.authentication import make_password
+    from nodes.models import Nodes, Coordinates as NodeCoordinates
+    from supernodes.models import Supernodes, Coordinates
+    from users.models import User
+
+    users = User.objects.insert([
+        User(username='%s%d' % (PREFIX, index), email='%s%d@example.com' % (PREFIX, index),
+             password=make_password(PASSWORD), first_name=PREFIX, last_name=str(index))
+        for index in range(args.users)
+    ])
+    fleets = dict((user.id, {'user': user, 'supernodes': [], 'nodes': []}) for user in users)
+
+    supernodes = []
+    for index in range(args.supernodes):
+        lat, lng = rand.uniform(-8.5, -6.5), rand.uniform(110.0, 114.0)
+        supernodes.append(Supernodes(
+            user=users[index % len(users)], label='%s_supernode_%d' % (PREFIX, index),
+            secretkey='%s-secret-%d' % (PREFIX, index), sensors=sensors(rand, args.sensors),
+            coordinates=Coordinates(lat=lat, long=lng), location=[lng, lat]
+        ))
+    supernodes = Supernodes.objects.insert(supernodes)
+    for supernode in supernodes:
+        fleets[supernode.user.id]['supernodes'].append(supernode)
+
+    nodes = []
+    for index in range(args.nodes):
+        supernode = supernodes[index % len(supernodes)]
+        lat, lng = rand.uniform(-8.5, -6.5), rand.uniform(110.0, 114.0)
+        nodes.append(Nodes(
+            user=supernode.user, supernode=supernode, label='%s_node_%d' % (PREFIX, index),
+            secretkey='%s-%d' % (PREFIX, index), is_public=int(rand.random() < args.public),
+            pubsperday=-1, sensors=sensors(rand, args.sensors),
+            coordinates=NodeCoordinates(lat=lat, long=lng), location=[lng, lat]
+        ))
+    for start in range(0, len(nodes), BATCH):
+        for node in Nodes.objects.insert(nodes[start:start + BATCH]):
+            fleets[node.user.id]['nodes'].append(node)
+    return fleets
+
+
+def seed_readings(args, rand, db, fleets):
+    """
+    args.readings sensordatas, raw inserts in batches, every sensor of the fleet gets its share
+    at random moments of the last args.days days.
+    """
+    streams = []
+    for fleet in fleets.values():
+        for supernode in fleet['supernodes']:
+            streams.extend((supernode.id, None, sensor.id) for sensor in supernode.sensors)
+        for node in fleet['nodes']:
+            streams.extend((node.supernode.id, node.id, sensor.id) for sensor in node.sensors)
+
+    now = datetime.now()
+    span = args.days * 86400
+    started = time.time()
+    written = 0
+    while written < args.readings:
+        documents = []
+        for index in range(min(BATCH, args.readings - written)):
+            supernode, node, sensor = rand.choice(streams)
+            documents.append({
+                'supernode': supernode, 'node': node, 'sensor': sensor,
+                'data': round(rand.uniform(0, 100), 2),
+                'timestamp': now - timedelta(seconds=rand.randint(0, span))
+            })
+        db.sensordatas.insert_many(documents, ordered=False)
+        written += len(documents)
+    return time.time() - started
+
+
+def measure(client, scenario, requests, repeat, warmup=5):
+    """
+    Run warmup + repeat requests, requests is a callable returning (method, path, kwargs).
+    """
+    latencies = []
+    statuses = []
+    for index in range(warmup + repeat):
+        method, path, kwargs = requests()
+        started = time.time()
+        response = getattr(client, method)(path, **kwargs)
+        elapsed = time.time() - started
+        if index >= warmup:
+            latencies.append(elapsed)
+            statuses.append(response.status_code)
+    return summary(scenario, latencies, statuses)
+
+
+def post_json(data, **kwargs):
+    kwargs.update({'data': json.dumps(data), 'content_type': 'application/json'})
+    return kwargs
+
+
+def token(client, path, data):
+    response = client.post(path, **post_json(data))
+    assert response.status_code == 200, response.content
+    return json.loads(response.content.decode('utf-8'))['token']
+
+
+def bench_auth(args, client, rand, fleet):
+    user = fleet['user']
+    yield measure(client, 'POST /user-auth/', lambda: (
+        'post', '/user-auth/', post_json({'username': user.username, 'password': PASSWORD})
+    ), args.repeat)
+
+    def node_auth():
+        supernode = rand.choice(fleet['supernodes'])
+        return 'post', '/node-auth/', post_json({
+            'user': user.username, 'label': supernode.label, 'secretkey': supernode.secretkey
+        })
+    yield measure(client, 'POST /node-auth/', node_auth, args.repeat)
+
+
+def bench_ingest(args, client, rand, fleet):
+    """
+    Supernode uploads of args.batch readings, split between its own sensors and its nodes.
+    """
+    supernode = fleet['supernodes'][0]
+    nodes = [node for node in fleet['nodes'] if node.supernode.id == supernode.id][:10]
+    jwt = token(client, '/node-auth/', {
+        'user': fleet['user'].username, 'label': supernode.label, 'secretkey': supernode.secretkey
+    })
+    header = {'HTTP_AUTHORIZATION': 'JWT %s' % jwt}
+    streams = [(None, sensor.label) for sensor in supernode.sensors]
+    streams += [(node, sensor.label) for node in nodes for sensor in node.sensors]
+
+    def upload():
+        payload = {'label': supernode.label, 'sensors': [], 'nodes': []}
+        values = {}
+        now = int(time.time())
+        for index in range(args.batch):
+            values.setdefault(rand.choice(streams), []).append([round(rand.uniform(0, 100), 2), now - index])
+        nodes_payload = {}
+        for (node, label), value in values.items():
+            if node is None:
+                payload['sensors'].append({'label': label, 'value': value})
+            else:
+                nodes_payload.setdefault(node.id, {
+                    'id': str(node.id), 'format': ['data', 'timestamp'], 'sensors': []
+                })['sensors'].append({'label': label, 'value': value})
+        payload['nodes'] = list(nodes_payload.values())
+        return 'post', '/sensordatas/', post_json(payload, **header)
+
+    result = measure(client, 'POST /sensordatas/', upload, args.repeat)
+    result['batch'] = args.batch
+    result['readings_per_second'] = round(args.batch * 1000 / result['mean_ms'], 1)
+    yield result
+
+
+def bench_reads(args, client, rand, fleet):
+    jwt = token(client, '/user-auth/', {'username': fleet['user'].username, 'password': PASSWORD})
+    header = {'HTTP_AUTHORIZATION': 'JWT %s' % jwt}
+    window = {
+        'start': (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M'),
+        'end': datetime.now().strftime('%Y-%m-%d %H:%M'),
+    }
+    supernodes = fleet['supernodes']
+    nodes = fleet['nodes']
+
+    def supernode():
+        return '/sensordatas/supernode/%s/' % rand.choice(supernodes).id
+
+    def supernode_sensor():
+        parent = rand.choice(supernodes)
+        return '/sensordatas/supernode/%s/sensor/%s/' % (parent.id, rand.choice(parent.sensors).id)
+
+    def node():
+        return '/sensordatas/node/%s/' % rand.choice(nodes).id
+
+    def node_sensor():
+        parent = rand.choice(nodes)
+        return '/sensordatas/node/%s/sensor/%s/' % (parent.id, rand.choice(parent.sensors).id)
+
+    def user():
+        return '/sensordatas/user/%s/' % fleet['user'].username
+
+    views = [
+        ('SensordatasFilterSupernode', supernode),
+        ('SensordatasFilterSupernodeSensor', supernode_sensor),
+        ('SensordatasFilterNode', node),
+        ('SensordatasFilterNodeSensor', node_sensor),
+        ('SensordatasFilterUser', user),
+    ]
+    for name, path in views:
+        yield measure(client, 'GET %s latest' % name, lambda path=path: (
+            'get', path(), dict(header)
+        ), args.repeat)
+        yield measure(client, 'GET %s last day' % name, lambda path=path: (
+            'get', path(), dict(header, data=window)
+        ), args.repeat)
+
+    from cloud_platform import settings
+    from nodes.models import Nodes
+
+    # one of the first 5 pages of the catalog, a small fleet may have less
+    public = Nodes.objects(user__ne=fleet['user'].id, is_public=1).count()
+    size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    pages = max(1, min(5, (public + size - 1) // size))
+    yield measure(client, 'GET NodesList', lambda: ('get', '/nodes/', dict(header)), args.repeat)
+    yield measure(client, 'GET NodesList role=global', lambda: (
+        'get', '/nodes/', dict(header, data={'role': 'global', 'page': rand.randint(1, pages)})
+    ), args.repeat)
+
+
+def run(args):
+    rand = random.Random(args.seed)
+    db = setup(args)
+    try:
+        started = time.time()
+        fleets = seed(args, rand)
+        fleet_seconds = time.time() - started
+        readings_seconds = seed_readings(args, rand, db, fleets)
+        print(json.dumps({
+            'mongo': 'mongomock' if args.mongo == 'mongomock' else 'mongod',
+            'users': args.users, 'supernodes': args.supernodes, 'nodes': args.nodes,
+            'sensors': args.sensors, 'readings': args.readings, 'days': args.days,
+            'seed_fleet_seconds': round(fleet_seconds, 3),
+            'seed_readings_seconds': round(readings_seconds, 3),
+        }))
+
+        from django.test import Client
+
+        client = Client()
+        # the most loaded owner, its fleet is queried by every scenario
+        fleet = max(fleets.values(), key=lambda item: len(item['nodes']))
+        for bench in (bench_auth, bench_reads, bench_ingest):
+            for result in bench(args, client, rand, fleet):
+                print(json.dumps(result))
+    finally:
+        if not args.keep:
+            db.client.drop_database(args.db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API hot paths on a seeded fleet.")
+    parser.add_argument('--mongo', default='mongodb://localhost:27017',
+                        help="mongod URI, or 'mongomock' to run in process")
+    parser.add_argument('--db', default='agrihub_bench', help="bench database, dropped before the run")
+    parser.add_argument('--keep', action='store_true', help="keep the bench database after the run")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--supernodes', type=int, default=50)
+    parser.add_argument('--nodes', type=int, default=1000)
+    parser.add_argument('--sensors', type=int, default=4, help="sensors of every node and supernode")
+    parser.add_argument('--readings', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=30, help="readings are spread over the last days")
+    parser.add_argument('--public', type=float, default=0.5, help="fraction of public nodes")
+    parser.add_argument('--repeat', type=int, default=200, help="measured requests per scenario")
+    parser.add_argument('--batch', type=int, default=100, help="readings of one POST /sensordatas/")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.db == 'agrihub':
+        parser.error("--db must not be the application database, it is dropped")
+    if args.users < 1 or args.supernodes < args.users or args.nodes < 1 or args.sensors < 1:
+        parser.error("needs a user, a supernode for every user, a node and a sensor")
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Round trip and bandwidth of the compact delta encoding (sensordatas/codec.py) against
+the plain /sensordatas/ format, on slowly changing simulated sensors.
+
+$ python benchmarks/codec.py --readings 1000 5000 --interval 60
+
+Prints one JSON document per batch size: body bytes plain and compact, raw and gzipped,
+encode and decode time, and whether decoding gave back the quantized readings.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sensordatas import codec  # noqa: E402
+
+# label: (start value, step deviation, precision)
+SENSORS = {
+    'TEMP': (25.0, 0.1, 1),
+    'HUMIDITY': (60.0, 0.5, 0),
+    'SOIL': (35.0, 0.05, 2),
+    'RADIANCE': (400.0, 15.0, 0),
+}
+
+
+def simulate(count, interval, seed=0):
+    rand = random.Random(seed)
+    values = dict((label, start) for label, (start, _, _) in SENSORS.items())
+    readings = []
+    timestamp = 1500000000
+    labels = sorted(SENSORS)
+    while len(readings) < count:
+        for label in labels:
+            values[label] += rand.gauss(0, SENSORS[label][1])
+            readings.append((label, round(values[label], SENSORS[label][2]), timestamp + rand.random()))
+        timestamp += interval
+    return readings[:count]
+
+
+def plain_body(readings):
+    sensors = {}
+    for label, data, timestamp in readings:
+        sensors.setdefault(label, []).append([data, timestamp])
+    return json.dumps({
+        'label': 'FILKOM_1',
+        'sensors': [{'label': label, 'value': value} for label, value in sensors.items()],
+        'nodes': [], 'testing': False
+    })
+
+
+def gzipped(body):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return len(compressor.compress(body.encode('utf-8')) + compressor.flush())
+
+
+def run(count, interval, repeat):
+    readings = simulate(count, interval)
+    precision = dict((label, digits) for label, (_, _, digits) in SENSORS.items())
+    plain = plain_body(readings)
+
+    started = time.time()
+    for _ in range(repeat):
+        compact = json.dumps(codec.encode('FILKOM_1', readings, precision))
+    encode_seconds = (time.time() - started) / repeat
+
+    started = time.time()
+    for _ in range(repeat):
+        decoded = codec.decode(json.loads(compact))
+    decode_seconds = (time.time() - started) / repeat
+
+    expected = {}
+    for label, data, timestamp in readings:
+        expected.setdefault(label, []).append([round(data, precision[label]), int(round(timestamp))])
+    got = dict((sensor['label'], sensor['value']) for sensor in decoded['sensors'])
+    round_trip = all(
+        len(got.get(label, [])) == len(pairs) and all(
+            abs(a[0] - b[0]) < 10 ** -(precision[label] + 3) and a[1] == b[1] for a, b in zip(got[label], pairs)
+        ) for label, pairs in expected.items()
+    )
+
+    return {
+        'readings': count,
+        'plain_bytes': len(plain),
+        'compact_bytes': len(compact),
+        'plain_gzip_bytes': gzipped(plain),
+        'compact_gzip_bytes': gzipped(compact),
+        'ratio': round(float(len(plain)) / len(compact), 2),
+        'gzip_ratio': round(float(gzipped(plain)) / gzipped(compact), 2),
+        'encode_ms': round(encode_seconds * 1000, 3),
+        'decode_ms': round(decode_seconds * 1000, 3),
+        'round_trip': round_trip
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare compact delta encoding with the plain upload format.")
+    parser.add_argument('--readings', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--interval', type=int, default=60, help="seconds between two captures")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    for count in args.readings:
+        print(json.dumps(run(count, args.interval, args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
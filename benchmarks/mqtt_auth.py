@@ -0,0 +1,154 @@
+"""
+Load test of a mosquitto auth backend (mqtt-broker/auth.py or mqtt-broker/auth_async.py)
+under a simulated reconnect storm.
+
+After a broker restart every node reconnects at once, and mosquitto-auth-plug asks the
+backend /auth for its credential then /acl for its topic. Devices retrying a slow
+CONNECT send the same credential again while the first check is still in flight.
+
+Requires Python 3.7+ and aiohttp. Seed bench nodes, start the service, then run:
+$ python3 benchmarks/mqtt_auth.py seed --nodes 5000
+$ python3 benchmarks/mqtt_auth.py run --url http://127.0.0.1:8100 --nodes 5000 --concurrency 500
+$ python3 benchmarks/mqtt_auth.py cleanup
+
+A service started before seeding picks bench nodes up on its next cache rebuild.
+Prints one JSON document per storm round.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+PREFIX = 'bench'
+
+
+def credential(index):
+    return '%s-%d' % (PREFIX, index), '%s-secret-%d' % (PREFIX, index)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def seed(args):
+    from pymongo import MongoClient
+
+    db = MongoClient(args.mongo)['agrihub']
+    owner = db.user.find_one_and_update(
+        {'username': PREFIX}, {'$setOnInsert': {'username': PREFIX, 'email': 'bench@example.com'}},
+        upsert=True, return_document=True
+    )
+    db.nodes.delete_many({'user': owner['_id']})
+    documents = []
+    for index in range(args.nodes):
+        label, secret = credential(index)
+        documents.append({'user': owner['_id'], 'label': label, 'secretkey': secret, 'sensors': []})
+    db.nodes.insert_many(documents)
+    print(json.dumps({'seeded': args.nodes}))
+
+
+def cleanup(args):
+    from pymongo import MongoClient
+
+    db = MongoClient(args.mongo)['agrihub']
+    owner = db.user.find_one({'username': PREFIX})
+    if owner is not None:
+        removed = db.nodes.delete_many({'user': owner['_id']}).deleted_count
+        db.user.delete_one({'_id': owner['_id']})
+        print(json.dumps({'removed': removed}))
+
+
+async def check(session, url, index, invalid, latencies, failures):
+    label, secret = credential(index)
+    if invalid:
+        secret += '-wrong'
+    started = time.time()
+    try:
+        async with session.post(url + '/auth', data={'username': label, 'password': secret}) as response:
+            allowed = response.status == 200
+        if allowed:
+            topic = '%s/%s' % (PREFIX, label)
+            async with session.post(url + '/acl', data={'username': label, 'topic': topic, 'acc': 2}) as response:
+                allowed = response.status == 200
+    except Exception:
+        failures.append(index)
+        return
+    latencies.append(time.time() - started)
+    if allowed == invalid:
+        failures.append(index)
+
+
+async def storm(args, round_index):
+    import aiohttp
+
+    rand = random.Random(round_index)
+    # every node reconnects, some of them twice (retry of a slow CONNECT)
+    devices = list(range(args.nodes))
+    devices += rand.sample(devices, int(args.nodes * args.duplicates))
+    rand.shuffle(devices)
+    invalid = set(rand.sample(range(len(devices)), int(len(devices) * args.invalid)))
+
+    latencies = []
+    failures = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def bounded(position, index):
+            async with semaphore:
+                await check(session, args.url, index, position in invalid, latencies, failures)
+
+        started = time.time()
+        await asyncio.gather(*[bounded(position, index) for position, index in enumerate(devices)])
+        elapsed = time.time() - started
+
+    return {
+        'round': round_index,
+        'checks': len(devices),
+        'concurrency': args.concurrency,
+        'seconds': round(elapsed, 3),
+        'checks_per_second': round(len(devices) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'failures': len(failures)
+    }
+
+
+def run(args):
+    for round_index in range(args.rounds):
+        print(json.dumps(asyncio.run(storm(args, round_index))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a mosquitto auth backend with a reconnect storm.")
+    parser.add_argument('--mongo', default='mongodb://localhost:27017')
+    commands = parser.add_subparsers(dest='command')
+
+    seed_parser = commands.add_parser('seed', help="insert bench user and nodes")
+    seed_parser.add_argument('--nodes', type=int, default=5000)
+
+    commands.add_parser('cleanup', help="remove bench user and nodes")
+
+    run_parser = commands.add_parser('run', help="run reconnect storm rounds against a running service")
+    run_parser.add_argument('--url', default='http://127.0.0.1:8100')
+    run_parser.add_argument('--nodes', type=int, default=5000)
+    run_parser.add_argument('--concurrency', type=int, default=500, help="checks in flight at once")
+    run_parser.add_argument('--rounds', type=int, default=3, help="first round is cold, next ones hit the cache")
+    run_parser.add_argument('--duplicates', type=float, default=0.2, help="fraction of nodes connecting twice")
+    run_parser.add_argument('--invalid', type=float, default=0.05, help="fraction of checks with a wrong secret")
+
+    args = parser.parse_args()
+    if args.command == 'seed':
+        seed(args)
+    elif args.command == 'cleanup':
+        cleanup(args)
+    elif args.command == 'run':
+        run(args)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
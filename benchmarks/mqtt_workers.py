@@ -0,0 +1,150 @@
+"""
+Load test of MQTT ingestion workers (mqtt-broker/subs.py) against a stand-in broker.
+
+The stand-in broker is this process: it generates publishes for a fleet of topics and
+routes every message to the worker owning its topic, as a shared subscription or the
+topic-hash partition would. Workers run the real IngestionWorker.handle path with a
+preloaded node registry; their writer simulates Mongo latency instead of writing.
+
+$ python benchmarks/mqtt_workers.py --workers 1 2 4 --messages 100000
+
+Prints one JSON document per run.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mqtt-broker'))
+
+from bson.objectid import ObjectId  # noqa: E402
+from partition import topic_partition  # noqa: E402
+from registry import NodeEntry, NodeRegistry  # noqa: E402
+from sensordatas.ingestion import IngestionResult  # noqa: E402
+from subs import IngestionWorker  # noqa: E402
+from writer import BatchWriter  # noqa: E402
+
+SENSORS = ('TEMP', 'HUMIDITY', 'RADIANCE', 'SOIL')
+CHUNK = 200
+
+
+class SimulatedWriter(BatchWriter):
+    def __init__(self, flush_latency, row_latency, **kwargs):
+        BatchWriter.__init__(self, stats_interval=0, **kwargs)
+        self.flush_latency = flush_latency
+        self.row_latency = row_latency
+
+    def write(self, publishes):
+        written = sum(len(readings) for readings in publishes)
+        time.sleep(self.flush_latency + self.row_latency * written)
+        return IngestionResult(written, 0, 0)
+
+
+def fleet_topics(nodes):
+    return ['user%d/NODE_%d' % (index % 50, index) for index in range(nodes)]
+
+
+def worker_main(index, count, topics, inbox, outbox, options):
+    registry = NodeRegistry(ttl=float('inf'))
+    for topic in topics:
+        registry.entries[topic] = NodeEntry(
+            id=ObjectId(), label=topic.split('/')[1], supernode=ObjectId(),
+            sensors=dict((label, ObjectId()) for label in SENSORS), expires=float('inf')
+        )
+    writer = SimulatedWriter(options['flush_latency'], options['row_latency'],
+                             batch_size=options['batch_size'], flush_interval=options['flush_interval'])
+    # broker already routed the message, as a shared subscription does
+    worker = IngestionWorker(index, count, 'shared', registry=registry, writer=writer)
+    writer.start()
+    outbox.put(('ready', index, 0))
+    handled = 0
+    while True:
+        chunk = inbox.get()
+        if chunk is None:
+            break
+        for topic, payload in chunk:
+            worker.handle(topic, payload)
+        handled += len(chunk)
+    writer.close()
+    outbox.put(('done', handled, time.time()))
+
+
+def run(count, messages, topics, options):
+    inboxes = [multiprocessing.Queue() for _ in range(count)]
+    outbox = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker_main, args=(index, count, topics, inboxes[index], outbox, options))
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+
+    # pre-route every publish so the stand-in broker only forwards chunks while measuring
+    routed = [[] for _ in range(count)]
+    rand = random.Random(count)
+    for _ in range(messages):
+        topic = rand.choice(topics)
+        payload = json.dumps({
+            'node': topic.split('/')[1],
+            'sensor': [{'label': label, 'data': str(rand.randint(10, 30))} for label in SENSORS]
+        })
+        routed[topic_partition(topic, count)].append((topic, payload))
+
+    for _ in range(count):
+        outbox.get()
+    started = time.time()
+    for index, inbox in enumerate(inboxes):
+        for offset in range(0, len(routed[index]), CHUNK):
+            inbox.put(routed[index][offset:offset + CHUNK])
+        inbox.put(None)
+
+    handled = 0
+    finished = started
+    for _ in range(count):
+        _, worker_handled, worker_finished = outbox.get()
+        handled += worker_handled
+        finished = max(finished, worker_finished)
+    for process in processes:
+        process.join()
+
+    elapsed = finished - started
+    return {
+        'workers': count,
+        'messages': handled,
+        'seconds': round(elapsed, 3),
+        'messages_per_second': round(handled / elapsed, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test MQTT ingestion workers against a stand-in broker.")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--nodes', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--flush-interval', type=float, default=0.2)
+    parser.add_argument('--flush-latency', type=float, default=0.005, help="simulated seconds per bulk write")
+    parser.add_argument('--row-latency', type=float, default=0.00002, help="simulated seconds per written row")
+    args = parser.parse_args()
+
+    options = {
+        'batch_size': args.batch_size,
+        'flush_interval': args.flush_interval,
+        'flush_latency': args.flush_latency,
+        'row_latency': args.row_latency
+    }
+    topics = fleet_topics(args.nodes)
+    baseline = None
+    for count in args.workers:
+        result = run(count, args.messages, topics, options)
+        baseline = baseline or result['messages_per_second'] / count
+        result['scaling_efficiency'] = round(result['messages_per_second'] / baseline / count, 2)
+        result['cpu_count'] = multiprocessing.cpu_count()
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
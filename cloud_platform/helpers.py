@@ -1,5 +1,6 @@
 from bson import ObjectId
 from bson.errors import InvalidId
+import math
 import re
 
 
@@ -15,3 +16,149 @@ def is_url_regex_match(regex, url_path):
     if re.match(regex, url_path):
         return True
     return False
+
+
+def group_by(document, field, ids, accumulators=None, match=None):
+    """
+    One $group aggregation over documents whose `field` is in ids and matching `match`.
+    Return {id: group}, group holds 'count' and the given accumulators,
+    e.g. {'last_seen': {'$max': '$timestamp'}}.
+    """
+    group = {'_id': '$' + field, 'count': {'$sum': 1}}
+    group.update(accumulators or {})
+    condition = {field: {'$in': list(ids)}}
+    condition.update(match or {})
+    pipeline = [{'$match': condition}, {'$group': group}]
+    return dict((row.pop('_id'), row) for row in document._get_collection().aggregate(pipeline))
+
+
+def prefetch_references(objects, field, document, fields=None):
+    """
+    Load reference `field` of every object with one query and attach it, so serializing
+    a page (e.g. SlugRelatedField) does not dereference one document per object.
+    """
+    ids = set()
+    for obj in objects:
+        value = obj._data.get(field)
+        if value is not None and not isinstance(value, document):
+            ids.add(getattr(value, 'id', value))
+    if not ids:
+        return objects
+    queryset = document.objects(id__in=list(ids))
+    if fields:
+        queryset = queryset.only(*fields)
+    loaded = dict((doc.id, doc) for doc in queryset)
+    for obj in objects:
+        value = obj._data.get(field)
+        if value is not None and not isinstance(value, document):
+            obj._data[field] = loaded.get(getattr(value, 'id', value), value)
+    return objects
+
+
+# mean earth radius in meters, $centerSphere takes its radius in radians
+EARTH_RADIUS = 6378100.0
+# widest longitude span of one bbox polygon, wider boxes are split
+BBOX_MAX_SPAN = 90.0
+# degrees between two vertices of a bbox parallel, a geodesic edge strays from the parallel
+BBOX_EDGE_STEP = 1.0
+# poles are single points, box edges on them would be degenerate
+BBOX_MAX_LAT = 89.9999
+
+
+def parse_point(value):
+    """
+    'lat,long' to GeoJSON [long, lat], raise ValueError when it is not a valid position.
+    """
+    lat, long = [float(part) for part in value.split(',')]
+    if not -90 <= lat <= 90 or not -180 <= long <= 180:
+        raise ValueError
+    return [long, lat]
+
+
+def parse_bbox(value):
+    """
+    'south,west,north,east' to (south, west, north, east), raise ValueError when it is not valid.
+    """
+    south, west, north, east = [float(part) for part in value.split(',')]
+    if not -90 <= south < north <= 90 or not -180 <= west < east <= 180:
+        raise ValueError
+    return south, west, north, east
+
+
+def bbox_geometry(bbox):
+    """
+    GeoJSON geometry of a bbox, with counterclockwise rings. Polygon edges are geodesics, so the
+    parallels are drawn with a vertex every BBOX_EDGE_STEP degrees, and a box wider than
+    BBOX_MAX_SPAN is split into a MultiPolygon (one polygon must stay within a hemisphere).
+    """
+    south, west, north, east = bbox
+    south, north = max(south, -BBOX_MAX_LAT), min(north, BBOX_MAX_LAT)
+    if south >= north:
+        raise ValueError
+    strips = int(math.ceil((east - west) / BBOX_MAX_SPAN))
+    polygons = []
+    for strip in range(strips):
+        left = west + (east - west) * strip / strips
+        right = west + (east - west) * (strip + 1) / strips
+        steps = int(math.ceil((right - left) / BBOX_EDGE_STEP))
+        edge = [left + (right - left) * step / steps for step in range(steps + 1)]
+        ring = [[long, south] for long in edge] + [[long, north] for long in reversed(edge)]
+        ring.append(ring[0])
+        polygons.append([ring])
+    if 1 == len(polygons):
+        return {'type': 'Polygon', 'coordinates': polygons[0]}
+    return {'type': 'MultiPolygon', 'coordinates': polygons}
+
+
+def grid_cell(long, lat, bbox, grid):
+    """
+    (x, y) cell of a point in a grid x grid split of bbox. Points on the north or east edge,
+    or just outside the box (admitted by floating point rounding), belong to the nearest cell.
+    """
+    south, west, north, east = bbox
+    x = int((long - west) // ((east - west) / grid))
+    y = int((lat - south) // ((north - south) / grid))
+    return max(0, min(grid - 1, x)), max(0, min(grid - 1, y))
+
+
+def parse_polygon(value):
+    """
+    'lat,long;lat,long;...' to a closed GeoJSON ring.
+    """
+    ring = [parse_point(point) for point in value.split(';') if point]
+    if ring and ring[0] != ring[-1]:
+        ring.append(ring[0])
+    if len(ring) < 4:
+        raise ValueError
+    return ring
+
+
+def geo_lookup(params, field='location'):
+    """
+    mongoengine lookup of the spatial filter in query params, served by the 2dsphere index:
+    ?near=lat,long&distance=<meters>, ?polygon=lat,long;lat,long;... or ?bbox=south,west,north,east.
+    $geoWithin is used rather than $near, so paginated listings can still count.
+    Raise ValueError on malformed params.
+    """
+    given = [name for name in ('near', 'polygon', 'bbox') if params.get(name)]
+    if not given:
+        return {}
+    if len(given) > 1:
+        raise ValueError("Use only one of near, polygon or bbox.")
+    name = given[0]
+    try:
+        if 'near' == name:
+            distance = float(params.get('distance', 1000))
+            if distance <= 0:
+                raise ValueError
+            return {field + '__geo_within_sphere': [parse_point(params.get('near')), distance / EARTH_RADIUS]}
+        # GeoJSON $geometry, legacy $polygon and $box can not use a 2dsphere index
+        if 'polygon' == name:
+            return {field + '__geo_within': {'type': 'Polygon', 'coordinates': [parse_polygon(params.get('polygon'))]}}
+        return {field + '__geo_within': bbox_geometry(parse_bbox(params.get('bbox')))}
+    except (TypeError, ValueError):
+        raise ValueError({
+            'near': "near must be lat,long and distance a positive number of meters.",
+            'polygon': "polygon must be at least 3 lat,long points separated by ;.",
+            'bbox': "bbox must be south,west,north,east."
+        }[name])
@@ -0,0 +1,31 @@
+import zlib
+
+from django.http import HttpResponse
+
+from cloud_platform import settings
+
+
+class GzipRequestMiddleware(object):
+    """
+    Decompress request body sent with `Content-Encoding: gzip`, so views and parsers
+    (and signed request authentication) see the plain body.
+    Decompressed size is capped by GZIP_REQUEST_MAX_SIZE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if 'gzip' == request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower():
+            max_size = getattr(settings, 'GZIP_REQUEST_MAX_SIZE', 10 * 1024 * 1024)
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            try:
+                body = decompressor.decompress(request.body, max_size)
+            except zlib.error:
+                return HttpResponse('Invalid gzip request body.', status=400, content_type='text/plain')
+            if decompressor.unconsumed_tail:
+                return HttpResponse('Request body is too large.', status=413, content_type='text/plain')
+            request._body = body
+            request.META['CONTENT_LENGTH'] = str(len(body))
+            del request.META['HTTP_CONTENT_ENCODING']
+        return self.get_response(request)
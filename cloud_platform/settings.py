@@ -13,6 +13,7 @@ import datetime
 
 import mongoengine
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -44,7 +45,8 @@ INSTALLED_APPS = [
     'supernodes',
     'nodes',
     'sensors',
-    'sensordatas'
+    'sensordatas',
+    'jobs'
 ]
 
 MIDDLEWARE = [
@@ -52,6 +54,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'cloud_platform.middleware.GzipRequestMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -173,5 +176,71 @@ JWT_AUTH = {
     'JWT_AUTH_HEADER_PREFIX': 'JWT',
 }
 
+# shared by every process of this host (HMAC replay cache, public node catalog),
+# use a memcached backend when the webservice runs on several hosts
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'cloud_platform_cache'),
+    }
+}
+
+# authenticated principal (JWT subject) cache, see authenticate/cache.py
+# BACKEND is an alias of CACHES, it must be shared when running several processes,
+# 'local' (in-process LRU) or a local memory cache is refused unless DEBUG
+AUTH_PRINCIPAL_CACHE = {
+    'BACKEND': 'default',
+    'TIMEOUT': 300,
+    'MAX_ENTRIES': 10000,
+}
+
+# signed request authentication of supernodes, see authenticate.authentication.SignatureAuthentication
+HMAC_AUTH = {
+    'HEADER_PREFIX': 'AGRIHUB-HMAC',
+    'REPLAY_WINDOW': 300,
+    # alias of CACHES remembering used signatures, it must be shared when running several processes
+    'REPLAY_CACHE': 'default',
+}
+
 # allow all access to cross domain origin -> very risk
 CORS_ORIGIN_ALLOW_ALL = True
+
+# sensordatas change feed (/sensordatas/<scope>/<id>/changes/)
+SENSORDATAS_CHANGES_LIMIT = 500
+SENSORDATAS_CHANGES_MAX_LIMIT = 5000
+# ObjectIds generated by different app processes may interleave within a short moment,
+# hold back the newest rows so that a poll never skips a row inserted just after it.
+SENSORDATAS_CHANGES_SETTLE = datetime.timedelta(seconds=2)
+
+# sensordatas heatmap (/sensordatas/heatmap/), default time window
+SENSORDATAS_HEATMAP_WINDOW = datetime.timedelta(hours=1)
+# device clocks may run ahead of the server, readings stamped in the window can be inserted
+# before it starts by up to this much
+SENSORDATAS_HEATMAP_CLOCK_SKEW = datetime.timedelta(hours=1)
+
+# largest accepted body once a gzip request (Content-Encoding: gzip) is decompressed
+GZIP_REQUEST_MAX_SIZE = 10 * 1024 * 1024
+
+# most nodes created by one bulk provisioning call (/nodes/bulk/)
+NODES_BULK_MAX = 500
+
+# public node catalog (/nodes/?role=global), see nodes/catalog.py
+# CACHE is an alias of CACHES, it must be shared when running several processes,
+# a local memory cache is refused unless DEBUG
+NODES_CATALOG = {
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+    'MAX_ENTRIES': 50000,
+}
+
+# deletion jobs (manage.py deletionworker), sensordatas are removed in chunks of _id order
+DELETION_JOB_CHUNK_SIZE = 1000
+DELETION_JOB_CHUNK_INTERVAL = 0.2
+# seconds an idle worker waits before looking for new jobs
+DELETION_JOB_POLL_INTERVAL = 5
+# a running job not updated for this long is taken over by another worker
+DELETION_JOB_LEASE = datetime.timedelta(minutes=5)
+
+# clustered node map (/nodes/clusters/), cells per side of the viewport grid
+NODES_CLUSTER_GRID = 16
+NODES_CLUSTER_MAX_GRID = 64
@@ -17,7 +17,7 @@ from django.conf.urls import url, include
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
-from authenticate.views import NodeTokenCreator, UserTokenCreator
+from authenticate.views import NodeTokenCreator, UserTokenCreator, PrincipalCacheStats
 from users.views import ResearcherRegistration
 
 
@@ -31,8 +31,11 @@ urlpatterns = [
     url(r'^users/', include('users.urls')),
     url(r'^supernodes/', include('supernodes.urls')),
     url(r'^nodes/', include('nodes.urls')),
+    url(r'^sensors/', include('sensors.urls')),
     url(r'^sensordatas/', include('sensordatas.urls')),
+    url(r'^jobs/', include('jobs.urls')),
     url(r'^user-auth/', UserTokenCreator.as_view()),
     url(r'^node-auth/$', NodeTokenCreator.as_view()),
+    url(r'^auth-cache/$', PrincipalCacheStats.as_view()),
     url(r'^register/$', ResearcherRegistration.as_view())
 ]
@@ -4,7 +4,7 @@ import json, hashlib
 from random import randint
 
 # Inisiasi mqtt client
-mqttc = mqtt.Client("ASDAAA", clean_session=False)
+mqttc = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "ASDAAA", clean_session=False)
 mqttc.username_pw_set(username="FILKOM_1", password="rahasia")
 
 # Registrasi callback
@@ -22,7 +22,7 @@ dict_data = {
 }
 
 data = json.dumps(dict_data)
-print data
+print(data)
 
 # Publish message dengan topik tertentu
 mqttc.publish("basukicahya/FILKOM_1", payload=data, qos=1, retain=False)
@@ -3,6 +3,7 @@
 
 import sys
 from utils.http import AgriHubAPI
+from utils.scheduler import Scheduler
 
 
 class AgriHubNode:
@@ -21,7 +22,14 @@ class AgriHubNode:
 
     def action_start(self):
         self.agri_hub.auth()
-        # TODO loop forever! Call .subscribe() based on schedule
+        # readings left in outbox by a previous run go first, in batches
+        self.agri_hub.upload()
+        Scheduler(self.publish).run()
+
+    def publish(self, slots):
+        # slots missed while the device was suspended are sent with this single upload
+        if 1 < slots:
+            print("%d publish slots coalesced" % slots)
         self.agri_hub.subscribe()
 
     def run(self):
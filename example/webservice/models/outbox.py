@@ -0,0 +1,58 @@
+from utils.db import Db
+
+
+class Outbox(Db):
+    """
+    Readings waiting for upload, oldest first. Rows are only deleted from the front
+    (uploaded or evicted), so ids of stored rows are one contiguous range.
+    """
+
+    def __init__(self, max_rows=100000):
+        Db.__init__(self)
+        self.table = "outbox"
+        self.max_rows = max_rows
+        self.connect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
+
+    def append(self, readings):
+        """
+        Store readings, a list of (sensor label, data, unix timestamp), in one transaction.
+        When the outbox is full the oldest rows are evicted.
+        """
+        self.cursor.executemany(
+            "INSERT INTO `%s` (`sensor`, `data`, `timestamp`) "
+            "VALUES(?, ?, ?)" % self.table,
+            readings
+        )
+        self.cursor.execute(
+            "DELETE FROM `%s` WHERE id <= (SELECT MAX(id) FROM `%s`) - :max_rows" % (self.table, self.table),
+            {"max_rows": self.max_rows}
+        )
+        self.conn.commit()
+        return self.cursor.rowcount
+
+    def peek(self, limit):
+        self.cursor.execute(
+            "SELECT `id`, `sensor`, `data`, `timestamp` FROM `%s` ORDER BY id LIMIT :limit" % self.table,
+            {"limit": limit}
+        )
+        return self.cursor.fetchall()
+
+    def remove(self, last_id):
+        """
+        Delete rows up to last_id, once they are uploaded.
+        """
+        self.cursor.execute(
+            "DELETE FROM `%s` WHERE id <= :id" % self.table,
+            {"id": last_id}
+        )
+        self.conn.commit()
+
+    def count(self):
+        self.cursor.execute("SELECT COUNT(*) FROM `%s`" % self.table)
+        return self.cursor.fetchone()[0]
@@ -0,0 +1,48 @@
+"""
+Compact delta encoding of readings (encoding "delta-v1"), decoded by the cloud platform
+into the plain /sensordatas/ format.
+
+Sensors are referenced by index into a label table, every sensor has one stream of
+timestamp deltas (from t0, integer seconds) and value deltas (integers scaled by
+10 ** precision of the sensor).
+"""
+
+ENCODING = 'delta-v1'
+
+
+def encode(label, rows, precision=None, default_precision=2):
+    """
+    rows: outbox rows (id, sensor label, data, unix timestamp), precision: {sensor label: digits}.
+    """
+    precision = precision or {}
+    labels = []
+    streams = {}
+    for _, sensor, data, timestamp in rows:
+        if sensor not in streams:
+            streams[sensor] = []
+            labels.append(sensor)
+        streams[sensor].append((int(round(timestamp)), data))
+
+    t0 = min(timestamp for stream in streams.values() for timestamp, _ in stream) if streams else 0
+    encoded = []
+    digits = []
+    for index, sensor in enumerate(labels):
+        digits.append(precision.get(sensor, default_precision))
+        scale = 10 ** digits[-1]
+        times, values = [], []
+        last_time, last_value = t0, 0
+        for timestamp, data in streams[sensor]:
+            value = int(round(data * scale))
+            times.append(timestamp - last_time)
+            values.append(value - last_value)
+            last_time, last_value = timestamp, value
+        encoded.append([index, times, values])
+
+    return {
+        'encoding': ENCODING,
+        'label': label,
+        't0': t0,
+        'sensors': labels,
+        'precision': digits,
+        'streams': encoded
+    }
@@ -14,8 +14,13 @@ class Db:
             is_new = True
         self.conn = sqlite3.connect(r"storage.db")
         self.cursor = self.conn.cursor()
+        # readers do not block the writer, appends stay cheap while the outbox is uploaded
+        self.cursor.execute("PRAGMA journal_mode=WAL")
+        self.cursor.execute("PRAGMA synchronous=NORMAL")
         if is_new:
-            self.migrate()
+            print('generate initial tables')
+        # tables are created if not exists, so older storage.db get the new ones
+        self.migrate()
 
     def disconnect(self):
         self.cursor.close()
@@ -23,7 +28,6 @@ class Db:
 
     # generate new tables
     def migrate(self):
-        print('generate initial tables')
         sql_query_credentials = "CREATE TABLE IF NOT EXISTS `credentials` (" \
                                 "`token`	TEXT," \
                                 "`subsperdayremain`	INTEGER DEFAULT 0" \
@@ -31,6 +35,12 @@ class Db:
         sql_query_subs_scedule = "CREATE TABLE IF NOT EXISTS `subs_schedule` (" \
                                  "`id`	INTEGER PRIMARY KEY AUTOINCREMENT," \
                                  "`time`	TEXT)"
+        sql_query_outbox = "CREATE TABLE IF NOT EXISTS `outbox` (" \
+                           "`id`	INTEGER PRIMARY KEY AUTOINCREMENT," \
+                           "`sensor`	TEXT," \
+                           "`data`	REAL," \
+                           "`timestamp`	REAL)"
         self.cursor.execute(sql_query_credentials)
         self.cursor.execute(sql_query_subs_scedule)
+        self.cursor.execute(sql_query_outbox)
         self.conn.commit()
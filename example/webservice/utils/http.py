@@ -1,8 +1,18 @@
+import base64
 import json
-import httplib
 import random
+import socket
+import time
+import zlib
+
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
 
 from models.credentials import Credentials
+from models.outbox import Outbox
+from utils import codec
 
 
 class AgriHubAPI:
@@ -11,60 +21,183 @@ class AgriHubAPI:
             self.settings = json.load(json_settings)
         self.headers = {'Content-Type': 'application/json'}
         self.credential_model = Credentials()
+        outbox = self.settings.get('outbox', {})
+        self.outbox = Outbox(outbox.get('max_rows', 100000))
+        self.batch_size = outbox.get('batch_size', 1000)
+        # gzip request body, turned off when the server does not understand it
+        self.gzip = self.settings.get('gzip', True)
+        connection = self.settings.get('connection', {})
+        self.retries = connection.get('retries', 3)
+        self.backoff = connection.get('backoff', 0.5)
+        self.max_backoff = connection.get('max_backoff', 30)
+        self.timeout = connection.get('timeout', 30)
+        # seconds before token exp when it is renewed
+        self.refresh_margin = connection.get('token_refresh_margin', 300)
+        self.conn = None
 
     def createconnection(self):
-        return httplib.HTTPConnection(self.settings.get('api_url'))
+        return httplib.HTTPConnection(self.settings.get('api_url'), timeout=self.timeout)
+
+    def connection(self):
+        """
+        Persistent keep-alive connection, every request reuses it until it fails.
+        """
+        if self.conn is None:
+            self.conn = self.createconnection()
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
 
     def auth(self):
-        conn = self.createconnection()
+        """
+        Renew the stored token, return False when the API could not be reached or failed.
+        Only rejected credentials (400) stop the client, retrying would not help.
+        """
         data = json.dumps({
             "user": self.settings.get('user'),
             "label": self.settings.get('node')['label'],
             "secretkey": self.settings.get('node')['secretkey']
         })
-        conn.request('POST', '/node-auth/', data, self.headers)
-        res = conn.getresponse()
-        if 200 == res.status:
-            print 'AUTH: ok'
-            res_data = json.loads(res.read())
-            conn.close()
-            self.credential_model.set(res_data.get('token'), res_data.get('node')['subsperdayremain'])
-        else:  # 400
-            conn.close()
+        status, body = self.request('POST', '/node-auth/', data, self.headers)
+        if 200 == status:
+            print('AUTH: ok')
+            res_data = json.loads(body)
+            # supernode has no publish limit
+            self.credential_model.set(res_data.get('token'), -1)
+            return True
+        if 400 == status:
             # TODO simpan error di log
             exit('AUTH: failure')
+        print("AUTH: status %s, retry later" % status)
+        return False
 
-    def subscribe(self, testing=False):
+    @staticmethod
+    def token_exp(token):
+        """
+        exp claim of JWT, read without verifying (the server does), None when unreadable.
+        """
+        try:
+            payload = token.split('.')[1]
+            payload += '=' * (-len(payload) % 4)
+            return json.loads(base64.urlsafe_b64decode(payload.encode('ascii')).decode('utf-8')).get('exp')
+        except (AttributeError, IndexError, TypeError, ValueError):
+            return None
+
+    def token(self):
+        """
+        Stored token, renewed first when missing or expiring within refresh_margin.
+        When renewal fails the old token is used while it is valid, otherwise None.
+        """
         credential = self.credential_model.get()
-        # if node has no remaining subs, then ignore it
-        if 0 == credential[1]:
-            return
-        conn = self.createconnection()
-        sensors = self.settings.get('node')['sensors']
-        data_raw = {
-            "user": self.settings.get('user'),
-            "node": self.settings.get('node')['label'],
-            "sensor": [],
-            "testing": testing
-        }
+        exp = self.token_exp(credential[0]) if credential else None
+        if exp is None or exp - time.time() < self.refresh_margin:
+            if self.auth():
+                return self.credential_model.get()[0]
+            if exp is None or exp <= time.time():
+                return None
+        return credential[0]
 
-        for sensor in sensors:
+    def capture(self):
+        """
+        Read every sensor once and append readings to the outbox.
+        """
+        timestamp = time.time()
+        readings = []
+        for sensor in self.settings.get('node')['sensors']:
             # TODO data should captured with sensor module
-            data_raw.get('sensor').append({
-                "label": sensor,
-                "data": random.randint(100, 999)
-            })
-
-        self.headers.update({'Authorization': "JWT %s" % (credential[0])})
-        conn.request('POST', '/subscriptions/', json.dumps(data_raw), self.headers)
-        res = conn.getresponse()
-
-        # sent new auth() when token is expired
-        if 401 == res.status:
-            print "Subs status: 401"
-            print res.read()
-            print "Renew token..."
-            self.auth()
-            self.subscribe()
+            readings.append((sensor, random.randint(100, 999), timestamp))
+        self.outbox.append(readings)
+
+    def subscribe(self, testing=False):
+        self.capture()
+        return self.upload(testing)
+
+    def upload(self, testing=False):
+        """
+        Upload outbox in batches of batch_size readings, oldest first, one after another on
+        the persistent connection. Stops at the first network or server failure,
+        rows stay in the outbox for next time. Return number of uploaded readings.
+        """
+        uploaded = 0
+        while True:
+            rows = self.outbox.peek(self.batch_size)
+            if not rows:
+                return uploaded
+            status = self.post_batch(rows, testing)
+            if 401 == status:
+                # token revoked or clock skew, exp is normally handled by token()
+                print("Subs status: 401, renew token...")
+                status = self.post_batch(rows, testing) if self.auth() else None
+            if 201 == status:
+                uploaded += len(rows)
+            elif 400 == status:
+                # rejected by validation, e.g. unknown sensor label, retrying would not help
+                print("Subs status: 400, batch dropped")
+            else:
+                print("Subs status: %s, %d readings kept in outbox" % (status, self.outbox.count()))
+                return uploaded
+            self.outbox.remove(rows[-1][0])
+
+    def post_batch(self, rows, testing=False):
+        """
+        POST readings in the supernode format (or its compact encoding), return response status
+        or None on network failure or without a valid token.
+        """
+        token = self.token()
+        if token is None:
+            return None
+
+        label = self.settings.get('node')['label']
+        if codec.ENCODING == self.settings.get('encoding'):
+            payload = codec.encode(label, rows, self.settings.get('precision'))
         else:
-            print "Subs status: 200 (ok)"
+            sensors = {}
+            for _, sensor, data, timestamp in rows:
+                sensors.setdefault(sensor, []).append([data, timestamp])
+            payload = {
+                "label": label,
+                "sensors": [{"label": sensor, "value": value} for sensor, value in sensors.items()]
+            }
+        payload.update({"nodes": [], "testing": testing})
+        body = json.dumps(payload)
+
+        headers = dict(self.headers)
+        headers['Authorization'] = "JWT %s" % token
+        status, _ = self.request('POST', '/sensordatas/', body, headers, self.gzip)
+        if 400 == status and self.gzip:
+            # server without gzip request support fails to parse the body
+            status, _ = self.request('POST', '/sensordatas/', body, headers, False)
+            if 400 != status:
+                self.gzip = False
+        return status
+
+    def request(self, method, url, body, headers, gzip=False):
+        """
+        Send request on the persistent connection, return (status, body).
+        A broken connection is reopened with exponential backoff, (None, None) after retries.
+        """
+        if gzip:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = compressor.compress(body.encode('utf-8')) + compressor.flush()
+            headers = dict(headers, **{'Content-Encoding': 'gzip'})
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+            try:
+                conn = self.connection()
+                conn.request(method, url, body, headers)
+                res = conn.getresponse()
+                # response must be read whole before the connection is reused
+                data = res.read()
+                if res.will_close:
+                    self.close()
+                return res.status, data
+            except (socket.error, httplib.HTTPException) as e:
+                print("Connection failure: %s" % e)
+                self.close()
+        return None, None
@@ -0,0 +1,97 @@
+import datetime
+import heapq
+import time
+
+from models.subs_schedule import SubsScedule
+
+
+class Scheduler:
+    """
+    Call job at every publish time of subs_schedule, every day.
+
+    Next due time of every slot is kept in a min-heap, the loop sleeps until the earliest one.
+    The schedule is loaded once and again only when the rows of subs_schedule changed, checked
+    at least every max_sleep seconds. Slots kept by a reload keep their due time.
+    Slots that are already past when the loop wakes up (device suspended, long job) are
+    coalesced: job(slots) runs once with the number of slots due.
+    """
+
+    def __init__(self, job, max_sleep=60, clock=datetime.datetime.now, sleep=time.sleep):
+        self.job = job
+        self.max_sleep = max_sleep
+        self.clock = clock
+        self.sleep = sleep
+        self.schedule = SubsScedule()
+        self.rows = None
+        self.heap = []
+
+    def changed(self):
+        """
+        Return the rows of subs_schedule when they differ from the loaded ones, otherwise None.
+        Other tables (outbox, credentials) are written all the time and do not count.
+        """
+        rows = self.schedule.getall()
+        if rows == self.rows:
+            return None
+        self.rows = rows
+        return rows
+
+    @staticmethod
+    def parse(value):
+        for time_format in ('%H:%M:%S', '%H:%M'):
+            try:
+                return datetime.datetime.strptime(value, time_format).time()
+            except (TypeError, ValueError):
+                continue
+        return None
+
+    @staticmethod
+    def next_due(slot, now):
+        due = datetime.datetime.combine(now.date(), slot)
+        return due if due > now else due + datetime.timedelta(days=1)
+
+    def reload(self, rows, now):
+        """
+        Build the heap from rows, a slot already in the heap keeps its due time,
+        so a slot that passed during a long job is still run, coalesced, on next step.
+        """
+        dues = {}
+        for due, slot in self.heap:
+            dues.setdefault(slot, []).append(due)
+        self.heap = []
+        for row in rows:
+            slot = self.parse(row[1])
+            if slot is None:
+                print("invalid schedule time: %s" % row[1])
+                continue
+            due = dues[slot].pop() if dues.get(slot) else self.next_due(slot, now)
+            heapq.heappush(self.heap, (due, slot))
+
+    def step(self):
+        """
+        Sleep until next due time or run job of due slots, return number of slots run.
+        """
+        now = self.clock()
+        rows = self.changed()
+        if rows is not None:
+            self.reload(rows, now)
+        if not self.heap:
+            self.sleep(self.max_sleep)
+            return 0
+
+        due = self.heap[0][0]
+        if due > now:
+            self.sleep(min((due - now).total_seconds(), self.max_sleep))
+            return 0
+
+        slots = 0
+        while self.heap and self.heap[0][0] <= now:
+            _, slot = heapq.heappop(self.heap)
+            heapq.heappush(self.heap, (self.next_due(slot, now), slot))
+            slots += 1
+        self.job(slots)
+        return slots
+
+    def run(self):
+        while True:
+            self.step()
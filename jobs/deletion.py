@@ -0,0 +1,155 @@
+"""
+Deferred deletion of sensors, nodes and supernodes.
+
+Delete endpoints only hide the entity (is_deleted flag, or the sensor pulled from its parent)
+and create a DeletionJob. deletionworker removes the sensordatas afterwards in chunks
+of DELETION_JOB_CHUNK_SIZE, ordered by _id on the (node, id) or (supernode, id) index,
+sleeping DELETION_JOB_CHUNK_INTERVAL between chunks so it does not hold the write lock
+for long, then deletes the documents themselves.
+"""
+import datetime
+import time
+
+from bson.objectid import ObjectId
+from mongoengine import Q
+
+from cloud_platform import settings
+from jobs.models import DeletionJob
+from nodes.catalog import public_catalog
+from nodes.models import Nodes
+from sensordatas.ingestion import engine
+from sensordatas.models import Sensordatas
+from sensors.index import unindex_parents, unindex_sensor
+from supernodes.models import Supernodes
+
+SENSOR_KINDS = (DeletionJob.NODE_SENSOR, DeletionJob.SUPERNODE_SENSOR)
+
+
+def delete_node(node, user):
+    """
+    Hide node (loaded with at least its id) and schedule removal of its sensordatas.
+    """
+    node.is_deleted = True
+    # partially loaded document, only is_deleted is written; post_save drops cached metadata
+    node.save(validate=False)
+    unindex_parents([node.id])
+    return DeletionJob.objects.create(user=user, kind=DeletionJob.NODE, target=node.id)
+
+
+def delete_supernode(supernode, user):
+    """
+    Hide supernode and its nodes, schedule removal of every sensordata they published.
+    """
+    supernode.is_deleted = True
+    supernode.save(validate=False)
+    nodes = list(Nodes.objects(supernode=supernode.id).scalar('id'))
+    Nodes.objects(id__in=nodes).update(set__is_deleted=True)
+    # queryset update sends no signal
+    public_catalog.invalidate()
+    engine.cache.invalidate(Nodes, *nodes)
+    unindex_parents([supernode.id] + nodes)
+    return DeletionJob.objects.create(user=user, kind=DeletionJob.SUPERNODE, target=supernode.id)
+
+
+def delete_sensor(document, parent, sensor, user):
+    """
+    Pull sensor from node or supernode (document class) parent and schedule removal
+    of its sensordatas, which stay hidden from listings until the job is done.
+    """
+    parent, sensor = ObjectId(parent), ObjectId(sensor)
+    document.objects(pk=parent).update_one(pull__sensors__id=sensor)
+    engine.cache.invalidate(document, parent)
+    unindex_sensor(sensor)
+    kind = DeletionJob.NODE_SENSOR if document is Nodes else DeletionJob.SUPERNODE_SENSOR
+    return DeletionJob.objects.create(user=user, kind=kind, target=sensor, parent=parent)
+
+
+def pending_sensors():
+    """
+    Ids of deleted sensors whose sensordatas are not removed yet.
+    """
+    return DeletionJob.objects(
+        kind__in=SENSOR_KINDS, status__in=(DeletionJob.PENDING, DeletionJob.RUNNING)
+    ).distinct('target')
+
+
+def hide_deleted_sensors(queryset):
+    sensors = pending_sensors()
+    return queryset.filter(sensor__nin=sensors) if sensors else queryset
+
+
+def scope(job):
+    """
+    Sensordatas filter of job, every one of them starts with an indexed field.
+    """
+    if DeletionJob.NODE == job.kind:
+        return {'node': job.target}
+    elif DeletionJob.SUPERNODE == job.kind:
+        # node sensordatas carry their supernode too
+        return {'supernode': job.target}
+    elif DeletionJob.NODE_SENSOR == job.kind:
+        return {'node': job.parent, 'sensor': job.target}
+    return {'supernode': job.parent, 'node': None, 'sensor': job.target}
+
+
+def claim(lease=None):
+    """
+    Take the oldest pending job, or a running one whose worker stopped updating it.
+    """
+    now = datetime.datetime.now()
+    lease = lease or settings.DELETION_JOB_LEASE
+    return DeletionJob.objects(
+        Q(status=DeletionJob.PENDING) | Q(status=DeletionJob.RUNNING, updated__lt=now - lease)
+    ).order_by('created').modify(set__status=DeletionJob.RUNNING, set__updated=now, new=True)
+
+
+def remove_chunk(job, chunk_size):
+    """
+    Delete next chunk of job sensordatas, return number of deleted documents.
+    """
+    filters = scope(job)
+    if job.cursor:
+        filters['id__gt'] = job.cursor
+    ids = list(Sensordatas.objects(**filters).order_by('id').limit(chunk_size).scalar('id'))
+    if not ids:
+        return 0
+    Sensordatas.objects(id__in=ids).delete()
+    job.cursor = ids[-1]
+    job.deleted += len(ids)
+    DeletionJob.objects(id=job.id).update_one(
+        set__cursor=job.cursor, inc__deleted=len(ids), set__updated=datetime.datetime.now()
+    )
+    return len(ids)
+
+
+def finish(job):
+    """
+    Delete the documents once their sensordatas are gone. Delete rules cascade to
+    sensordatas published since the last chunk, there are only a few of them.
+    A sensor has no delete rule, its late sensordatas (accepted by a process still holding
+    the old device metadata) are removed here, once the job is done they are not hidden anymore.
+    """
+    if DeletionJob.NODE == job.kind:
+        Nodes.all_objects(id=job.target).delete()
+    elif DeletionJob.SUPERNODE == job.kind:
+        Nodes.all_objects(supernode=job.target).delete()
+        Supernodes.all_objects(id=job.target).delete()
+    else:
+        Sensordatas.objects(**scope(job)).delete()
+    DeletionJob.objects(id=job.id).update_one(
+        set__status=DeletionJob.DONE, set__updated=datetime.datetime.now(), set__finished=datetime.datetime.now()
+    )
+
+
+def run(job, chunk_size=None, interval=None, sleep=time.sleep):
+    chunk_size = chunk_size or settings.DELETION_JOB_CHUNK_SIZE
+    interval = settings.DELETION_JOB_CHUNK_INTERVAL if interval is None else interval
+    try:
+        while remove_chunk(job, chunk_size):
+            sleep(interval)
+        finish(job)
+    except Exception as e:
+        DeletionJob.objects(id=job.id).update_one(
+            set__status=DeletionJob.FAILED, set__error=str(e), set__updated=datetime.datetime.now()
+        )
+        raise
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cloud_platform import settings
+from jobs import deletion
+
+
+class Command(BaseCommand):
+    help = "Remove sensordatas of deleted sensors, nodes and supernodes, one deletion job after another."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="exit when no job is left")
+        parser.add_argument('--chunk-size', type=int, default=settings.DELETION_JOB_CHUNK_SIZE)
+        parser.add_argument('--interval', type=float, default=settings.DELETION_JOB_CHUNK_INTERVAL,
+                            help="seconds between two chunks")
+
+    def handle(self, *args, **options):
+        while True:
+            job = deletion.claim()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(settings.DELETION_JOB_POLL_INTERVAL)
+                continue
+            self.stdout.write("job %s: %s %s" % (job.id, job.kind, job.target))
+            try:
+                deletion.run(job, options['chunk_size'], options['interval'])
+            except Exception as e:
+                # job is marked failed, keep serving the others
+                self.stderr.write("job %s failed: %s" % (job.id, e))
+                continue
+            self.stdout.write("job %s: %d sensordatas deleted" % (job.id, job.deleted))
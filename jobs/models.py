@@ -0,0 +1,50 @@
+from __future__ import unicode_literals
+import datetime
+
+from mongoengine import Document, StringField, IntField, ObjectIdField, ReferenceField, DateTimeField
+from users.models import User
+
+
+class DeletionJob(Document):
+    """
+    Removal of a deleted sensor, node or supernode and its sensordatas, run by deletionworker.
+    The entity is hidden when the job is created, sensordatas are removed in _id order
+    and cursor holds the last removed one, so an interrupted job resumes where it stopped.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    NODE = 'node'
+    SUPERNODE = 'supernode'
+    NODE_SENSOR = 'node-sensor'
+    SUPERNODE_SENSOR = 'supernode-sensor'
+
+    user = ReferenceField(User)
+    kind = StringField(required=True, choices=(NODE, SUPERNODE, NODE_SENSOR, SUPERNODE_SENSOR))
+    # deleted node, supernode or sensor id
+    target = ObjectIdField(required=True)
+    # node or supernode which had the sensor, None for node and supernode jobs
+    parent = ObjectIdField(required=False, null=True)
+    status = StringField(default=PENDING, choices=(PENDING, RUNNING, DONE, FAILED))
+    deleted = IntField(default=0)
+    cursor = ObjectIdField(required=False, null=True)
+    error = StringField(required=False, null=True)
+    created = DateTimeField(default=datetime.datetime.now)
+    updated = DateTimeField(default=datetime.datetime.now)
+    finished = DateTimeField(required=False, null=True)
+
+    meta = {
+        'indexes': [
+            {
+                'fields': ['status', 'created']
+            },
+            {
+                'fields': ['user', '-created']
+            },
+        ],
+    }
+
+    def __unicode__(self):
+        return '%s %s' % (self.kind, self.target)
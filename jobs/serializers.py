@@ -0,0 +1,16 @@
+from rest_framework import serializers
+from rest_framework_mongoengine.serializers import DocumentSerializer
+from jobs.models import DeletionJob
+
+
+class DeletionJobSerializer(DocumentSerializer):
+    user = serializers.SlugRelatedField(slug_field="username", read_only=True)
+    # extra field
+    url = serializers.HyperlinkedIdentityField(
+        view_name='jobs-detail',
+        lookup_field='pk'
+    )
+
+    class Meta:
+        model = DeletionJob
+        exclude = ('cursor',)
@@ -0,0 +1,73 @@
+from unittest import skipIf
+
+import mongoengine
+from bson.objectid import ObjectId
+from django.test import SimpleTestCase
+from mongoengine.connection import DEFAULT_CONNECTION_NAME, _connection_settings
+
+from jobs.deletion import finish, remove_chunk, scope
+from jobs.models import DeletionJob
+from sensordatas.models import Sensordatas
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+class DeletionScopeTest(SimpleTestCase):
+    def test_scope_of_every_kind(self):
+        target, parent = ObjectId(), ObjectId()
+        self.assertEqual(scope(DeletionJob(kind=DeletionJob.NODE, target=target)), {'node': target})
+        self.assertEqual(scope(DeletionJob(kind=DeletionJob.SUPERNODE, target=target)), {'supernode': target})
+        self.assertEqual(scope(DeletionJob(kind=DeletionJob.NODE_SENSOR, target=target, parent=parent)),
+                         {'node': parent, 'sensor': target})
+        self.assertEqual(scope(DeletionJob(kind=DeletionJob.SUPERNODE_SENSOR, target=target, parent=parent)),
+                         {'supernode': parent, 'node': None, 'sensor': target})
+
+
+@skipIf(mongomock is None, "requires mongomock")
+class RemoveChunkTest(SimpleTestCase):
+    def setUp(self):
+        # settings of the project connection, restored as they were by tearDown
+        self.connection = dict(_connection_settings.get(DEFAULT_CONNECTION_NAME, {}))
+        mongoengine.disconnect()
+        mongoengine.connect('agrihub_test', host='mongomock://localhost')
+        self.supernode, self.node, self.sensor = ObjectId(), ObjectId(), ObjectId()
+        self.insert(self.node, 5)
+        self.insert(ObjectId(), 2)
+
+    def tearDown(self):
+        mongoengine.disconnect()
+        if self.connection:
+            # reconnected lazily on the next query
+            _connection_settings[DEFAULT_CONNECTION_NAME] = self.connection
+
+    def insert(self, node, count):
+        Sensordatas._get_collection().insert_many([
+            {'supernode': self.supernode, 'node': node, 'sensor': self.sensor, 'data': 1.0} for _ in range(count)
+        ])
+
+    def test_chunks_resume_from_cursor(self):
+        job = DeletionJob(kind=DeletionJob.NODE, target=self.node).save()
+        self.assertEqual(remove_chunk(job, 2), 2)
+
+        # a new worker continues from the stored cursor
+        job = DeletionJob.objects.get(id=job.id)
+        self.assertEqual(job.deleted, 2)
+        self.assertEqual(remove_chunk(job, 2), 2)
+        self.assertEqual(remove_chunk(job, 2), 1)
+        self.assertEqual(remove_chunk(job, 2), 0)
+        self.assertEqual(DeletionJob.objects.get(id=job.id).deleted, 5)
+        self.assertEqual(Sensordatas.objects(node=self.node).count(), 0)
+        self.assertEqual(Sensordatas.objects.count(), 2)
+
+    def test_finish_removes_late_sensordatas_of_sensor(self):
+        job = DeletionJob(kind=DeletionJob.NODE_SENSOR, target=self.sensor, parent=self.node).save()
+        while remove_chunk(job, 10):
+            pass
+        # accepted after the last chunk by a process holding the old device metadata
+        self.insert(self.node, 1)
+        finish(job)
+        self.assertEqual(Sensordatas.objects(node=self.node).count(), 0)
+        self.assertEqual(DeletionJob.objects.get(id=job.id).status, DeletionJob.DONE)
@@ -0,0 +1,10 @@
+from django.conf.urls import url
+from rest_framework.urlpatterns import format_suffix_patterns
+from jobs import views
+
+urlpatterns = [
+    url(r'^$', views.DeletionJobsList.as_view(), name="jobs-all"),
+    url(r'^(?P<pk>\w+)/$', views.DeletionJobDetail.as_view(), name="jobs-detail"),
+]
+
+urlpatterns = format_suffix_patterns(urlpatterns)
@@ -0,0 +1,47 @@
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework_mongoengine.generics import ListAPIView, GenericAPIView
+from authenticate.authentication import JSONWebTokenAuthentication
+from authenticate.permissions import IsUser, get_permitted, owned_by
+from cloud_platform.helpers import is_objectid_valid
+
+from jobs.models import DeletionJob
+from jobs.serializers import DeletionJobSerializer
+
+
+class DeletionJobsList(ListAPIView):
+    """
+    Retrieve deletion jobs of authenticated user, newest first.
+    """
+    authentication_classes = (JSONWebTokenAuthentication,)
+    permission_classes = (IsUser,)
+    serializer_class = DeletionJobSerializer
+
+    def get_queryset(self):
+        return DeletionJob.objects.filter(user=self.request.user).order_by('-created')
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = DeletionJobSerializer(page, many=True, context={'request': request})
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+
+class DeletionJobDetail(GenericAPIView):
+    """
+    Retrieve status and progress of a deletion job.
+    """
+    authentication_classes = (JSONWebTokenAuthentication,)
+    permission_classes = (IsUser,)
+
+    def get(self, request, pk):
+        if not is_objectid_valid(pk):
+            return Response({
+                'detail': '%s is not valid ObjectId.' % pk
+            }, status=status.HTTP_400_BAD_REQUEST)
+        job = get_permitted(DeletionJob, {'pk': pk}, owned_by(request.user))
+        return Response(DeletionJobSerializer(job, context={'request': request}).data)
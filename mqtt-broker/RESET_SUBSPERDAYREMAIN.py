@@ -1,9 +1,19 @@
 #!/usr/bin/python
-import bson, datetime
-from mongoengine import *
-from models import *
+"""
+Reset pubsperdayremain of every node not charged today, with one update_many.
+
+Quota is reset lazily on first publish of a day (sensordatas/ingestion.py), so this is
+optional, e.g. to have stored remaining counts right for a report.
+"""
+from mongoengine import connect
+from models import Nodes
+from nodes.models import quota_day
 
 connect('agrihub')
 
-for post in Nodes.objects:
-    post.update(subsperdayremain=post.subsperday)
+today = quota_day()
+result = Nodes._get_collection().update_many(
+    {'pubsday': {'$ne': today}},
+    [{'$set': {'pubsperdayremain': '$pubsperday', 'pubsday': today}}]
+)
+print("%d nodes reset." % result.modified_count)
@@ -0,0 +1,101 @@
+import hashlib
+import time
+
+# fields deciding a topic (<owner username>/<node label>) or a credential (label, secretkey),
+# quota charges and sensor edits update other fields of nodes and are not watched
+WATCHED_FIELDS = ('label', 'user', 'secretkey', 'is_deleted', 'username')
+CREDENTIAL_FIELDS = ('label', 'secretkey', 'is_deleted')
+
+# change stream of nodes and user documents limited to WATCHED_FIELDS
+CHANGE_PIPELINE = [{'$match': {
+    'ns.coll': {'$in': ['nodes', 'user']},
+    '$or': [{'operationType': {'$in': ['insert', 'delete', 'replace']}},
+            {'updateDescription.removedFields': {'$in': list(WATCHED_FIELDS)}}] +
+           [{'updateDescription.updatedFields.%s' % field: {'$exists': True}} for field in WATCHED_FIELDS]
+}}]
+
+
+def touches_credentials(change):
+    """
+    True when a change event of CHANGE_PIPELINE may change a credential check of a node.
+    An inserted node may have been cached as a failure.
+    """
+    if 'nodes' != change.get('ns', {}).get('coll'):
+        return False
+    if change.get('operationType') in ('insert', 'delete', 'replace'):
+        return True
+    description = change.get('updateDescription', {})
+    fields = list(description.get('updatedFields', {})) + list(description.get('removedFields', []))
+    return any(field in CREDENTIAL_FIELDS for field in fields)
+
+
+class AuthCache(object):
+    """
+    Mosquitto auth decisions kept in memory.
+
+    topics: precomputed map of topic (<owner username>/<node label>) to (owner id, node id),
+    ACL checks are then pure lookups.
+    credentials: result of (username, password) checks, keyed by digest so no password is
+    kept in memory. Failures are cached too, with a shorter ttl (negative caching).
+
+    Loaders are given by the service, this class does no I/O.
+    """
+
+    def __init__(self, load_topics, load_credential, credential_ttl=300, negative_ttl=30, max_credentials=100000):
+        self.load_topics = load_topics
+        self.load_credential = load_credential
+        self.credential_ttl = credential_ttl
+        self.negative_ttl = negative_ttl
+        self.max_credentials = max_credentials
+        self.topics = {}
+        self.credentials = {}
+
+    @staticmethod
+    def credential_key(username, password):
+        return hashlib.sha256(('%s\0%s' % (username, password)).encode('utf-8')).hexdigest()
+
+    def cached_credential(self, username, password):
+        """
+        Return cached check result, or None when it is unknown or expired.
+        """
+        entry = self.credentials.get(self.credential_key(username, password))
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    def remember_credential(self, username, password, allowed):
+        now = time.time()
+        if len(self.credentials) >= self.max_credentials:
+            self.credentials = dict((key, entry) for key, entry in self.credentials.items() if entry[1] > now)
+            if len(self.credentials) >= self.max_credentials:
+                self.credentials = {}
+        ttl = self.credential_ttl if allowed else self.negative_ttl
+        self.credentials[self.credential_key(username, password)] = (allowed, now + ttl)
+
+    def check_credential(self, username, password):
+        allowed = self.cached_credential(username, password)
+        if allowed is None:
+            allowed = bool(self.load_credential(username, password))
+            self.remember_credential(username, password, allowed)
+        return allowed
+
+    def check_acl(self, username, topic):
+        """
+        Node may only use topic <owner username>/<node label>, node label is its MQTT username.
+        """
+        return topic in self.topics and topic.partition('/')[2] == username
+
+    def set_topics(self, topics):
+        # swap whole map, readers never see a half built one
+        self.topics = topics
+
+    def forget_credentials(self):
+        self.credentials = {}
+
+    def rebuild(self, credentials=False):
+        """
+        Reload topic map, and forget credentials when they may have changed too.
+        """
+        self.set_topics(self.load_topics())
+        if credentials:
+            self.forget_credentials()
@@ -2,12 +2,20 @@
 
 import sys
 
+import threading
+
+import time
+
 import bottle
 
 from bottle import response, request
 
 from pymongo import MongoClient
 
+from pymongo.errors import PyMongoError
+
+from acl import AuthCache, CHANGE_PIPELINE, touches_credentials
+
 client = MongoClient('localhost', 27017)
 
 db = client['agrihub']
@@ -16,9 +24,61 @@ nodes = db['nodes']
 
 user = db['user']
 
+# seconds between cache rebuild when mongod has no change stream (standalone server)
+REFRESH_INTERVAL = 30
+
+# seconds changes following a first one are collected into the same rebuild
+REBUILD_DELAY = 1
+
 app = application = bottle.Bottle()
 
 
+def load_topics():
+    owners = dict((owner['_id'], owner['username']) for owner in user.find({}, {'username': 1}))
+
+    topics = {}
+
+    for node in nodes.find({'is_deleted': {'$ne': True}}, {'label': 1, 'user': 1}):
+
+        owner = owners.get(node.get('user'))
+
+        if owner and node.get('label'):
+            topics[owner + '/' + node['label']] = (node['user'], node['_id'])
+
+    return topics
+
+
+def load_credential(username, password):
+    return nodes.find_one(
+        {"label": username, "secretkey": password, "is_deleted": {"$ne": True}}, {'_id': 1}
+    ) is not None
+
+
+cache = AuthCache(load_topics, load_credential, credential_ttl=300, negative_ttl=30)
+
+
+def watch_changes():
+    """
+    Rebuild cache when a topic or credential field of nodes or users changes, a burst of
+    changes makes one rebuild. Change streams need a replica set, on a standalone mongod
+    the cache is rebuilt every REFRESH_INTERVAL seconds instead.
+    """
+    while True:
+        try:
+            with db.watch(CHANGE_PIPELINE, max_await_time_ms=100) as stream:
+                for change in stream:
+                    credentials = touches_credentials(change)
+                    deadline = time.time() + REBUILD_DELAY
+                    while time.time() < deadline:
+                        change = stream.try_next()
+                        if change is not None:
+                            credentials = credentials or touches_credentials(change)
+                    cache.rebuild(credentials)
+        except PyMongoError:
+            time.sleep(REFRESH_INTERVAL)
+            cache.rebuild(credentials=True)
+
+
 @app.route('/auth', method='POST')
 def auth():
     response.content_type = 'text/plain'
@@ -34,11 +94,9 @@ def auth():
 
         return None
 
-    for node in nodes.find({"label": username, "secretkey": password}):
+    if cache.check_credential(username, password):
         response.status = 200
 
-        return None
-
     return None
 
 
@@ -70,21 +128,25 @@ def acl():
 
     # acc      = request.forms.get('acc') # 1 == SUB, 2 == PUB
 
+    # in-memory lookup, topic map is kept up to date by watch_changes
+    if cache.check_acl(username, topic):
+        response.status = 200
 
+    return None
 
-    for node in nodes.find({"label": username}):
 
-        userid = node['user']
+def start_cache():
+    cache.rebuild(credentials=True)
 
-        for users in user.find({"_id": userid}):
+    watcher = threading.Thread(target=watch_changes, name='auth-cache-watcher')
 
-            if topic == users['username'] + '/' + node['label']:
-                response.status = 200
+    watcher.daemon = True
 
-                return None
+    watcher.start()
 
-    return None
 
+# also when served by a WSGI server through `application`
+start_cache()
 
 if __name__ == '__main__':
     bottle.debug(True)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+asyncio auth backend for mosquitto-auth-plug, same /auth, /superuser and /acl contract as auth.py.
+
+Requires Python 3, aiohttp and motor:
+$ python3 auth_async.py [--host 127.0.0.1] [--port 8100] [--mongo mongodb://localhost:27017]
+
+Requests are handled concurrently on one event loop. Mongo lookups go through a pooled
+motor client, and identical credential lookups in flight at the same time share one query.
+Decisions are cached by acl.AuthCache like auth.py does, ACL checks never touch Mongo.
+"""
+import argparse
+import asyncio
+import time
+
+from aiohttp import web
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+from acl import AuthCache, CHANGE_PIPELINE, touches_credentials
+
+SUPERUSER = 's3rv3r'
+
+# seconds between cache rebuild when mongod has no change stream (standalone server)
+REFRESH_INTERVAL = 30
+
+# seconds changes following a first one are collected into the same rebuild
+REBUILD_DELAY = 1
+
+
+class AuthService(object):
+    def __init__(self, db):
+        self.db = db
+        # loaders are coroutines here, AuthCache is only used for its maps
+        self.cache = AuthCache(None, None, credential_ttl=300, negative_ttl=30)
+        self.inflight = {}
+        self.watcher = None
+
+    async def load_topics(self):
+        owners = {}
+        async for owner in self.db.user.find({}, {'username': 1}):
+            owners[owner['_id']] = owner['username']
+        topics = {}
+        async for node in self.db.nodes.find({'is_deleted': {'$ne': True}}, {'label': 1, 'user': 1}):
+            owner = owners.get(node.get('user'))
+            if owner and node.get('label'):
+                topics[owner + '/' + node['label']] = (node['user'], node['_id'])
+        return topics
+
+    async def rebuild(self, credentials=False):
+        self.cache.set_topics(await self.load_topics())
+        if credentials:
+            self.cache.forget_credentials()
+
+    async def lookup_credential(self, username, password):
+        node = await self.db.nodes.find_one(
+            {'label': username, 'secretkey': password, 'is_deleted': {'$ne': True}}, {'_id': 1}
+        )
+        allowed = node is not None
+        self.cache.remember_credential(username, password, allowed)
+        return allowed
+
+    async def check_credential(self, username, password):
+        allowed = self.cache.cached_credential(username, password)
+        if allowed is not None:
+            return allowed
+        key = AuthCache.credential_key(username, password)
+        lookup = self.inflight.get(key)
+        if lookup is None:
+            lookup = asyncio.ensure_future(self.lookup_credential(username, password))
+            self.inflight[key] = lookup
+            lookup.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # a cancelled waiter must not cancel the lookup other waiters share
+        return await asyncio.shield(lookup)
+
+    async def watch_changes(self):
+        """
+        Rebuild cache when a topic or credential field of nodes or users changes, a burst of
+        changes makes one rebuild. Change streams need a replica set, on a standalone mongod
+        the cache is rebuilt every REFRESH_INTERVAL seconds instead.
+        """
+        while True:
+            try:
+                async with self.db.watch(CHANGE_PIPELINE, max_await_time_ms=100) as stream:
+                    async for change in stream:
+                        credentials = touches_credentials(change)
+                        deadline = time.time() + REBUILD_DELAY
+                        while time.time() < deadline:
+                            change = await stream.try_next()
+                            if change is not None:
+                                credentials = credentials or touches_credentials(change)
+                        await self.rebuild(credentials)
+            except PyMongoError:
+                await asyncio.sleep(REFRESH_INTERVAL)
+                await self.rebuild(credentials=True)
+
+    @staticmethod
+    def decision(allowed):
+        return web.Response(status=200 if allowed else 403, content_type='text/plain')
+
+    async def auth(self, request):
+        form = await request.post()
+        username = form.get('username')
+        if username == SUPERUSER:
+            return self.decision(True)
+        return self.decision(await self.check_credential(username, form.get('password')))
+
+    async def superuser(self, request):
+        form = await request.post()
+        return self.decision(form.get('username') == SUPERUSER)
+
+    async def acl(self, request):
+        form = await request.post()
+        return self.decision(self.cache.check_acl(form.get('username'), form.get('topic')))
+
+    async def on_startup(self, app):
+        await self.rebuild(credentials=True)
+        self.watcher = asyncio.ensure_future(self.watch_changes())
+
+    async def on_cleanup(self, app):
+        self.watcher.cancel()
+
+
+def create_app(db):
+    service = AuthService(db)
+    app = web.Application()
+    app.router.add_post('/auth', service.auth)
+    app.router.add_post('/superuser', service.superuser)
+    app.router.add_post('/acl', service.acl)
+    app.on_startup.append(service.on_startup)
+    app.on_cleanup.append(service.on_cleanup)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="asyncio auth backend for mosquitto-auth-plug.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--mongo', default='mongodb://localhost:27017')
+    parser.add_argument('--pool-size', type=int, default=100, help="max pooled Mongo connections")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(args.mongo, maxPoolSize=args.pool_size)
+    web.run_app(create_app(client['agrihub']), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
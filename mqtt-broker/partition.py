@@ -0,0 +1,9 @@
+import zlib
+
+
+def topic_partition(topic, count):
+    """
+    Deterministic partition index of topic among count workers.
+    crc32 is stable across processes and restarts, unlike hash() on Python 3.
+    """
+    return (zlib.crc32(topic.encode('utf-8')) & 0xffffffff) % count
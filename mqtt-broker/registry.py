@@ -0,0 +1,77 @@
+import threading
+import time
+
+from models import Nodes, User
+
+
+class NodeEntry(object):
+    """
+    Registry entry of a node, sensors maps sensor label to sensor id.
+    Entry without id remembers an unknown topic.
+    """
+    __slots__ = ('id', 'label', 'supernode', 'sensors', 'expires')
+
+    def __init__(self, id=None, label=None, supernode=None, sensors=None, expires=0):
+        self.id = id
+        self.label = label
+        self.supernode = supernode
+        self.sensors = sensors or {}
+        self.expires = expires
+
+
+class NodeRegistry(object):
+    """
+    In-memory registry of nodes keyed by MQTT topic (<username>/<node label>), then by sensor label.
+
+    A topic is resolved once with indexed lookups (user.username, then nodes (user, label))
+    and kept until ttl is over, so message cost does not grow with fleet size.
+    Unknown topics are remembered too, a misbehaving publisher cost no query either.
+    With a DeviceStamp (sensordatas.ingestion), changes made through the API drop every entry
+    before the ttl is over.
+    """
+
+    def __init__(self, ttl=60, stamp=None):
+        self.ttl = ttl
+        self.stamp = stamp
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, topic):
+        """
+        Return NodeEntry of topic, or None when topic does not belong to any node.
+        """
+        if self.stamp is not None and self.stamp.changed():
+            self.invalidate()
+        entry = self.entries.get(topic)
+        if entry is None or entry.expires < time.time():
+            entry = self.load(topic)
+            with self.lock:
+                self.entries[topic] = entry
+        return entry if entry.id else None
+
+    def load(self, topic):
+        expires = time.time() + self.ttl
+        username, _, label = topic.partition('/')
+        user = User.objects(username=username).only('id').first()
+        if user is None:
+            return NodeEntry(expires=expires)
+        node = Nodes.objects(user=user.id, label=label).only('id', 'label', 'supernode', 'sensors').as_pymongo().first()
+        if node is None:
+            return NodeEntry(expires=expires)
+        return NodeEntry(
+            id=node['_id'],
+            label=node['label'],
+            supernode=node.get('supernode'),
+            sensors=dict((sensor.get('label'), sensor.get('id')) for sensor in node.get('sensors', [])),
+            expires=expires
+        )
+
+    def invalidate(self, topic=None):
+        """
+        Drop topic entry, or every entry when topic is None, it will be loaded again on next message.
+        """
+        with self.lock:
+            if topic is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(topic, None)
@@ -1,59 +1,214 @@
-# Import library
+#!/usr/bin/python
+"""
+MQTT ingestion service.
+
+$ python subs.py [--workers N] [--partition hash|shared] [--drop-sessions M]
+
+Every worker is a separate process with its own MQTT connection, Mongo connection,
+node registry and writer, they share no mutable state. The topic space is split:
+- shared: every worker subscribes to $share/<group>/#, broker balances messages
+  (MQTT v5 shared subscription, mosquitto >= 1.6 also for v3.1.1 clients).
+- hash: for brokers without shared subscription, every worker subscribes to #
+  and keeps only topics where crc32(topic) % N is its own index.
+SIGTERM or SIGINT disconnects every worker, each one drains its writer before exit.
+
+Delivery is at least once: workers subscribe with QoS 1 in a persistent session
+(clean_session=False) and acknowledge a message only after the flush holding it is
+written (paho manual_ack, paho-mqtt >= 2.0). Unacked messages count against the broker
+in-flight window (max_inflight_messages in mosquitto.conf), so a slow writer makes the
+broker queue messages instead of the worker buffering them.
+
+A persistent session outlives its worker: after shrinking from M to N workers, sessions
+subfull-N..M-1 would keep queuing every publish (up to max_queued_messages in mosquitto.conf).
+Start the smaller deployment once with --drop-sessions M, it connects those client ids with
+clean_session=True so the broker discards them.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import signal
+
 import paho.mqtt.client as mqtt
-from models import *
-
-# Koneksi ke DB
-connect('agrihub')
-
-# Inisiasi mqtt client
-mqttc = mqtt.Client("subfull", clean_session=True)
-mqttc.username_pw_set(username="s3rv3r", password="rahasia")
-
-
-# Inisiasi callback function
-def message_in(mqttc, obj, msg):
-    item = json.loads(msg.payload)
-    # print item
-    for post in Nodes.objects:
-        finish = False
-        fail = True
-        if post.label == item['node'] and post.subsperdayremain > 0:
-            for x in post.sensors:
-                remain = post.subsperdayremain
-                for i in item['sensor']:
-                    if x.label == i['label']:
-                        store = Subscriptions(data=i['data'], sensor=x.id, node=post.id)
-                        # remain = post.subsperdayremain
-                        store.save()
-                        remain = remain - 1
-                        # post.update(subsperdayremain=remain-1)
-                        print "stored >> " + item['node'] + " | " + i['label'] + " | " + i['data']
-                        finish = True
-                # fail = False
-                # if fail == True :
-                #     print "fail >> "+item['node']+" | "+i['label']+" | "+i['data']
-                post.update(subsperdayremain=remain)
-                if finish:
-                    break
-        if finish:
-            break
-
-
-def on_connect(client, userdata, flags, rc):
-    m = "Connected flags " + str(flags) + "\nresult code " + str(rc) + "\nclient_id  " + str(client)
-    print(m)
-
-
-# Registrasi callback funtion
-mqttc.on_message = message_in
-mqttc.on_connect = on_connect
-
-# Buat Koneksi ke broker
-mqttc.connect("127.0.0.1", 1883)
-
-# Subscribe dengan topik semua
-mqttc.subscribe("#")
-print("Server is running...")
-
-# Looping forever
-mqttc.loop_forever()
+from mongoengine import connect
+import models  # noqa: F401, puts the platform apps on sys.path
+from partition import topic_partition
+from registry import NodeRegistry
+from sensordatas.ingestion import DeviceStamp, Reading
+from writer import BatchWriter
+
+BROKER_HOST = "127.0.0.1"
+BROKER_PORT = 1883
+BROKER_USERNAME = "s3rv3r"
+BROKER_PASSWORD = "rahasia"
+CLIENT_ID = "subfull-%d"
+SHARE_GROUP = "ingest"
+QOS = 1
+
+
+class IngestionWorker(object):
+    def __init__(self, index=0, count=1, partition='hash', registry=None, writer=None):
+        self.index = index
+        self.count = count
+        self.partition = partition
+        # Node lookup by topic, see registry.py
+        self.registry = registry or NodeRegistry(ttl=60, stamp=DeviceStamp(interval=1))
+        # Persistence runs in writer thread, see writer.py
+        self.writer = writer or BatchWriter(batch_size=500, flush_interval=0.2, max_queue=10000)
+        self.writer.acknowledge = self.acknowledge
+        self.client = None
+
+    def owns(self, topic):
+        return 'hash' != self.partition or topic_partition(topic, self.count) == self.index
+
+    def handle(self, topic, payload, token=None):
+        """
+        Queue readings of a message for the writer, return False when there is nothing to write.
+        """
+        if not self.owns(topic):
+            return False
+        try:
+            item = json.loads(payload)
+        except ValueError:
+            print("malformed >> " + topic)
+            return False
+        # valid JSON of another shape is dropped as well, so the message is acked and not redelivered
+        if not isinstance(item, dict) or not isinstance(item.get('sensor', []), list):
+            print("malformed >> " + topic)
+            return False
+        node = self.registry.resolve(topic)
+        if node is None or node.label != item.get('node'):
+            print("unknown >> " + topic)
+            return False
+
+        # normalized for the ingestion engine, it validates values and charges node quota
+        timestamp = datetime.datetime.now()
+        readings = []
+        for i in item.get('sensor', []):
+            if not isinstance(i, dict):
+                continue
+            sensor = node.sensors.get(i.get('label'))
+            if sensor is None:
+                continue
+            readings.append(Reading(node.supernode, node.id, sensor, i.get('data'), timestamp))
+        if not readings:
+            return False
+
+        # written by the writer thread, it acks token once written
+        self.writer.put(readings, token)
+        return True
+
+    # Inisiasi callback function
+    def message_in(self, client, obj, msg):
+        if self.writer.stopped.is_set():
+            # shutting down, left unacked so the broker redelivers it to the next session
+            return
+        try:
+            queued = self.handle(msg.topic, msg.payload, (msg.mid, msg.qos))
+        except Exception as e:
+            # paho re-raises callback errors and stops the loop, the persistent session would
+            # redeliver the same message on reconnect, so it is logged and acked instead
+            print("failed >> " + msg.topic + " " + repr(e))
+            queued = False
+        if not queued:
+            client.ack(msg.mid, msg.qos)
+
+    def acknowledge(self, tokens):
+        # called from the writer thread, paho queues the PUBACKs for the network loop
+        for mid, qos in tokens:
+            self.client.ack(mid, qos)
+
+    def on_connect(self, client, userdata, flags, rc):
+        m = "Connected flags " + str(flags) + "\nresult code " + str(rc) + "\nclient_id  " + str(client)
+        print(m)
+        # subscribe on every (re)connect
+        if 'shared' == self.partition:
+            client.subscribe("$share/%s/#" % SHARE_GROUP, qos=QOS)
+        else:
+            client.subscribe("#", qos=QOS)
+
+    def run(self):
+        # pymongo client is not fork-safe, every worker opens its own connection
+        connect('agrihub')
+
+        # Inisiasi mqtt client
+        # fixed client id and persistent session, unacked messages survive a restart
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, CLIENT_ID % self.index,
+                                  clean_session=False, manual_ack=True)
+        self.client.username_pw_set(username=BROKER_USERNAME, password=BROKER_PASSWORD)
+        self.client.on_message = self.message_in
+        self.client.on_connect = self.on_connect
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.writer.start()
+        self.client.connect(BROKER_HOST, BROKER_PORT)
+        print("Worker %d/%d is running..." % (self.index + 1, self.count))
+        try:
+            self.client.loop_forever()
+        finally:
+            self.writer.close()
+
+    def stop(self, signum=None, frame=None):
+        # write and ack what is queued first, loop_forever returns once disconnected
+        self.writer.close()
+        self.client.disconnect()
+
+
+def run_worker(index, count, partition):
+    IngestionWorker(index, count, partition).run()
+
+
+def drop_sessions(start, stop):
+    """
+    Discard persistent sessions of workers start..stop-1, left on the broker by a larger deployment.
+    """
+    for index in range(start, stop):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, CLIENT_ID % index, clean_session=True)
+        client.username_pw_set(username=BROKER_USERNAME, password=BROKER_PASSWORD)
+        client.connect(BROKER_HOST, BROKER_PORT)
+        # the stored session is discarded once the broker accepted the connection
+        for _ in range(10):
+            client.loop(timeout=0.5)
+            if client.is_connected():
+                break
+        client.disconnect()
+        print("Session %s is dropped" % (CLIENT_ID % index))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT ingestion service.")
+    parser.add_argument('--workers', type=int, default=1, help="number of worker processes")
+    parser.add_argument('--partition', choices=('hash', 'shared'), default='hash',
+                        help="split topics by crc32 hash or by broker shared subscription")
+    parser.add_argument('--drop-sessions', type=int, default=0, metavar='M',
+                        help="worker count of the previous deployment, drops sessions of workers over --workers")
+    args = parser.parse_args()
+
+    if args.drop_sessions > args.workers:
+        drop_sessions(args.workers, args.drop_sessions)
+
+    if 1 == args.workers:
+        run_worker(0, 1, args.partition)
+        return
+
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(index, args.workers, args.partition))
+        for index in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def terminate(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import models  # noqa: F401, puts the platform apps on sys.path
+from sensordatas.ingestion import IngestionEngine
+
+
+class BatchWriter(object):
+    """
+    Decouple MQTT reception from persistence.
+
+    message_in only put the readings of a message (one publish) into a bounded queue.
+    A writer thread hands them to the ingestion engine every batch_size readings or
+    flush_interval seconds, whichever comes first: one bulk insert and one quota charge
+    per node per flush. When the queue is full put() blocks paho network loop,
+    so broker queues the rest.
+
+    Every message carries an ack token, acknowledge(tokens) is called only once the flush
+    holding them is written. A failed flush is retried with backoff and stays unacked,
+    so a crash never loses an acknowledged message.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=0.2, max_queue=10000, stats_interval=60, engine=None,
+                 acknowledge=None, retry_delay=0.5, max_retry_delay=30):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats_interval = stats_interval
+        self.engine = engine or IngestionEngine()
+        self.acknowledge = acknowledge
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='batch-writer')
+        self.thread.daemon = True
+        # metrics
+        self.flushes = 0
+        self.written = 0
+        self.rejected = 0
+        self.limited = 0
+        self.failed = 0
+        self.acked = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    def start(self):
+        self.thread.start()
+
+    def put(self, readings, token=None):
+        """
+        Queue readings of one message, block while the queue is full.
+        """
+        self.queue.put((readings, token))
+
+    def close(self):
+        """
+        Flush whatever is still queued, then stop the writer thread. Safe to call twice.
+        """
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def run(self):
+        last_stats = time.time()
+        while not (self.stopped.is_set() and self.queue.empty()):
+            batch = self.collect()
+            if batch:
+                self.flush(batch)
+            if self.stats_interval and time.time() - last_stats > self.stats_interval:
+                last_stats = time.time()
+                print("writer >> " + str(self.stats()))
+
+    def collect(self):
+        batch = []
+        count = 0
+        deadline = time.time() + self.flush_interval
+        while count < self.batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            count += len(item[0])
+        return batch
+
+    def flush(self, batch):
+        started = time.time()
+        publishes = [readings for readings, _ in batch]
+        delay = self.retry_delay
+        while True:
+            try:
+                result = self.write(publishes)
+                break
+            except Exception as e:
+                self.failed += sum(len(readings) for readings in publishes)
+                print("writer failure >> " + str(e))
+                if self.stopped.is_set():
+                    # shutting down, unacked messages are redelivered to the next session
+                    return
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+        self.written += result.written
+        self.rejected += result.rejected
+        self.limited += result.limited
+
+        tokens = [token for _, token in batch if token is not None]
+        if self.acknowledge and tokens:
+            self.acknowledge(tokens)
+            self.acked += len(tokens)
+
+        latency = time.time() - started
+        self.flushes += 1
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self.total_flush_latency += latency
+
+    def write(self, publishes):
+        """
+        Persist one flush through the ingestion engine, return its IngestionResult.
+        """
+        return self.engine.ingest(publishes)
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'max_queue': self.queue.maxsize,
+            'flushes': self.flushes,
+            'written': self.written,
+            'rejected': self.rejected,
+            'limited': self.limited,
+            'failed': self.failed,
+            'acked': self.acked,
+            'last_flush_ms': round(self.last_flush_latency * 1000, 2),
+            'avg_flush_ms': round(self.total_flush_latency * 1000 / self.flushes, 2) if self.flushes else 0.0,
+            'max_flush_ms': round(self.max_flush_latency * 1000, 2)
+        }
@@ -0,0 +1,114 @@
+"""
+Catalog of public nodes, listed by /nodes/?role=global.
+
+The ordered (id, owner) list of public nodes is read once on a partial index
+(is_public=1 only) and cached under a version key. Any change of a node bumps the version,
+so the next listing reads it again. Excluding the caller's own nodes and slicing a page
+are done on the cached list, a page then costs one query by id. A catalog over MAX_ENTRIES
+is not cached, its pages are then read from the query itself.
+"""
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from mongoengine import signals
+
+from cloud_platform import settings
+from nodes.models import Nodes
+
+SORTS = {
+    'newest': '-id',
+    'oldest': 'id',
+    'label': 'label',
+    '-label': '-label',
+}
+
+VERSION_KEY = 'nodes-catalog:version'
+
+
+class PublicCatalog(object):
+    def __init__(self, alias, timeout, max_entries):
+        self.cache = caches[alias]
+        # invalidation would only reach the process that saved the node
+        if isinstance(self.cache, LocMemCache) and not settings.DEBUG:
+            raise ImproperlyConfigured("NODES_CATALOG cache '%s' is local to one process." % alias)
+        self.timeout = timeout
+        self.max_entries = max_entries
+
+    def version(self):
+        version = self.cache.get(VERSION_KEY)
+        if version is None:
+            # a lost version restarts from the clock, never from a value old pages may still use
+            self.cache.add(VERSION_KEY, int(time.time() * 1000), None)
+            version = self.cache.get(VERSION_KEY)
+        return version
+
+    def entries(self, sort):
+        """
+        [(node id, owner id)] of public nodes in sort order, or None when there are more than max_entries.
+        """
+        key = 'nodes-catalog:%s:%s' % (self.version(), sort)
+        entries = self.cache.get(key)
+        if entries is None:
+            # one more entry tells that the catalog is over the cap, it is remembered as False
+            raw = Nodes.objects(is_public=1).order_by(SORTS[sort]).only('id', 'user') \
+                .limit(self.max_entries + 1).as_pymongo()
+            entries = [(node['_id'], node.get('user')) for node in raw]
+            if len(entries) > self.max_entries:
+                entries = False
+            self.cache.set(key, entries, self.timeout)
+        return None if entries is False else entries
+
+    def visible_to(self, user, sort):
+        """
+        Ids of public nodes of other users, the caller's own are dropped here and not in the query.
+        None when the catalog is over max_entries.
+        """
+        entries = self.entries(sort)
+        if entries is None:
+            return None
+        return [pk for pk, owner in entries if owner != user.id]
+
+    @staticmethod
+    def query(user, sort):
+        """
+        Public nodes of other users in sort order, read without the cached list.
+        """
+        return Nodes.objects(user__ne=user.id, is_public=1).order_by(SORTS[sort])
+
+    @staticmethod
+    def load(ids):
+        """
+        Nodes of a page in ids order, with one query. Visibility is checked again,
+        a node made private since the entries were cached is left out.
+        """
+        nodes = dict((node.id, node) for node in Nodes.objects(id__in=ids, is_public=1))
+        return [nodes[pk] for pk in ids if pk in nodes]
+
+    def invalidate(self):
+        try:
+            self.cache.incr(VERSION_KEY)
+        except ValueError:
+            self.cache.set(VERSION_KEY, int(time.time() * 1000), None)
+
+
+def create_public_catalog():
+    options = getattr(settings, 'NODES_CATALOG', {})
+    return PublicCatalog(options.get('CACHE', 'default'), options.get('TIMEOUT', 300),
+                         options.get('MAX_ENTRIES', 50000))
+
+
+public_catalog = create_public_catalog()
+
+
+def invalidate_catalog(sender, **kwargs):
+    """
+    mongoengine signal receiver, any saved, inserted or deleted node may change the catalog.
+    """
+    public_catalog.invalidate()
+
+
+signals.post_save.connect(invalidate_catalog, sender=Nodes)
+signals.post_delete.connect(invalidate_catalog, sender=Nodes)
+signals.post_bulk_insert.connect(invalidate_catalog, sender=Nodes)
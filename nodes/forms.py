@@ -1,4 +1,5 @@
 from django import forms
+from django.utils import six
 from cloud_platform.helpers import is_objectid_valid
 
 
@@ -21,6 +22,36 @@ class NodeDuplicateForm(forms.Form):
         copy_count = self.cleaned_data.get('count')
         if not is_objectid_valid(node_id):
             raise forms.ValidationError('%s is not valid ObjectId.' % node_id)
-        if 1 > copy_count < 100:
+        if copy_count is None or not 1 <= copy_count <= 100:
             raise forms.ValidationError('duplicate copy count must be in range of 1 to 100.')
         return self.cleaned_data
+
+
+class NodeBulkItemForm(forms.Form):
+    """
+    One node of a bulk provisioning payload, validated without any query.
+    Label uniqueness is checked for the whole payload at once by the view.
+    """
+    label = forms.CharField(min_length=4, max_length=28)
+    secretkey = forms.CharField(max_length=16)
+    is_public = forms.IntegerField(required=False, min_value=0, max_value=1)
+    pubsperday = forms.IntegerField(required=False, min_value=-1)
+    sensors = forms.Field(required=False)
+
+    def clean_label(self):
+        label = self.cleaned_data.get('label')
+        # _SELF_ refers to supernode whom has sensors module
+        if '_SELF_' == label:
+            raise forms.ValidationError('_SELF_ is reserved word.')
+        return label
+
+    def clean_sensors(self):
+        sensors = self.cleaned_data.get('sensors') or []
+        if not isinstance(sensors, list):
+            raise forms.ValidationError('Expected a list of sensor labels.')
+        for label in sensors:
+            if not isinstance(label, six.string_types) or not 4 <= len(label) <= 28:
+                raise forms.ValidationError('Sensor label must be a string of 4 to 28 characters.')
+        if len(set(sensors)) != len(sensors):
+            raise forms.ValidationError('Sensor labels must be unique.')
+        return sensors
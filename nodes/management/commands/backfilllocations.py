@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from nodes.models import Nodes
+from supernodes.models import Supernodes
+
+
+class Command(BaseCommand):
+    help = "Set GeoJSON location of nodes and supernodes saved before it existed, from their coordinates."
+
+    def handle(self, *args, **options):
+        for document in (Supernodes, Nodes):
+            # update with aggregation pipeline (MongoDB 4.2), positions are copied server-side
+            result = document._get_collection().update_many(
+                # out of range positions are rejected by the 2dsphere index, they are left as they are
+                {'coordinates.lat': {'$gte': -90, '$lte': 90}, 'coordinates.long': {'$gte': -180, '$lte': 180}},
+                [{'$set': {'location': {'type': 'Point', 'coordinates': ['$coordinates.long', '$coordinates.lat']}}}]
+            )
+            unset = document._get_collection().update_many(
+                {'coordinates': None, 'location': {'$exists': True}}, {'$unset': {'location': ''}}
+            )
+            self.stdout.write("%s: %d located, %d without coordinates"
+                              % (document._get_collection_name(), result.modified_count, unset.modified_count))
@@ -1,14 +1,17 @@
+import datetime
+
 from mongoengine.document import Document, EmbeddedDocument
+from mongoengine.queryset import QuerySetManager, queryset_manager
 from mongoengine import StringField, IntField, FloatField, ReferenceField, EmbeddedDocumentField, \
-    EmbeddedDocumentListField, CASCADE
+    EmbeddedDocumentListField, BooleanField, PointField, CASCADE
 from sensors.models import Sensors
 from users.models import User
 from supernodes.models import Supernodes
 
 
 class Coordinates(EmbeddedDocument):
-    lat = FloatField(required=True, null=False)
-    long = FloatField(required=True, null=False)
+    lat = FloatField(required=True, null=False, min_value=-90, max_value=90)
+    long = FloatField(required=True, null=False, min_value=-180, max_value=180)
 
     def __unicode__(self):
         return str([self.lat, self.long])
@@ -22,5 +25,49 @@ class Nodes(Document):
     is_public = IntField(default=0)
     pubsperday = IntField(default=0)
     pubsperdayremain = IntField(default=0)
+    # day (YYYYMMDD) pubsperdayremain belongs to, it is reset lazily on first publish of a new day
+    pubsday = IntField(default=0)
     sensors = EmbeddedDocumentListField(document_type=Sensors)
     coordinates = EmbeddedDocumentField(document_type=Coordinates, required=False, null=True)
+    # GeoJSON point of coordinates, set on save, mongoengine creates its 2dsphere index
+    location = PointField(required=False, null=True)
+    # set on delete, the document and its sensordatas are removed later by a deletion job
+    is_deleted = BooleanField(default=False)
+
+    # deleted documents included, for deletion jobs
+    all_objects = QuerySetManager()
+
+    @queryset_manager
+    def objects(doc_cls, queryset):
+        return queryset.filter(is_deleted__ne=True)
+
+    def clean(self):
+        # GeoJSON order is longitude first
+        self.location = [self.coordinates.long, self.coordinates.lat] if self.coordinates else None
+
+    meta = {
+        'indexes': [
+            {
+                'fields': ['user', 'label']
+            },
+            {
+                'fields': ['label']
+            },
+            # public node catalog (nodes.catalog), partial indexes hold public nodes only
+            {
+                'fields': ['is_public', '-id'],
+                'partialFilterExpression': {'is_public': 1}
+            },
+            {
+                'fields': ['is_public', 'label'],
+                'partialFilterExpression': {'is_public': 1}
+            },
+        ],
+    }
+
+
+def quota_day(day=None):
+    """
+    Day stamp of publish quota, e.g. 20170131 for local date 2017-01-31.
+    """
+    return int((day or datetime.date.today()).strftime('%Y%m%d'))
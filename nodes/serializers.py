@@ -2,7 +2,7 @@ from collections import OrderedDict
 
 from rest_framework import serializers
 from rest_framework_mongoengine.serializers import DocumentSerializer
-from nodes.models import Nodes, Coordinates
+from nodes.models import Nodes, Coordinates, quota_day
 from supernodes.models import Supernodes
 from users.models import User
 
@@ -17,6 +17,7 @@ class NodeSerializer(DocumentSerializer):
         lookup_field='pk'
     )
     sensor_count = serializers.SerializerMethodField()
+    pubsperdayremain = serializers.SerializerMethodField()
     sensors_list = serializers.HyperlinkedIdentityField(
         view_name='node-sensors-list',
         lookup_field='pk'
@@ -53,9 +54,14 @@ class NodeSerializer(DocumentSerializer):
     def get_sensor_count(obj):
         return obj.sensors.count()
 
+    @staticmethod
+    def get_pubsperdayremain(obj):
+        # quota is reset lazily on first publish of a day, a stamp of another day means untouched today
+        return obj.pubsperdayremain if quota_day() == obj.pubsday else obj.pubsperday
+
     class Meta:
         model = Nodes
-        exclude = ('sensors',)
+        exclude = ('sensors', 'pubsday', 'is_deleted', 'location')
 
     def create(self, validated_data):
         node = Nodes.objects.create(**validated_data)
@@ -7,6 +7,8 @@ urlpatterns = [
     url(r'^$', node_views.NodesList.as_view(), name="nodes-all"),
     url(r'^reset/$', node_views.NodePublishReset.as_view(), name="nodes-reset"),
     url(r'^duplicate/$', node_views.NodeDuplicate.as_view(), name="nodes-duplicate"),
+    url(r'^bulk/$', node_views.NodeBulkCreate.as_view(), name="nodes-bulk"),
+    url(r'^clusters/$', node_views.NodeClusters.as_view(), name="nodes-clusters"),
     url(r'^(?P<pk>\w+)/$', node_views.NodeDetail.as_view(), name="nodes-detail"),
     url(r'^(?P<pk>\w+)/sensor/$', sensor_views.SensorsList.as_view(), name="node-sensors-list"),
     url(r'^(?P<pk>\w+)/sensor/(?P<sensorid>\w+)/$', sensor_views.SensorDetail.as_view(), name="node-sensor-detail"),
@@ -1,15 +1,25 @@
-from django.http import Http404, QueryDict
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+from django.http import QueryDict
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework_mongoengine.generics import ListAPIView, GenericAPIView
 from authenticate.authentication import JSONWebTokenAuthentication
-from authenticate.permissions import IsUser
-from nodes.models import Nodes
+from authenticate.permissions import IsUser, get_permitted, owned_by, visible_to
+from nodes.catalog import public_catalog, SORTS
+from nodes.models import Nodes, quota_day
 from supernodes.models import Supernodes
 from nodes.serializers import NodeSerializer
-from nodes.forms import NodePublishResetForm, NodeDuplicateForm
+from nodes.forms import NodePublishResetForm, NodeDuplicateForm, NodeBulkItemForm
+from sensors.models import Sensors, SensorIndex
+from sensors.index import index_parents
+from jobs.deletion import delete_node
+from jobs.serializers import DeletionJobSerializer
 
-from cloud_platform.helpers import is_objectid_valid, is_url_regex_match
+from cloud_platform import settings
+from cloud_platform.helpers import is_objectid_valid, is_url_regex_match, prefetch_references, geo_lookup, \
+    parse_bbox, bbox_geometry
+from users.models import User
 
 
 class NodesList(ListAPIView):
@@ -21,8 +31,13 @@ class NodesList(ListAPIView):
     /nodes/                => retrieve all authenticated user nodes
     /nodes/?role=public    => retrieve authenticated user public nodes
     /nodes/?role=private   => retrieve authenticated user private nodes
-    /nodes/?role=global    => retrieve all public nodes from other users
+    /nodes/?role=global    => retrieve all public nodes from other users, ?sort=newest|oldest|label|-label
     /supernodes/:id/nodes/ => retrieve all specific supernode nodes
+
+    Spatial filters, combined with the above:
+    ?near=<lat>,<long>&distance=<meters>   => nodes within distance (default 1000) of a point
+    ?polygon=<lat>,<long>;<lat>,<long>;... => nodes inside a polygon
+    ?bbox=<south>,<west>,<north>,<east>    => nodes inside a bounding box
     """
     authentication_classes = (JSONWebTokenAuthentication,)
     permission_classes = (IsUser,)
@@ -50,7 +65,36 @@ class NodesList(ListAPIView):
             else:  # private
                 return Nodes.objects.filter(user=user, is_public=0)
 
+    def get_catalog(self, request):
+        """
+        Public nodes of other users from the cached catalog, ?sort=newest|oldest|label|-label.
+        """
+        sort = request.GET.get('sort', 'newest')
+        if sort not in SORTS:
+            return Response({
+                'sort': ['This field must be one of %s.' % ', '.join(sorted(SORTS))]
+            }, status=status.HTTP_400_BAD_REQUEST)
+        visible = public_catalog.visible_to(request.user, sort)
+        if visible is None:
+            # catalog over NODES_CATALOG MAX_ENTRIES, paged by the query
+            queryset = public_catalog.query(request.user, sort)
+            page = self.paginate_queryset(queryset)
+            nodes = list(queryset) if page is None else page
+        else:
+            page = self.paginate_queryset(visible)
+            nodes = public_catalog.load(visible if page is None else page)
+        prefetch_references(nodes, 'user', User, ('username',))
+        prefetch_references(nodes, 'supernode', Supernodes, ('label',))
+        serializer = NodeSerializer(nodes, many=True, context={'request': request})
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
     def get(self, request, *args, **kwargs):
+        try:
+            geo = geo_lookup(request.GET)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         # check if request came from supernodes urls
         if is_url_regex_match(r'^/supernodes/(?P<pk>\w+)/nodes/', request.get_full_path()):
             if not is_objectid_valid(kwargs.get('pk')):
@@ -61,14 +105,25 @@ class NodesList(ListAPIView):
                 self.get_nodes(request.user, kwargs.get('pk'), request.GET.get('role'))
             )
         else:
+            if 'global' == request.GET.get('role') and not geo:
+                return self.get_catalog(request)
             queryset = self.filter_queryset(self.get_nodes(user=request.user, role=request.GET.get('role')))
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = NodeSerializer(page, many=True, context={'request': request})
-            return self.get_paginated_response(serializer.data)
+        queryset = queryset.filter(**geo)
+        try:
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                # SlugRelatedField would dereference user and supernode of every node
+                prefetch_references(page, 'user', User, ('username',))
+                prefetch_references(page, 'supernode', Supernodes, ('label',))
+                serializer = NodeSerializer(page, many=True, context={'request': request})
+                return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+            serializer = self.get_serializer(queryset, many=True)
+            return Response(serializer.data)
+        except OperationFailure:
+            if not geo:
+                raise
+            return Response({'detail': 'This area can not be queried.'}, status=status.HTTP_400_BAD_REQUEST)
 
     @staticmethod
     def post(request):
@@ -103,23 +158,12 @@ class NodeDetail(GenericAPIView):
     authentication_classes = (JSONWebTokenAuthentication,)
     permission_classes = (IsUser,)
 
-    @staticmethod
-    def get_object(pk):
-        try:
-            return Nodes.objects.get(pk=pk)
-        except Exception:
-            raise Http404
-
     def get(self, request, pk, format=None):
         if not is_objectid_valid(pk):
             return Response({
                 'detail': '%s is not valid ObjectId.' % pk
             }, status=status.HTTP_400_BAD_REQUEST)
-        node = self.get_object(pk)
-        if request.user != node.user and 0 == node.is_public:
-            return Response({
-                'detail': 'Not found.'
-            }, status=status.HTTP_404_NOT_FOUND)
+        node = get_permitted(Nodes, {'pk': pk}, visible_to(request.user))
         serializer = NodeSerializer(node, context={'request': request})
         return Response(serializer.data)
 
@@ -128,11 +172,8 @@ class NodeDetail(GenericAPIView):
             return Response({
                 'detail': '%s is not valid ObjectId.' % pk
             }, status=status.HTTP_400_BAD_REQUEST)
-        node = self.get_object(pk)
-        if request.user != node.user:
-            return Response({
-                'detail': 'You can not update another person node.'
-            }, status=status.HTTP_403_FORBIDDEN)
+        node = get_permitted(Nodes, {'pk': pk}, owned_by(request.user),
+                             denied='You can not update another person node.')
 
         # SlugRelatedField, avoid 'query does not matching' exception on non valid data payload
         if request.data.get('user'):
@@ -151,13 +192,12 @@ class NodeDetail(GenericAPIView):
             return Response({
                 'detail': '%s is not valid ObjectId.' % pk
             }, status=status.HTTP_400_BAD_REQUEST)
-        node = self.get_object(pk)
-        if request.user != node.user:
-            return Response({
-                'detail': 'You can not delete another person node.'
-            }, status=status.HTTP_403_FORBIDDEN)
-        node.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        node = get_permitted(Nodes, {'pk': pk}, owned_by(request.user), fields=('id',),
+                             denied='You can not delete another person node.')
+        # node is hidden now, its sensordatas are removed by deletionworker
+        job = delete_node(node, request.user)
+        return Response(DeletionJobSerializer(job, context={'request': request}).data,
+                        status=status.HTTP_202_ACCEPTED)
 
 
 class NodePublishReset(GenericAPIView):
@@ -167,22 +207,12 @@ class NodePublishReset(GenericAPIView):
     authentication_classes = (JSONWebTokenAuthentication,)
     permission_classes = (IsUser,)
 
-    @staticmethod
-    def get_object(pk):
-        try:
-            return Nodes.objects.get(pk=pk)
-        except Exception:
-            raise Http404
-
     def post(self, request):
         form = NodePublishResetForm(request.data)
         if form.is_valid():
-            node = self.get_object(form.cleaned_data.get('id'))
-            if request.user != node.user:
-                return Response({
-                    'detail': 'You can not reset  pubsperdayremain of another person node.'
-                }, status=status.HTTP_403_FORBIDDEN)
-            elif -1 == node.pubsperdayremain:
+            node = get_permitted(Nodes, {'pk': form.cleaned_data.get('id')}, owned_by(request.user),
+                                 denied='You can not reset  pubsperdayremain of another person node.')
+            if -1 == node.pubsperdayremain:
                 return Response({
                     'detail': 'You only can not reset node with unlimited pubsperday'
                 }, status=status.HTTP_400_BAD_REQUEST)
@@ -197,21 +227,11 @@ class NodeDuplicate(GenericAPIView):
     authentication_classes = (JSONWebTokenAuthentication,)
     permission_classes = (IsUser,)
 
-    @staticmethod
-    def get_object(pk):
-        try:
-            return Nodes.objects.get(pk=pk)
-        except Exception:
-            raise Http404
-
     def post(self, request):
         form = NodeDuplicateForm(request.data)
         if form.is_valid():
-            node = self.get_object(form.cleaned_data.get('id'))
-            if request.user != node.user:
-                return Response({
-                    'detail': 'You can not duplicate another person node.'
-                }, status=status.HTTP_403_FORBIDDEN)
+            node = get_permitted(Nodes, {'pk': form.cleaned_data.get('id')}, owned_by(request.user),
+                                 denied='You can not duplicate another person node.')
             bulk_insert = []
             for i in range(form.cleaned_data.get('count')):
                 bulk_insert.append(Nodes(
@@ -221,11 +241,185 @@ class NodeDuplicate(GenericAPIView):
                     secretkey=node.secretkey,
                     is_public=node.is_public,
                     pubsperday=node.pubsperday,
-                    pubsperdayremain=node.pubsperday
+                    pubsperdayremain=node.pubsperday,
+                    # sensor ids are unique per sensor, every copy gets its own
+                    sensors=[Sensors(id=ObjectId(), label=sensor.label) for sensor in node.sensors]
                 ))
-            Nodes.objects.insert(bulk_insert)
+            nodes = Nodes.objects.insert(bulk_insert)
+            index_parents(SensorIndex.NODE, [(copy.id, request.user.id, copy.sensors) for copy in nodes])
             return Response(
                 {"results": ("%d duplicate has successfully added." % len(bulk_insert))},
                 status=status.HTTP_201_CREATED
             )
-        return Response(form.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(form.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class NodeBulkCreate(GenericAPIView):
+    """
+    Provision many nodes of a supernode, with their sensors, in one call.
+
+    Payload:
+    {
+        "supernode": "<supernode label>",
+        "nodes": [
+            {"label": "FIELD_A_1", "secretkey": "rahasia", "is_public": 0, "pubsperday": 96,
+             "sensors": ["TEMP", "HUMIDITY"]},
+            ...
+        ]
+    }
+
+    Label uniqueness is checked with one query and valid nodes are written with one bulk insert.
+    Every item gets its own result, invalid items do not prevent the others from being created.
+    """
+    authentication_classes = (JSONWebTokenAuthentication,)
+    permission_classes = (IsUser,)
+
+    def post(self, request):
+        if isinstance(request.data, QueryDict):
+            return Response({
+                'detail': 'Payload cannot be empty.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        items = request.data.get('nodes')
+        if not isinstance(items, list) or not items:
+            return Response({'nodes': ['Expected a non empty list.']}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.NODES_BULK_MAX:
+            return Response({
+                'nodes': ['Ensure this list has no more than %d items.' % settings.NODES_BULK_MAX]
+            }, status=status.HTTP_400_BAD_REQUEST)
+        supernode = Supernodes.objects(user=request.user.id, label=request.data.get('supernode')).only('id').first()
+        if supernode is None:
+            return Response({
+                'supernode': ['This field must be valid supernode label.']
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        forms = [NodeBulkItemForm(item if isinstance(item, dict) else {}) for item in items]
+        labels = [form.cleaned_data.get('label') for form in forms if form.is_valid()]
+        taken = set(node.label for node in Nodes.objects(
+            user=request.user.id, supernode=supernode.id, label__in=labels
+        ).only('label'))
+
+        results = []
+        bulk_insert = []
+        seen = set()
+        today = quota_day()
+        for index, form in enumerate(forms):
+            if not form.is_valid():
+                results.append({'index': index, 'status': 'error', 'errors': form.errors})
+                continue
+            data = form.cleaned_data
+            if data.get('label') in taken or data.get('label') in seen:
+                results.append({'index': index, 'status': 'error', 'errors': {'label': ['This field must be unique.']}})
+                continue
+            seen.add(data.get('label'))
+            pubsperday = data.get('pubsperday') or 0
+            node = Nodes(
+                id=ObjectId(),
+                user=request.user,
+                supernode=supernode,
+                label=data.get('label'),
+                secretkey=data.get('secretkey'),
+                is_public=data.get('is_public') or 0,
+                pubsperday=pubsperday,
+                pubsperdayremain=pubsperday,
+                pubsday=today,
+                sensors=[Sensors(id=ObjectId(), label=label) for label in data.get('sensors')]
+            )
+            bulk_insert.append(node)
+            results.append({
+                'index': index,
+                'status': 'created',
+                'id': str(node.id),
+                'label': node.label,
+                'sensors': dict((sensor.label, str(sensor.id)) for sensor in node.sensors)
+            })
+
+        if bulk_insert:
+            Nodes.objects.insert(bulk_insert, load_bulk=False)
+            index_parents(SensorIndex.NODE, [(node.id, request.user.id, node.sensors) for node in bulk_insert])
+        return Response({
+            'created': len(bulk_insert),
+            'failed': len(items) - len(bulk_insert),
+            'results': results
+        }, status=status.HTTP_201_CREATED if bulk_insert else status.HTTP_400_BAD_REQUEST)
+
+
+class NodeClusters(GenericAPIView):
+    """
+    Node counts of a map viewport, aggregated into a grid x grid cells, for the clustered map.
+    Nodes are owned by authenticated user or public, one $geoWithin $group on the 2dsphere index.
+
+    Usage:
+    /nodes/clusters/?bbox=<south>,<west>,<north>,<east>&grid=<cells per side>
+
+    A cluster holds its node count and the mean position of its nodes, id when it is a single node.
+    """
+    authentication_classes = (JSONWebTokenAuthentication,)
+    permission_classes = (IsUser,)
+
+    def get(self, request):
+        try:
+            bbox = parse_bbox(request.GET.get('bbox', ''))
+            geometry = bbox_geometry(bbox)
+        except (TypeError, ValueError):
+            return Response({
+                'bbox': ['This field must be south,west,north,east.']
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            grid = int(request.GET.get('grid', settings.NODES_CLUSTER_GRID))
+        except ValueError:
+            return Response({
+                'grid': ['This field must be an integer.']
+            }, status=status.HTTP_400_BAD_REQUEST)
+        grid = max(1, min(grid, settings.NODES_CLUSTER_MAX_GRID))
+
+        south, west, north, east = bbox
+        width, height = (east - west) / grid, (north - south) / grid
+        long = {'$arrayElemAt': ['$location.coordinates', 0]}
+        lat = {'$arrayElemAt': ['$location.coordinates', 1]}
+
+        pipeline = [
+            {'$match': {
+                'location': {'$geoWithin': {'$geometry': geometry}},
+                'is_deleted': {'$ne': True},
+                '$or': [{'user': request.user.id}, {'is_public': 1}]
+            }},
+            {'$group': {
+                # points on the north or east edge, or just outside the box, belong to the nearest cell
+                '_id': {
+                    'x': {'$max': [0, {'$min': [
+                        grid - 1, {'$floor': {'$divide': [{'$subtract': [long, west]}, width]}}
+                    ]}]},
+                    'y': {'$max': [0, {'$min': [
+                        grid - 1, {'$floor': {'$divide': [{'$subtract': [lat, south]}, height]}}
+                    ]}]}
+                },
+                'count': {'$sum': 1},
+                'lat': {'$avg': lat},
+                'long': {'$avg': long},
+                'node': {'$first': '$_id'}
+            }},
+            {'$sort': {'count': -1}}
+        ]
+
+        try:
+            cells = list(Nodes._get_collection().aggregate(pipeline))
+        except OperationFailure:
+            return Response({
+                'bbox': ['This area can not be queried.']
+            }, status=status.HTTP_400_BAD_REQUEST)
+        clusters = []
+        for cell in cells:
+            x, y = int(cell['_id']['x']), int(cell['_id']['y'])
+            clusters.append({
+                'count': cell['count'],
+                'lat': cell['lat'],
+                'long': cell['long'],
+                'bounds': [south + y * height, west + x * width, south + (y + 1) * height, west + (x + 1) * width],
+                'id': str(cell['node']) if 1 == cell['count'] else None
+            })
+        return Response({
+            'bbox': [south, west, north, east],
+            'grid': grid,
+            'count': sum(cluster['count'] for cluster in clusters),
+            'clusters': clusters
+        })
@@ -0,0 +1,117 @@
+"""
+Compact delta encoding of supernode sensor readings (encoding "delta-v1").
+
+Plain format repeats a [data, timestamp] pair per reading. The compact one keeps a table of
+sensor labels and one stream per sensor, referenced by index:
+
+    {
+        "encoding": "delta-v1",
+        "label": "FILKOM_1",
+        "t0": 1500000000,                  # base epoch (seconds)
+        "sensors": ["TEMP", "HUMIDITY"],   # index table
+        "precision": [1, 0],               # decimal digits kept, per sensor
+        "streams": [
+            [0, [0, 60, 60], [253, 1, -2]],  # sensor index, timestamp deltas, value deltas
+            ...
+        ],
+        "nodes": [], "testing": false
+    }
+
+Timestamp deltas start from t0, value deltas from 0, values are integers scaled by
+10 ** precision. decode() returns the plain format, so it goes through the normal
+validation and ingestion path.
+"""
+
+ENCODING = 'delta-v1'
+
+# precision above this would not fit a float mantissa anyway
+MAX_PRECISION = 9
+
+
+def encode(label, readings, precision=None, default_precision=2):
+    """
+    readings: list of (sensor label, data, unix timestamp), precision: {sensor label: digits}.
+    """
+    precision = precision or {}
+    labels = []
+    streams = {}
+    for sensor, data, timestamp in readings:
+        if sensor not in streams:
+            streams[sensor] = []
+            labels.append(sensor)
+        streams[sensor].append((int(round(timestamp)), data))
+
+    t0 = min(timestamp for stream in streams.values() for timestamp, _ in stream) if streams else 0
+    encoded = []
+    digits = []
+    for index, sensor in enumerate(labels):
+        digits.append(precision.get(sensor, default_precision))
+        scale = 10 ** digits[-1]
+        times, values = [], []
+        last_time, last_value = t0, 0
+        for timestamp, data in streams[sensor]:
+            value = int(round(data * scale))
+            times.append(timestamp - last_time)
+            values.append(value - last_value)
+            last_time, last_value = timestamp, value
+        encoded.append([index, times, values])
+
+    return {
+        'encoding': ENCODING,
+        'label': label,
+        't0': t0,
+        'sensors': labels,
+        'precision': digits,
+        'streams': encoded
+    }
+
+
+def decode(payload):
+    """
+    Return payload in plain supernode format, raise ValueError when it is malformed.
+    """
+    try:
+        t0 = payload['t0']
+        labels = payload['sensors']
+        digits = payload['precision']
+        streams = payload['streams']
+    except (KeyError, TypeError):
+        raise ValueError("Expected t0, sensors, precision and streams.")
+    if not isinstance(t0, int):
+        raise ValueError("t0: Expected int.")
+    if not isinstance(labels, list) or not isinstance(digits, list) or len(labels) != len(digits):
+        raise ValueError("sensors and precision must be lists of the same length.")
+    if not isinstance(streams, list):
+        raise ValueError("streams: Expected a list.")
+
+    sensors = []
+    for position, stream in enumerate(streams):
+        try:
+            index, times, values = stream
+            label, precision = labels[index], digits[index]
+        except (TypeError, ValueError, IndexError):
+            raise ValueError("streams[%d]: Expected [sensor index, timestamp deltas, value deltas]." % position)
+        if not isinstance(index, int) or index < 0:
+            raise ValueError("streams[%d]: Expected a sensor index." % position)
+        if not isinstance(times, list) or not isinstance(values, list) or len(times) != len(values):
+            raise ValueError("streams[%d]: deltas must be lists of the same length." % position)
+        if not isinstance(precision, int) or not 0 <= precision <= MAX_PRECISION:
+            raise ValueError("precision[%d]: Expected int between 0 and %d." % (index, MAX_PRECISION))
+
+        scale = float(10 ** precision)
+        timestamp, value = t0, 0
+        pairs = []
+        for delta_time, delta_value in zip(times, values):
+            if not isinstance(delta_time, int) or not isinstance(delta_value, int):
+                raise ValueError("streams[%d]: Expected int deltas." % position)
+            timestamp += delta_time
+            value += delta_value
+            pairs.append([value / scale, timestamp])
+        sensors.append({'label': label, 'value': pairs})
+
+    return {
+        'label': payload.get('label'),
+        'sensors': sensors,
+        'nodes': payload.get('nodes', []),
+        'testing': payload.get('testing', False)
+    }
@@ -1,6 +1,27 @@
-from pymongo import MongoClient
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from mongoengine.connection import get_db
+from bson.errors import InvalidId
 from bson.objectid import ObjectId
 from datetime import datetime
+from jobs.deletion import pending_sensors
+
+
+def encode_mark(oid):
+    """
+    Encode sensordata ObjectId as opaque high-water mark for the change feed.
+    """
+    return urlsafe_b64encode(oid.binary).rstrip(b'=').decode('ascii')
+
+
+def decode_mark(mark):
+    """
+    Decode high-water mark produced by encode_mark, return None when it is malformed.
+    """
+    try:
+        raw = urlsafe_b64decode(str(mark) + '=' * (-len(mark) % 4))
+        return ObjectId(raw)
+    except (TypeError, ValueError, InvalidId):
+        return None
 
 
 class SensordatasService:
@@ -8,8 +29,7 @@ class SensordatasService:
         self.server_address = ""
 
     def getbyuser(self, request):
-        client = MongoClient('localhost', 27017)
-        db = client.agrihub_test
+        db = get_db()
         user_id = ObjectId(request.user.id)
         self.server_address = request.get_host()
         resource_address = self.server_address + "/sensordatas/user/" + request.user.username + "/"
@@ -18,7 +38,7 @@ class SensordatasService:
         filter_last = request.GET.get('end')
 
         pipeline = [
-            {"$match": {"user": user_id}},
+            {"$match": {"user": user_id, "is_deleted": {"$ne": True}}},
             {
                 "$lookup": {
                     "from": "user",
@@ -63,6 +83,12 @@ class SensordatasService:
 
         pipeline_count = {"node": {"$in": tmp}}
 
+        # sensordatas of deleted sensors are hidden until their deletion job removes them
+        sensors = pending_sensors()
+        if sensors:
+            pipeline[1]["$match"]["$and"].append({"sensor": {"$nin": sensors}})
+            pipeline_count["sensor"] = {"$nin": sensors}
+
         if filter_from and filter_last:
             query = {
                 "timestamp": {
@@ -89,7 +115,7 @@ class SensordatasService:
             pipeline[1]["$match"]["$and"].append(query)
             pipeline_count.update(query)
         queryset = db.sensordatas.aggregate(pipeline=pipeline)
-        queryset_count = db.sensordatas.count(pipeline_count)
+        queryset_count = db.sensordatas.count_documents(pipeline_count)
         pages = queryset_count / 10
 
         return {
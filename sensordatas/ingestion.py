@@ -0,0 +1,271 @@
+"""
+Sensordatas ingestion engine, shared by the REST endpoint (SensordataFormatSerializer)
+and the MQTT ingestion workers (mqtt-broker/subs.py).
+
+It only depends on mongoengine models so it can run outside of Django.
+Input is normalized: a batch is a list of publishes, a publish is the list of Readings
+one device sent at once. A batch is validated against cached device metadata, node quota
+is charged once per publish, then accepted readings are written with one bulk insert.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from mongoengine import signals
+from pymongo import ReturnDocument
+
+from nodes.models import Nodes, quota_day
+from sensordatas.models import Sensordatas
+from supernodes.models import Supernodes
+
+# supernode, node: ObjectId (node is None for supernode sensors), sensor: sensor ObjectId
+Reading = namedtuple('Reading', ('supernode', 'node', 'sensor', 'value', 'timestamp'))
+
+# written: readings inserted, rejected: readings failing validation,
+# limited: publishes dropped because node has no remaining publish this day
+IngestionResult = namedtuple('IngestionResult', ('written', 'rejected', 'limited'))
+
+STAMP_COLLECTION = 'device_stamp'
+
+
+class DeviceEntry(object):
+    """
+    Metadata of a node or supernode, sensors is the set of its sensor ids, labels maps
+    sensor label to sensor id.
+    pubsperday is -1 for unlimited nodes, None for supernodes (no publish limit).
+    """
+    __slots__ = ('id', 'supernode', 'pubsperday', 'sensors', 'labels', 'expires')
+
+    def __init__(self, id, supernode=None, pubsperday=None, sensors=None, labels=None, expires=0):
+        self.id = id
+        self.supernode = supernode
+        self.pubsperday = pubsperday
+        self.labels = labels or {}
+        self.sensors = sensors or set(self.labels.values())
+        self.expires = expires
+
+
+class DeviceStamp(object):
+    """
+    Version of device metadata shared by every process through one document, bumped on every
+    change of a node or supernode. A process checking it drops its cached metadata once it moved,
+    at most one query per interval.
+    """
+
+    def __init__(self, interval=1):
+        self.interval = interval
+        self.version = None
+        self.checked = 0
+
+    @staticmethod
+    def collection():
+        return Nodes._get_db()[STAMP_COLLECTION]
+
+    @classmethod
+    def bump(cls):
+        cls.collection().update_one({'_id': 'devices'}, {'$inc': {'version': 1}}, upsert=True)
+
+    def changed(self):
+        """
+        True once when the shared version moved since the previous check.
+        """
+        now = time.time()
+        if now < self.checked + self.interval:
+            return False
+        self.checked = now
+        raw = self.collection().find_one({'_id': 'devices'})
+        version = raw['version'] if raw else 0
+        changed = self.version is not None and version != self.version
+        self.version = version
+        return changed
+
+
+class DeviceCache(object):
+    """
+    TTL cache of device metadata keyed by (collection, id), loaded with one projected query.
+    Unknown devices are cached as None, so a bad id does not cost a query per reading.
+    With a DeviceStamp, changes made by other processes drop the cache before the ttl is over.
+    """
+
+    def __init__(self, ttl=60, stamp=None):
+        self.ttl = ttl
+        self.stamp = stamp
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, document, pk):
+        if self.stamp is not None and self.stamp.changed():
+            with self.lock:
+                self.entries.clear()
+        key = (document._get_collection_name(), pk)
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < time.time():
+            entry = (self.load(document, pk), time.time() + self.ttl)
+            with self.lock:
+                self.entries[key] = entry
+        return entry[0]
+
+    def node(self, pk):
+        return self.get(Nodes, pk)
+
+    def supernode(self, pk):
+        return self.get(Supernodes, pk)
+
+    @staticmethod
+    def load(document, pk):
+        fields = ('id', 'sensors', 'supernode', 'pubsperday') if document is Nodes else ('id', 'sensors')
+        raw = document.objects(id=pk).only(*fields).as_pymongo().first()
+        if raw is None:
+            return None
+        return DeviceEntry(
+            raw['_id'],
+            supernode=raw.get('supernode') if document is Nodes else raw['_id'],
+            pubsperday=raw.get('pubsperday', 0) if document is Nodes else None,
+            labels=dict((sensor.get('label'), sensor.get('id')) for sensor in raw.get('sensors', []))
+        )
+
+    def invalidate(self, document, *pks):
+        """
+        Drop cached metadata of devices and tell other processes through the stamp.
+        """
+        with self.lock:
+            for pk in pks:
+                self.entries.pop((document._get_collection_name(), pk), None)
+        DeviceStamp.bump()
+
+
+class IngestionEngine(object):
+    def __init__(self, cache=None):
+        self.cache = cache or DeviceCache(ttl=60, stamp=DeviceStamp(interval=1))
+
+    def validate(self, reading):
+        """
+        Return reading with a float value, or None when it does not match device metadata.
+        """
+        return self.check(reading)[0]
+
+    def check(self, reading):
+        """
+        Return (validated reading, device metadata), or (None, None) when reading is not valid.
+        """
+        if reading.node is not None:
+            device = self.cache.node(reading.node)
+            if device is None or (reading.supernode is not None and reading.supernode != device.supernode):
+                return None, None
+        else:
+            device = self.cache.supernode(reading.supernode)
+            if device is None:
+                return None, None
+        if reading.sensor not in device.sensors:
+            return None, None
+        try:
+            value = float(reading.value)
+        except (TypeError, ValueError):
+            return None, None
+        return reading._replace(supernode=device.supernode, value=value), device
+
+    @staticmethod
+    def charge(node, count):
+        """
+        Take up to count publishes from node quota of today, return how many were granted.
+
+        One conditional atomic update: a quota last charged on a previous day is first reset
+        to pubsperday (lazy daily reset, no midnight sweep), then decremented without going
+        below zero. Exhausted nodes do not match, so they cost no write.
+        """
+        today = quota_day()
+        before = Nodes._get_collection().find_one_and_update(
+            {'_id': node, '$or': [{'pubsday': {'$ne': today}}, {'pubsperdayremain': {'$gt': 0}}]},
+            [
+                {'$set': {'pubsperdayremain': {
+                    '$cond': [{'$eq': ['$pubsday', today]}, '$pubsperdayremain', '$pubsperday']
+                }}},
+                {'$set': {
+                    'pubsday': today,
+                    'pubsperdayremain': {'$max': [0, {'$subtract': ['$pubsperdayremain', count]}]}
+                }},
+            ],
+            projection={'pubsday': True, 'pubsperday': True, 'pubsperdayremain': True},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return 0
+        if today == before.get('pubsday'):
+            available = before.get('pubsperdayremain', 0)
+        else:
+            available = before.get('pubsperday', 0)
+        return max(0, min(count, available))
+
+    def ingest(self, publishes, testing=False):
+        """
+        Validate, charge and write a batch of publishes. When testing, nothing is written or charged.
+        """
+        accepted = []
+        rejected = 0
+        # pubsperday of validated nodes, kept so the cache is not asked again after a stamp change
+        limits = {}
+        for publish in publishes:
+            readings = []
+            for reading in publish:
+                reading, device = self.check(reading)
+                if reading is None:
+                    rejected += 1
+                else:
+                    readings.append(reading)
+                    if reading.node is not None:
+                        limits[reading.node] = device.pubsperday
+            if readings:
+                accepted.append(readings)
+
+        # one charge per limited node per batch, publishes over quota are dropped in order
+        requested = {}
+        for readings in accepted:
+            node = readings[0].node
+            if node is not None and -1 != limits[node]:
+                requested[node] = requested.get(node, 0) + 1
+        granted = dict(
+            (node, count if testing else self.charge(node, count)) for node, count in requested.items()
+        )
+
+        documents = []
+        limited = 0
+        for readings in accepted:
+            node = readings[0].node
+            if node in granted:
+                if granted[node] <= 0:
+                    limited += 1
+                    continue
+                granted[node] -= 1
+            documents.extend(
+                Sensordatas(supernode=reading.supernode, node=reading.node, sensor=reading.sensor,
+                            data=reading.value, timestamp=reading.timestamp)
+                for reading in readings
+            )
+
+        if documents and not testing:
+            Sensordatas.objects.insert(documents, load_bulk=False)
+        return IngestionResult(len(documents), rejected, limited)
+
+
+engine = IngestionEngine()
+
+
+def invalidate_device(sender, document, **kwargs):
+    """
+    mongoengine signal receiver, drop cached metadata of the saved or deleted device.
+    Other processes (MQTT workers) drop theirs on the next stamp check.
+    """
+    engine.cache.invalidate(sender, document.id)
+
+
+def invalidate_inserted(sender, documents, **kwargs):
+    """
+    mongoengine signal receiver, inserted devices may be cached as unknown.
+    """
+    engine.cache.invalidate(sender, *[document.id for document in documents])
+
+
+for _sender in (Nodes, Supernodes):
+    signals.post_save.connect(invalidate_device, sender=_sender)
+    signals.post_delete.connect(invalidate_device, sender=_sender)
+    signals.post_bulk_insert.connect(invalidate_inserted, sender=_sender)
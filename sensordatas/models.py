@@ -11,3 +11,14 @@ class Sensordatas(Document):
     sensor = ObjectIdField(required=True)
     data = FloatField()
     timestamp = DateTimeField(default=datetime.datetime.now())
+
+    meta = {
+        'indexes': [
+            {
+                'fields': ['node', 'id']
+            },
+            {
+                'fields': ['supernode', 'id']
+            },
+        ],
+    }
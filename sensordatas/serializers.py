@@ -5,6 +5,8 @@ from rest_framework import serializers
 from rest_framework.fields import ListField, CharField
 from rest_framework.reverse import reverse
 from rest_framework_mongoengine.serializers import DocumentSerializer
+from bson.objectid import ObjectId
+from sensordatas.ingestion import DeviceEntry, Reading, engine
 from sensordatas.models import Sensordatas
 from supernodes.models import Supernodes
 from nodes.models import Nodes
@@ -40,10 +42,10 @@ class SensordataSerializer(DocumentSerializer):
 
     @staticmethod
     def getsensorlabel(obj):
-        if obj.node:
-            return obj.node.sensors.get(id=obj.sensor).label
-        else:
-            return obj.supernode.sensors.get(id=obj.sensor).label
+        sensors = obj.node.sensors if obj.node else obj.supernode.sensors
+        # sensor may be deleted while its sensordatas still exist (failed deletion job)
+        sensor = sensors.filter(id=obj.sensor).first()
+        return sensor.label if sensor else None
 
     def validate(self, data):
         super(SensordataSerializer, self).validate(data)
@@ -80,6 +82,19 @@ class SensordataSerializer(DocumentSerializer):
         return pub
 
 
+class SensordataChangeSerializer(serializers.Serializer):
+    """
+    Compact representation for change feed rows, it works with raw documents
+    (QuerySet.as_pymongo) so no reference will be dereferenced.
+    """
+    id = serializers.CharField(source='_id')
+    supernode = serializers.CharField()
+    node = serializers.CharField(default=None)
+    sensor = serializers.CharField()
+    data = serializers.FloatField()
+    timestamp = serializers.DateTimeField()
+
+
 class SensordataFormatSerializer(DocumentSerializer):
     label = CharField()
     sensors = ListField(required=False)
@@ -92,10 +107,11 @@ class SensordataFormatSerializer(DocumentSerializer):
 
     @staticmethod
     def get_node(supenodeid, nodeid):
-        try:
-            return Nodes.objects.get(supernode=supenodeid, id=nodeid)
-        except Nodes.DoesNotExist:
+        # cached metadata of the ingestion engine, which validates the readings against it again
+        node = engine.cache.node(ObjectId(nodeid))
+        if node is None or node.supernode != supenodeid:
             return False
+        return node
 
     @staticmethod
     def get_node_sensor(nodesensors, sensorlabel):
@@ -104,10 +120,19 @@ class SensordataFormatSerializer(DocumentSerializer):
         except Exception:
             return False
 
+    @staticmethod
+    def get_node_sensor_id(node, sensorlabel):
+        try:
+            return node.labels.get(sensorlabel)
+        except TypeError:
+            return None
+
     def validate(self, attrs):
         super(SensordataFormatSerializer, self).validate(attrs=attrs)
         supernode = self.context.get('request').user
-        node = Nodes()
+        node = DeviceEntry(None)
+        # node metadata by node[i].id, create reads it from here instead of querying again
+        self.devices = {}
         errors = OrderedDict()
         # node sensors
         nodeiderror = []
@@ -139,6 +164,7 @@ class SensordataFormatSerializer(DocumentSerializer):
                             "node[%d].id: Object with label=%s does not exist.." % (index, nodes.get('id'))
                         )
                         continue
+                    self.devices[nodes.get('id')] = node
 
             if not nodes.get('format'):
                 nodeformaterror.append(
@@ -200,7 +226,7 @@ class SensordataFormatSerializer(DocumentSerializer):
                     "node[%d].sensors[%d].label: This field may not be null." % (index, jindex)
                 )
             else:
-                if not self.get_node_sensor(node.sensors, sensor.get('label')):
+                if not self.get_node_sensor_id(node, sensor.get('label')):
                     sensorerror.append(
                         "node[%d].sensors[%d].label: Object with label=%s does not exist.."
                         % (index, jindex, sensor.get('label'))
@@ -284,49 +310,34 @@ class SensordataFormatSerializer(DocumentSerializer):
 
     def create(self, validated_data):
         supernode = self.context.get('request').user
-        supernode_sensors = validated_data.get('sensors')
-        supernode_nodes = validated_data.get('nodes')
-        istesting = validated_data.get('testing')
-        count = 0
+        publishes = []
 
-        # save data from supernode sensors
-        for sensor in supernode_sensors:
+        # sensordata captured from supernode sensors, supernode has no publish limit
+        readings = []
+        for sensor in validated_data.get('sensors'):
             sensor_obj = supernode.sensors.get(label=sensor.get('label'))
             for value in sensor.get('value'):
-                timestamp = self.timestamp_validate(value[1])
-                data = {'supernode': supernode.label, 'sensor': sensor_obj.id,
-                        'data': value[0], 'timestamp': timestamp, 'testing': istesting}
-                serializer = SensordataSerializer(data=data)
-                if serializer.is_valid():
-                    count += 1
-                    serializer.save()
-                else:
-                    raise serializers.ValidationError(serializer.errors)
-            if not istesting:
-                # TODO supernode publish limit?
-                ''' decrement Supernodes pubsperdayremain when node has publish limit '''
-
-        # save data from node sensors
-        for node in supernode_nodes:
-            node_obj = self.get_node(supernode.id, node.get('id'))
+                readings.append(
+                    Reading(supernode.id, None, sensor_obj.id, value[0], self.timestamp_validate(value[1]))
+                )
+        publishes.append(readings)
+
+        # every node entry is one publish, it takes one from node pubsperdayremain
+        for node in validated_data.get('nodes'):
+            node_obj = self.devices[node.get('id')]
+            readings = []
             for sensor in node.get('sensors'):
-                sensor_obj = node_obj.sensors.get(label=sensor.get('label'))
+                sensor_id = node_obj.labels[sensor.get('label')]
                 for value in sensor.get('value'):
-                    timestamp = datetime.fromtimestamp(value[1])
-                    data = {'supernode': supernode.label, 'node': node_obj.label, 'sensor': sensor_obj.id,
-                            'data': value[0], 'timestamp': timestamp, 'testing': istesting}
-                    serializer = SensordataSerializer(data=data)
-                    if serializer.is_valid():
-                        count += 1
-                        serializer.save()
-                    else:
-                        raise serializers.ValidationError(serializer.errors)
-                if not istesting:
-                    ''' decrement Nodes pubsperdayremain when node has publish limit '''
-                    if -1 is not node_obj.pubsperday:
-                        node_obj.pubsperdayremain -= 1
-                        node_obj.save()
-        if 0 != count:
-            return "%d sensordatas has successfully added." % count
+                    readings.append(
+                        Reading(supernode.id, node_obj.id, sensor_id, value[0], self.timestamp_validate(value[1]))
+                    )
+            publishes.append(readings)
+
+        result = engine.ingest(publishes, testing=validated_data.get('testing'))
+        if not result.written and result.limited:
+            raise serializers.ValidationError('publish is limit.')
+        if 0 != result.written:
+            return "%d sensordatas has successfully added." % result.written
         else:
             return "No sensordatas added."
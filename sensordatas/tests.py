@@ -1,3 +1,59 @@
-from django.test import TestCase
+from datetime import datetime
+from bson.objectid import ObjectId
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from nodes.models import Nodes
+from sensordatas import codec
+from sensordatas.helpers import encode_mark, decode_mark
+from sensordatas.ingestion import DeviceCache, DeviceEntry, IngestionEngine, Reading
+
+
+class ChangeMarkTest(SimpleTestCase):
+    def test_mark_round_trip(self):
+        oid = ObjectId()
+        self.assertEqual(decode_mark(encode_mark(oid)), oid)
+
+    def test_mark_keeps_insertion_order(self):
+        first, second = ObjectId(), ObjectId()
+        self.assertLess(decode_mark(encode_mark(first)), decode_mark(encode_mark(second)))
+
+    def test_invalid_mark(self):
+        self.assertIsNone(decode_mark('not-a-mark'))
+        self.assertIsNone(decode_mark(str(ObjectId())))
+
+
+class IngestionValidateTest(SimpleTestCase):
+    def setUp(self):
+        self.supernode, self.node, self.sensor = ObjectId(), ObjectId(), ObjectId()
+        self.engine = IngestionEngine(DeviceCache(ttl=60))
+        # preloaded metadata, validation does no query
+        entry = DeviceEntry(self.node, supernode=self.supernode, pubsperday=-1, sensors={self.sensor})
+        self.engine.cache.entries[(Nodes._get_collection_name(), self.node)] = (entry, float('inf'))
+
+    def test_valid_reading(self):
+        reading = self.engine.validate(Reading(None, self.node, self.sensor, '21.5', datetime.now()))
+        self.assertEqual(reading.value, 21.5)
+        self.assertEqual(reading.supernode, self.supernode)
+
+    def test_invalid_readings(self):
+        self.assertIsNone(self.engine.validate(Reading(None, self.node, ObjectId(), 1, datetime.now())))
+        self.assertIsNone(self.engine.validate(Reading(ObjectId(), self.node, self.sensor, 1, datetime.now())))
+        self.assertIsNone(self.engine.validate(Reading(None, self.node, self.sensor, 'NaN?', datetime.now())))
+
+
+class DeltaCodecTest(SimpleTestCase):
+    def test_round_trip(self):
+        readings = [('TEMP', 25.3, 1500000000), ('HUM', 61, 1500000001),
+                    ('TEMP', 25.4, 1500000060), ('TEMP', 25.2, 1500000120)]
+        plain = codec.decode(codec.encode('FILKOM_1', readings, {'TEMP': 1, 'HUM': 0}))
+        self.assertEqual(plain['label'], 'FILKOM_1')
+        self.assertEqual(plain['sensors'], [
+            {'label': 'TEMP', 'value': [[25.3, 1500000000], [25.4, 1500000060], [25.2, 1500000120]]},
+            {'label': 'HUM', 'value': [[61.0, 1500000001]]},
+        ])
+
+    def test_malformed(self):
+        payload = codec.encode('FILKOM_1', [('TEMP', 25.3, 1500000000)])
+        payload['streams'][0][0] = 3
+        self.assertRaises(ValueError, codec.decode, payload)
+        self.assertRaises(ValueError, codec.decode, {'t0': 0})
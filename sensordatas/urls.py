@@ -4,14 +4,20 @@ from sensordatas import views
 
 urlpatterns = [
     url(r'^$', views.SensordatasList.as_view(), name="sensordatas-all"),
+    url(r'^heatmap/$', views.SensordatasHeatmap.as_view(), name="sensordata-heatmap"),
     url(r'^(?P<pk>\w+)/$', views.SensordatasDetail.as_view(), name="sensordata-detail"),
     url(r'^user/(?P<user>\w+)/$', views.SensordatasFilterUser.as_view(), name="sensordata-filter-user"),
+    url(r'^user/(?P<user>\w+)/changes/$', views.SensordatasChangesUser.as_view(), name="sensordata-changes-user"),
     url(r'^supernode/(?P<supernode>\w+)/$', views.SensordatasFilterSupernode.as_view(),
         name="sensordata-filter-supernode"),
+    url(r'^supernode/(?P<supernode>\w+)/changes/$', views.SensordatasChangesSupernode.as_view(),
+        name="sensordata-changes-supernode"),
     url(r'^supernode/(?P<supernode>\w+)/sensor/(?P<sensor>\w+)/$',
         views.SensordatasFilterSupernodeSensor.as_view(),name="sensordata-filter-supernode-sensor"),
     url(r'^node/(?P<node>\w+)/$', views.SensordatasFilterNode.as_view(),
         name="sensordata-filter-node"),
+    url(r'^node/(?P<node>\w+)/changes/$', views.SensordatasChangesNode.as_view(),
+        name="sensordata-changes-node"),
     url(r'^node/(?P<node>\w+)/sensor/(?P<sensor>\w+)/$', views.SensordatasFilterNodeSensor.as_view(),
         name="sensordata-filter-node-sensor"),
 ]
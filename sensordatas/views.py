@@ -1,27 +1,34 @@
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
 from django.http import Http404
 from rest_framework import exceptions
 from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.generics import ListAPIView, GenericAPIView
 from rest_framework import status
 from rest_framework.response import Response
-from authenticate.authentication import JSONWebTokenAuthentication
-from authenticate.permissions import IsAuthenticated, IsUser
+from authenticate.authentication import JSONWebTokenAuthentication, SignatureAuthentication
+from authenticate.permissions import IsAuthenticated, IsUser, get_permitted, owned_by, visible_to
+from sensordatas import codec
 from sensordatas.models import Sensordatas
-from sensordatas.serializers import SensordataSerializer, SensordataFormatSerializer
+from sensordatas.serializers import SensordataSerializer, SensordataFormatSerializer, SensordataChangeSerializer
 from nodes.models import Nodes
 from supernodes.models import Supernodes
-from helpers import SensordatasService
+from helpers import SensordatasService, encode_mark, decode_mark
+from jobs.deletion import hide_deleted_sensors, pending_sensors
+from cloud_platform import settings
+from cloud_platform.helpers import parse_bbox, bbox_geometry, grid_cell
 
 
 class SensordatasList(ListAPIView):
-    authentication_classes = (JSONWebTokenAuthentication,)
+    authentication_classes = (JSONWebTokenAuthentication, SignatureAuthentication)
     permission_classes = (IsAuthenticated,)
     queryset = Sensordatas.objects.all()
     serializer_class = SensordataSerializer
 
     @staticmethod
     def post(request):
-        # ensure that only nodes(provided by JWT credentials) can perform this action
+        # ensure that only nodes(provided by JWT credentials or signed request) can perform this action
         if not isinstance(request.user, Supernodes):
             raise exceptions.PermissionDenied("You do not have permission to perform this action.")
 
@@ -29,8 +36,16 @@ class SensordatasList(ListAPIView):
         # if 0 == request.user.pubsperdayremain:
         #     raise exceptions.PermissionDenied("Publish is limit.")
 
+        data = request.data
+        if codec.ENCODING == data.get('encoding'):
+            # compact upload, decoded to the plain format
+            try:
+                data = codec.decode(data)
+            except ValueError as e:
+                return Response({"encoding": [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+
         # validate POST payload format
-        serformat = SensordataFormatSerializer(data=request.data, context={'request': request})
+        serformat = SensordataFormatSerializer(data=data, context={'request': request})
         if serformat.is_valid():
             message = serformat.save()
             return Response(
@@ -91,22 +106,16 @@ class SensordatasFilterSupernode(ListAPIView):
     permission_classes = (IsUser,)
     serializer_class = SensordataSerializer
 
-    @staticmethod
-    def checksupernode(pk):
+    def checksupernode(self, pk):
         """
-        Raise error when Supernodes is not exist.
+        Raise error when Supernodes is not exist or not owned by request user.
         """
-        try:
-            return Supernodes.objects.get(pk=pk)
-        except Exception:
-            raise NotFound(detail="Supernodes with id=%s does not exist." % pk)
+        return get_permitted(Supernodes, {'pk': pk}, owned_by(self.request.user), fields=('id',),
+                             not_found="Supernodes with id=%s does not exist." % pk)
 
     def get_queryset(self):
         supernodeid = self.kwargs['supernode']
         supernode = self.checksupernode(supernodeid)
-        # TODO supernode visibility?
-        # if self.request.user != supernode.user and 0 == supernode.is_public:
-        #     return 'unauthorized'
 
         filter_from = self.request.GET.get('start')
         filter_last = self.request.GET.get('end')
@@ -127,12 +136,8 @@ class SensordatasFilterSupernode(ListAPIView):
             return Sensordatas.objects.filter(supernode=supernode, node=None).order_by('-timestamp')
 
     def get(self, request, *args, **kwargs):
-        raw_queryset = self.get_queryset()
-        if 'unauthorized' == raw_queryset:
-            return Response({
-                'detail': 'Not found.'
-            }, status=status.HTTP_404_NOT_FOUND)
-        queryset = self.filter_queryset(raw_queryset)
+        # sensordatas of deleted sensors wait for their deletion job
+        queryset = hide_deleted_sensors(self.filter_queryset(self.get_queryset()))
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = SensordataSerializer(page, many=True, context={'request': request})
@@ -166,27 +171,15 @@ class SensordatasFilterSupernodeSensor(ListAPIView):
 
     def checksupernode(self, supernode, sensor):
         """
-        Raise error when Nodes is not exist.
-        """
-        try:
-            supernode = Supernodes.objects.get(pk=supernode)
-            sensor = self.checksensor(supernode, sensor)
-            return {
-                'supernode': supernode,
-                'sensor': sensor
-            }
-        except Supernodes.DoesNotExist:
-            raise NotFound(detail="Nodes with id=%s does not exist." % supernode)
-
-    @staticmethod
-    def checksensor(supernode, sensorlabel):
-        """
-        Raise error when Sensors is not exist.
+        Raise error when Supernodes or its Sensors is not exist, or supernode is not owned by request user.
         """
-        try:
-            return supernode.sensors.get(id=sensorlabel)
-        except Exception:
-            raise NotFound(detail="Sensors with id=%s does not exist." % sensorlabel)
+        return {
+            'supernode': get_permitted(
+                Supernodes, {'pk': supernode, 'sensors__id': sensor}, owned_by(self.request.user), fields=('id',),
+                not_found="Sensors with id=%s does not exist on supernode with id=%s." % (sensor, supernode)
+            ),
+            'sensor': ObjectId(sensor)
+        }
 
     def get_queryset(self):
         """
@@ -197,41 +190,33 @@ class SensordatasFilterSupernodeSensor(ListAPIView):
         sensorlabel = self.kwargs['sensor']
 
         supernode_sensor = self.checksupernode(supernodelabel, sensorlabel)
-        # TODO supernode visibility?
-        # if self.request.user != supernode_sensor.get('node').user and 0 == supernode_sensor.get('node').is_public:
-        #     return 'unauthorized'
 
         filter_from = self.request.GET.get('start')
         filter_last = self.request.GET.get('end')
 
         if filter_from and filter_last:
             return Sensordatas.objects.filter(
-                supernode=supernode_sensor.get('supernode').id, sensor=supernode_sensor.get('sensor').id,
+                supernode=supernode_sensor.get('supernode').id, sensor=supernode_sensor.get('sensor'),
                 timestamp__gte=filter_from, timestamp__lte=filter_last
             ).order_by('-timestamp')
         elif filter_from:
             return Sensordatas.objects.filter(
-                supernode=supernode_sensor.get('supernode').id, sensor=supernode_sensor.get('sensor').id,
+                supernode=supernode_sensor.get('supernode').id, sensor=supernode_sensor.get('sensor'),
                 timestamp__gte=filter_from
             ).order_by('-timestamp')
         elif filter_last:
             return Sensordatas.objects.filter(
-                supernode=supernode_sensor.get('supernode').id, sensor=supernode_sensor.get('sensor').id,
+                supernode=supernode_sensor.get('supernode').id, sensor=supernode_sensor.get('sensor'),
                 timestamp__lte=filter_last
             ).order_by('-timestamp')
         else:
             return Sensordatas.objects.filter(
                 supernode=supernode_sensor.get('supernode').id,
-                sensor=supernode_sensor.get('sensor').id
+                sensor=supernode_sensor.get('sensor')
             ).order_by('-timestamp')
 
     def get(self, request, *args, **kwargs):
-        raw_queryset = self.get_queryset()
-        if 'unauthorized' == raw_queryset:
-            return Response({
-                'detail': 'Not found.'
-            }, status=status.HTTP_404_NOT_FOUND)
-        queryset = self.filter_queryset(raw_queryset)
+        queryset = self.filter_queryset(self.get_queryset())
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = SensordataSerializer(page, many=True, context={'request': request})
@@ -263,15 +248,12 @@ class SensordatasFilterNode(ListAPIView):
     permission_classes = (IsUser,)
     serializer_class = SensordataSerializer
 
-    @staticmethod
-    def checknode(pk):
+    def checknode(self, pk):
         """
-        Raise error when Nodes is not exist.
+        Raise error when Nodes is not exist or it is another user private node.
         """
-        try:
-            return Nodes.objects.get(pk=pk)
-        except Exception:
-            raise NotFound(detail="Nodes with id=%s does not exist." % pk)
+        return get_permitted(Nodes, {'pk': pk}, visible_to(self.request.user), fields=('id',),
+                             not_found="Nodes with id=%s does not exist." % pk)
 
     def get_queryset(self):
         """
@@ -280,8 +262,6 @@ class SensordatasFilterNode(ListAPIView):
         """
         nodeid = self.kwargs['node']
         node = self.checknode(nodeid)
-        if self.request.user != node.user and 0 == node.is_public:
-            return 'unauthorized'
 
         filter_from = self.request.GET.get('start')
         filter_last = self.request.GET.get('end')
@@ -298,12 +278,8 @@ class SensordatasFilterNode(ListAPIView):
             return Sensordatas.objects.filter(node=node).order_by('-timestamp')
 
     def get(self, request, *args, **kwargs):
-        raw_queryset = self.get_queryset()
-        if 'unauthorized' == raw_queryset:
-            return Response({
-                'detail': 'Not found.'
-            }, status=status.HTTP_404_NOT_FOUND)
-        queryset = self.filter_queryset(raw_queryset)
+        # sensordatas of deleted sensors wait for their deletion job
+        queryset = hide_deleted_sensors(self.filter_queryset(self.get_queryset()))
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = SensordataSerializer(page, many=True, context={'request': request})
@@ -337,27 +313,15 @@ class SensordatasFilterNodeSensor(ListAPIView):
 
     def checknode(self, node, sensor):
         """
-        Raise error when Nodes is not exist.
+        Raise error when Nodes or its Sensors is not exist, or it is another user private node.
         """
-        try:
-            node = Nodes.objects.get(pk=node)
-            sensor = self.checksensor(node, sensor)
-            return {
-                'node': node,
-                'sensor': sensor
-            }
-        except Nodes.DoesNotExist:
-            raise NotFound(detail="Nodes with id=%s does not exist." % node)
-
-    @staticmethod
-    def checksensor(node, sensorlabel):
-        """
-        Raise error when Sensors is not exist.
-        """
-        try:
-            return node.sensors.get(id=sensorlabel)
-        except Exception:
-            raise NotFound(detail="Sensors with id=%s does not exist." % sensorlabel)
+        return {
+            'node': get_permitted(
+                Nodes, {'pk': node, 'sensors__id': sensor}, visible_to(self.request.user), fields=('id',),
+                not_found="Sensors with id=%s does not exist on node with id=%s." % (sensor, node)
+            ),
+            'sensor': ObjectId(sensor)
+        }
 
     def get_queryset(self):
         """
@@ -368,39 +332,32 @@ class SensordatasFilterNodeSensor(ListAPIView):
         sensorlabel = self.kwargs['sensor']
 
         node_sensor = self.checknode(nodelabel, sensorlabel)
-        if self.request.user != node_sensor.get('node').user and 0 == node_sensor.get('node').is_public:
-            return 'unauthorized'
 
         filter_from = self.request.GET.get('start')
         filter_last = self.request.GET.get('end')
 
         if filter_from and filter_last:
             return Sensordatas.objects.filter(
-                node=node_sensor.get('node').id, sensor=node_sensor.get('sensor').id,
+                node=node_sensor.get('node').id, sensor=node_sensor.get('sensor'),
                 timestamp__gte=filter_from, timestamp__lte=filter_last
             ).order_by('-timestamp')
         elif filter_from:
             return Sensordatas.objects.filter(
-                node=node_sensor.get('node').id, sensor=node_sensor.get('sensor').id,
+                node=node_sensor.get('node').id, sensor=node_sensor.get('sensor'),
                 timestamp__gte=filter_from
             ).order_by('-timestamp')
         elif filter_last:
             return Sensordatas.objects.filter(
-                node=node_sensor.get('node').id, sensor=node_sensor.get('sensor').id,
+                node=node_sensor.get('node').id, sensor=node_sensor.get('sensor'),
                 timestamp__lte=filter_last
             ).order_by('-timestamp')
         else:
             return Sensordatas.objects.filter(
-                node=node_sensor.get('node').id, sensor=node_sensor.get('sensor').id
+                node=node_sensor.get('node').id, sensor=node_sensor.get('sensor')
             ).order_by('-timestamp')
 
     def get(self, request, *args, **kwargs):
-        raw_queryset = self.get_queryset()
-        if 'unauthorized' == raw_queryset:
-            return Response({
-                'detail': 'Not found.'
-            }, status=status.HTTP_404_NOT_FOUND)
-        queryset = self.filter_queryset(raw_queryset)
+        queryset = self.filter_queryset(self.get_queryset())
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = SensordataSerializer(page, many=True, context={'request': request})
@@ -408,3 +365,242 @@ class SensordatasFilterNodeSensor(ListAPIView):
 
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
+
+
+def without_deleted_nodes(scope, supernodes):
+    """
+    Exclude from a supernode scope the sensordatas of its soft-deleted nodes, they still carry
+    the supernode id until the deletion job removes them.
+    """
+    deleted = list(Nodes.all_objects(supernode__in=supernodes, is_deleted=True).scalar('id'))
+    if deleted:
+        scope['node__nin'] = deleted
+    return scope
+
+
+class SensordatasChanges(GenericAPIView):
+    """
+    Base view of sensordata change feed, it has no URL of its own: subclasses give the scope
+    with get_changes_filter, the base one shows nothing.
+    Rows are returned in insertion order (ObjectId), not device timestamp, so a client
+    that mirrors data only receive rows inserted after its last poll.
+
+    Polling:
+    @query ?since=<mark>&&limit=<n>
+
+    Response `next` is an opaque mark that should be sent as `since` on the next poll,
+    `has_more` tells that the next poll will return rows immediately.
+    """
+    authentication_classes = (JSONWebTokenAuthentication,)
+    permission_classes = (IsUser,)
+
+    def get_changes_filter(self, request, **kwargs):
+        """
+        Return mongoengine filter kwargs of the feed scope, or None when it is not visible.
+        """
+        return None
+
+    def get(self, request, *args, **kwargs):
+        since = request.GET.get('since')
+        mark = None
+        if since:
+            mark = decode_mark(since)
+            if mark is None:
+                return Response({
+                    'detail': '%s is not valid mark.' % since
+                }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.GET.get('limit', settings.SENSORDATAS_CHANGES_LIMIT))
+        except ValueError:
+            return Response({
+                'detail': 'limit must be an integer.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.SENSORDATAS_CHANGES_MAX_LIMIT))
+
+        scope = self.get_changes_filter(request, **kwargs)
+        if scope is None:
+            return Response({
+                'detail': 'Not found.'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        scope['id__lt'] = ObjectId.from_datetime(datetime.utcnow() - settings.SENSORDATAS_CHANGES_SETTLE)
+        if mark:
+            scope['id__gt'] = mark
+        sensors = pending_sensors()
+        if sensors:
+            scope['sensor__nin'] = sensors
+
+        # one more row tells whether the client should poll again right away
+        rows = list(Sensordatas.objects(**scope).order_by('id').limit(limit + 1).as_pymongo())
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        return Response({
+            'next': encode_mark(rows[-1]['_id']) if rows else since,
+            'has_more': has_more,
+            'results': SensordataChangeSerializer(rows, many=True).data
+        })
+
+
+class SensordatasChangesNode(SensordatasChanges):
+    """
+    Change feed of node sensordatas.
+    @url /sensordatas/node/<node-id>/changes/
+    """
+
+    def get_changes_filter(self, request, **kwargs):
+        node = get_permitted(Nodes, {'pk': kwargs.get('node')}, visible_to(request.user), fields=('id',),
+                             not_found="Nodes with id=%s does not exist." % kwargs.get('node'))
+        return {'node': node.id}
+
+
+class SensordatasChangesSupernode(SensordatasChanges):
+    """
+    Change feed of every sensordata published by a supernode, including its nodes.
+    @url /sensordatas/supernode/<supernode-id>/changes/
+    """
+
+    def get_changes_filter(self, request, **kwargs):
+        supernode = get_permitted(Supernodes, {'pk': kwargs.get('supernode')}, owned_by(request.user),
+                                  fields=('id',),
+                                  not_found="Supernodes with id=%s does not exist." % kwargs.get('supernode'))
+        return without_deleted_nodes({'supernode': supernode.id}, [supernode.id])
+
+
+class SensordatasChangesUser(SensordatasChanges):
+    """
+    Change feed of every sensordata owned by authenticated user.
+    @url /sensordatas/user/<username>/changes/
+    """
+
+    def get_changes_filter(self, request, **kwargs):
+        if request.user.username != kwargs.get('user'):
+            return None
+        supernodes = list(Supernodes.objects(user=request.user).scalar('id'))
+        return without_deleted_nodes({'supernode__in': supernodes}, supernodes)
+
+
+class SensordatasHeatmap(GenericAPIView):
+    """
+    Readings of one sensor label aggregated into a spatial grid, for field-wide heatmaps.
+    @url /sensordatas/heatmap/?label=<sensor-label>&bbox=<south>,<west>,<north>,<east>
+
+    @query &grid=<cells per side>
+    @query &start=<date-time>&&end=<date-time>   (default: the last SENSORDATAS_HEATMAP_WINDOW)
+    @query &metric=avg|min|max|latest           (value of a node over the window, default avg)
+
+    Nodes owned by authenticated user or public are found with one query on the 2dsphere index,
+    their readings are reduced per node with one $group, then node values are averaged per cell.
+    """
+    authentication_classes = (JSONWebTokenAuthentication,)
+    permission_classes = (IsUser,)
+
+    METRICS = {
+        'avg': {'$avg': '$data'},
+        'min': {'$min': '$data'},
+        'max': {'$max': '$data'},
+        'latest': {'$last': '$data'}
+    }
+
+    @staticmethod
+    def parse_time(value):
+        for time_format in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'):
+            try:
+                return datetime.strptime(value, time_format)
+            except ValueError:
+                continue
+        raise ValueError("%s is not a valid date-time." % value)
+
+    def get(self, request, *args, **kwargs):
+        errors = {}
+        label = request.GET.get('label')
+        if not label:
+            errors['label'] = ['This field is required.']
+        try:
+            bbox = parse_bbox(request.GET.get('bbox', ''))
+            geometry = bbox_geometry(bbox)
+        except (TypeError, ValueError):
+            errors['bbox'] = ['This field must be south,west,north,east.']
+        try:
+            grid = max(1, min(int(request.GET.get('grid', settings.NODES_CLUSTER_GRID)),
+                              settings.NODES_CLUSTER_MAX_GRID))
+        except ValueError:
+            errors['grid'] = ['This field must be an integer.']
+        metric = request.GET.get('metric', 'avg')
+        if metric not in self.METRICS:
+            errors['metric'] = ['This field must be one of %s.' % ', '.join(sorted(self.METRICS))]
+        try:
+            end = self.parse_time(request.GET['end']) if request.GET.get('end') else datetime.now()
+            start = self.parse_time(request.GET['start']) if request.GET.get('start') else \
+                end - settings.SENSORDATAS_HEATMAP_WINDOW
+        except ValueError as e:
+            errors['start'] = [str(e)]
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        south, west, north, east = bbox
+        width, height = (east - west) / grid, (north - south) / grid
+
+        # node id: (sensor id, cell), only nodes having a sensor with the label
+        nodes = {}
+        located = Nodes.objects(
+            visible_to(request.user), sensors__label=label, location__geo_within=geometry
+        ).only('id', 'location', 'sensors').as_pymongo()
+        try:
+            for node in located:
+                long, lat = node['location']['coordinates']
+                sensor = next(sensor['id'] for sensor in node['sensors'] if sensor.get('label') == label)
+                nodes[node['_id']] = (sensor, grid_cell(long, lat, bbox, grid), long, lat)
+        except OperationFailure:
+            return Response({
+                'bbox': ['This area can not be queried.']
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        values = {}
+        if nodes:
+            pipeline = [
+                {'$match': {
+                    'node': {'$in': list(nodes)},
+                    'sensor': {'$in': [sensor for sensor, _, _, _ in nodes.values()]},
+                    # readings are inserted after they are captured, so older ids can be skipped
+                    # on the (node, id) index; timestamps are local time, ObjectIds UTC
+                    '_id': {'$gte': ObjectId.from_datetime(
+                        start - (datetime.now() - datetime.utcnow()) - settings.SENSORDATAS_HEATMAP_CLOCK_SKEW
+                    )},
+                    'timestamp': {'$gte': start, '$lte': end}
+                }},
+                {'$sort': {'timestamp': 1}},
+                {'$group': {'_id': '$node', 'value': self.METRICS[metric], 'readings': {'$sum': 1}}}
+            ]
+            if 'latest' != metric:
+                # only $last depends on order
+                pipeline.pop(1)
+            for row in Sensordatas._get_collection().aggregate(pipeline, allowDiskUse=True):
+                values[row['_id']] = row
+
+        cells = {}
+        for node, (sensor, cell, long, lat) in nodes.items():
+            row = values.get(node)
+            if row is None or row['value'] is None:
+                continue
+            cells.setdefault(cell, []).append((row['value'], row['readings'], long, lat))
+
+        results = []
+        for (x, y), members in sorted(cells.items()):
+            results.append({
+                'bounds': [south + y * height, west + x * width, south + (y + 1) * height, west + (x + 1) * width],
+                'value': sum(member[0] for member in members) / len(members),
+                'nodes': len(members),
+                'readings': sum(member[1] for member in members),
+                'lat': sum(member[3] for member in members) / len(members),
+                'long': sum(member[2] for member in members) / len(members)
+            })
+        return Response({
+            'label': label,
+            'metric': metric,
+            'start': start,
+            'end': end,
+            'bbox': [south, west, north, east],
+            'grid': grid,
+            'cells': results
+        })
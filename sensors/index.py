@@ -0,0 +1,56 @@
+"""
+Keep SensorIndex in sync with the embedded sensors of nodes and supernodes.
+Every write of an embedded sensor list calls one of these right after it.
+"""
+from pymongo import DeleteMany, ReplaceOne
+
+from sensors.models import SensorIndex
+
+
+def entry(kind, parent, owner, sensor):
+    return {'_id': sensor.id, 'parent': parent, 'parent_kind': kind, 'owner': owner, 'label': sensor.label}
+
+
+def index_sensor(kind, parent, owner, sensor):
+    """
+    Add or update one sensor of node or supernode parent.
+    """
+    SensorIndex._get_collection().replace_one(
+        {'_id': sensor.id}, entry(kind, parent, owner, sensor), upsert=True
+    )
+
+
+def index_parents(kind, parents):
+    """
+    Replace index entries of many parents, parents: list of (parent id, owner id, sensors).
+    One bulk write, used by bulk node provisioning, duplication and the backfill.
+    """
+    requests = []
+    for parent, owner, sensors in parents:
+        requests.append(DeleteMany({'parent': parent, '_id': {'$nin': [sensor.id for sensor in sensors]}}))
+        for sensor in sensors:
+            requests.append(ReplaceOne({'_id': sensor.id}, entry(kind, parent, owner, sensor), upsert=True))
+    if requests:
+        SensorIndex._get_collection().bulk_write(requests, ordered=False)
+
+
+def label_taken(document, parent, label):
+    """
+    True when node or supernode parent has a sensor with label, probed on the index.
+    A parent without index entries (saved before the index, until manage.py indexsensors ran)
+    is checked on its embedded sensors.
+    """
+    entries = SensorIndex.objects(parent=parent)
+    if entries.filter(label=label).only('id').first():
+        return True
+    if entries.only('id').first():
+        return False
+    return document.objects(pk=parent, sensors__label=label).only('id').first() is not None
+
+
+def unindex_sensor(sensor):
+    SensorIndex.objects(id=sensor).delete()
+
+
+def unindex_parents(parents):
+    SensorIndex.objects(parent__in=list(parents)).delete()
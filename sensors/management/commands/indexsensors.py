@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from nodes.models import Nodes
+from sensors.index import index_parents
+from sensors.models import Sensors, SensorIndex
+from supernodes.models import Supernodes
+
+
+class Command(BaseCommand):
+    help = "Build the sensor index (sensor_index collection) from embedded sensors of nodes and supernodes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="parents per bulk write")
+
+    def handle(self, *args, **options):
+        seen = {}
+        parents = []
+        for kind, document in ((SensorIndex.SUPERNODE, Supernodes), (SensorIndex.NODE, Nodes)):
+            batch = []
+            count = 0
+            for raw in document.objects.only('id', 'user', 'sensors').as_pymongo():
+                sensors = [Sensors(id=sensor.get('id'), label=sensor.get('label')) for sensor in raw.get('sensors', [])]
+                for sensor in sensors:
+                    # ids of sensors created while Sensors.id default was evaluated once may collide
+                    if sensor.id in seen and seen[sensor.id] != raw['_id']:
+                        self.stderr.write("sensor %s is shared by %s and %s, index keeps the last one"
+                                          % (sensor.id, seen[sensor.id], raw['_id']))
+                    seen[sensor.id] = raw['_id']
+                batch.append((raw['_id'], raw.get('user'), sensors))
+                parents.append(raw['_id'])
+                count += len(sensors)
+                if len(batch) >= options['batch_size']:
+                    index_parents(kind, batch)
+                    batch = []
+            index_parents(kind, batch)
+            self.stdout.write("%s: %d sensors indexed" % (kind, count))
+        # entries of deleted or removed parents
+        stale = SensorIndex.objects(parent__nin=parents).delete()
+        self.stdout.write("%d stale entries removed" % stale)
@@ -1,11 +1,12 @@
 from __future__ import unicode_literals
 import bson
 from mongoengine import StringField, ObjectIdField
-from mongoengine.document import EmbeddedDocument
+from mongoengine.document import Document, EmbeddedDocument
 
 
 class Sensors(EmbeddedDocument):
-    id = ObjectIdField(default=bson.objectid.ObjectId())
+    # callable, a new id for every sensor
+    id = ObjectIdField(default=bson.objectid.ObjectId)
     label = StringField(max_length=28)
 
     meta = {
@@ -19,3 +20,38 @@ class Sensors(EmbeddedDocument):
 
     def __unicode__(self):
         return self.label
+
+
+class SensorIndex(Document):
+    """
+    Top-level copy of every embedded sensor, so a sensor is found with one index probe
+    by its parent (node or supernode) or across the fleet of its owner.
+    Kept in sync with the embedded lists by sensors.index, same id as the embedded sensor.
+    """
+    NODE = 'node'
+    SUPERNODE = 'supernode'
+
+    id = ObjectIdField(primary_key=True)
+    parent = ObjectIdField(required=True)
+    parent_kind = StringField(required=True, choices=(NODE, SUPERNODE))
+    # user id of the parent
+    owner = ObjectIdField(required=True)
+    label = StringField(max_length=28)
+
+    meta = {
+        'collection': 'sensor_index',
+        'indexes': [
+            {
+                'fields': ['parent', 'label']
+            },
+            {
+                'fields': ['parent', 'id']
+            },
+            {
+                'fields': ['owner', 'label']
+            },
+        ],
+    }
+
+    def __unicode__(self):
+        return self.label
@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from rest_framework.reverse import reverse
-from rest_framework_mongoengine.serializers import EmbeddedDocumentSerializer
+from rest_framework_mongoengine.serializers import DocumentSerializer, EmbeddedDocumentSerializer
 from supernodes.models import Supernodes
 from nodes.models import Nodes
-from sensors.models import Sensors
+from sensors.models import Sensors, SensorIndex
+from sensors.index import label_taken
 
 
 class SupernodeSensorSerializer(EmbeddedDocumentSerializer):
@@ -44,16 +45,21 @@ class SupernodeSensorSerializer(EmbeddedDocumentSerializer):
         else:  # when create new Sensor obj
             sensorlabel = self.context['request'].data.get('label')
 
-        supernode = Supernodes.objects.get(pk=self.context.get('supernodeid'))
-        return reverse('sensordata-filter-supernode-sensor', args=[supernode.label, sensorlabel],
+        return reverse('sensordata-filter-supernode-sensor', args=[self.parent_supernode().label, sensorlabel],
                        request=self.context['request'])
 
-    def validate_label(self, value):
-        supernode_id = self.context.get('supernodeid')
+    def parent_supernode(self):
+        """
+        Supernode of the sensors, passed by the view as context['supernode'] or loaded once
+        and kept in the context, which a listing shares between every sensor.
+        """
+        if self.context.get('supernode') is None:
+            self.context['supernode'] = Supernodes.objects.only('label').get(pk=self.context.get('supernodeid'))
+        return self.context['supernode']
 
-        try:
-            Supernodes.objects.get(pk=supernode_id, sensors__label=value)
-        except Supernodes.DoesNotExist:
+    def validate_label(self, value):
+        # (parent, label) index probe instead of loading the supernode
+        if not label_taken(Supernodes, self.context.get('supernodeid'), value):
             # when create new sensor instance
             return value
         if self.context.get('isupdate'):
@@ -101,20 +107,38 @@ class NodeSensorSerializer(EmbeddedDocumentSerializer):
         else:  # when create new Sensor obj
             sensorlabel = self.context['request'].data.get('label')
 
-        node = Nodes.objects.get(pk=self.context.get('nodeid'))
-        return reverse('sensordata-filter-node-sensor', args=[node.label, sensorlabel],
+        return reverse('sensordata-filter-node-sensor', args=[self.parent_node().label, sensorlabel],
                        request=self.context['request'])
 
-    def validate_label(self, value):
-        node_id = self.context.get('nodeid')
+    def parent_node(self):
+        """
+        Node of the sensors, passed by the view as context['node'] or loaded once
+        and kept in the context, which a listing shares between every sensor.
+        """
+        if self.context.get('node') is None:
+            self.context['node'] = Nodes.objects.only('label').get(pk=self.context.get('nodeid'))
+        return self.context['node']
 
-        try:
-            Nodes.objects.get(pk=node_id, sensors__label=value)
-        except Nodes.DoesNotExist:
+    def validate_label(self, value):
+        # (parent, label) index probe instead of loading the node
+        if not label_taken(Nodes, self.context.get('nodeid'), value):
             # when create new sensor instance
             return value
         if self.context.get('isupdate'):
             # when update sensor instance
             return value
         else:
-            raise serializers.ValidationError("This field must be unique.")
\ No newline at end of file
+            raise serializers.ValidationError("This field must be unique.")
+
+
+class SensorIndexSerializer(DocumentSerializer):
+    # extra field
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SensorIndex
+        exclude = ('owner',)
+
+    def get_url(self, obj):
+        view_name = 'node-sensor-detail' if SensorIndex.NODE == obj.parent_kind else 'supernodes-sensors-detail'
+        return reverse(view_name, args=[obj.parent, obj.id], request=self.context['request'])
@@ -0,0 +1,9 @@
+from django.conf.urls import url
+from rest_framework.urlpatterns import format_suffix_patterns
+from sensors import views
+
+urlpatterns = [
+    url(r'^$', views.FleetSensorsList.as_view(), name="sensors-all"),
+]
+
+urlpatterns = format_suffix_patterns(urlpatterns)
@@ -1,15 +1,18 @@
-from django.http import Http404
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework_mongoengine.generics import ListAPIView, GenericAPIView
 from authenticate.authentication import JSONWebTokenAuthentication
-from authenticate.permissions import IsUser
+from authenticate.cache import principal_cache
+from authenticate.permissions import IsUser, get_permitted, owned_by, visible_to
 from cloud_platform.helpers import is_objectid_valid
 from supernodes.models import Supernodes
 from nodes.models import Nodes
-from sensors.models import Sensors
-from sensordatas.models import Sensordatas
-from sensors.serializers import SupernodeSensorSerializer, NodeSensorSerializer
+from sensors.models import Sensors, SensorIndex
+from sensors.index import index_sensor
+from jobs.deletion import delete_sensor
+from sensordatas.ingestion import engine
+from jobs.serializers import DeletionJobSerializer
+from sensors.serializers import SupernodeSensorSerializer, NodeSensorSerializer, SensorIndexSerializer
 
 
 class SensorsList(ListAPIView):
@@ -17,30 +20,20 @@ class SensorsList(ListAPIView):
     permission_classes = (IsUser,)
     serializer_class = NodeSensorSerializer
 
-    @staticmethod
-    def get_object(pk):
-        try:
-            return Nodes.objects.get(pk=pk)
-        except Exception:
-            raise Http404
-
     def get_queryset(self):
-        node = self.get_object(self.kwargs.get('pk'))
-        return node
+        # no access to another user private node
+        return get_permitted(Nodes, {'pk': self.kwargs.get('pk')}, visible_to(self.request.user),
+                             fields=('label', 'sensors'))
 
     def get(self, request, *args, **kwargs):
         # return node query set
         queryset = self.filter_queryset(self.get_queryset())
-        # no access to another user private node
-        if request.user != queryset.user and 0 == queryset.is_public:
-            return Response({
-                'detail': 'Not found.'
-            }, status=status.HTTP_404_NOT_FOUND)
 
         page = self.paginate_queryset(queryset.sensors)
         if page is not None:
+            # loaded node is shared by every sensor of the page, no query per sensor
             serializer = NodeSensorSerializer(page, many=True, context={
-                'request': request, 'nodeid': kwargs.get('pk')
+                'request': request, 'nodeid': kwargs.get('pk'), 'node': queryset
             })
             return self.get_paginated_response(serializer.data)
 
@@ -48,13 +41,9 @@ class SensorsList(ListAPIView):
         return Response(serializer.data)
 
     def post(self, request, pk):
-        # validate nodeid in url kwargs
-        node = self.get_object(pk)
-        # no access to another user private node
-        if request.user != node.user and 0 == node.is_public:
-            return Response({
-                'detail': 'You can not create sensor for another person node.'
-            }, status=status.HTTP_403_FORBIDDEN)
+        # validate nodeid in url kwargs, only node owner can create sensor
+        get_permitted(Nodes, {'pk': pk}, owned_by(request.user), fields=('id',),
+                      denied='You can not create sensor for another person node.')
 
         serializer = NodeSensorSerializer(data=request.data, context={
             'request': request, 'nodeid': pk
@@ -75,9 +64,13 @@ class SensorsList(ListAPIView):
             Using serializer.data directly will raise ObjectID error cause
             EmbededDocument, normally, doesn`t have _id field.
             """
-            sensor = node.first().sensors.get(label=serializer.data.get('label'))
+            node = node.first()
+            # update_one sends no signal, ingestion must see the new sensor
+            engine.cache.invalidate(Nodes, node.id)
+            sensor = node.sensors.get(label=serializer.data.get('label'))
+            index_sensor(SensorIndex.NODE, node.id, request.user.id, sensor)
             return Response(NodeSensorSerializer(
-                sensor, context={'request': request, 'nodeid': pk}
+                sensor, context={'request': request, 'nodeid': pk, 'node': node}
             ).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -90,30 +83,28 @@ class SensorDetail(GenericAPIView):
     permission_classes = (IsUser,)
 
     @staticmethod
-    def get_node(node_pk, sensor_id):
-        try:
-            node = Nodes.objects.get(pk=node_pk)
-            sensor = node.sensors.get(id=sensor_id)
-            return {
-                'node': node,
-                'sensor': sensor
-            }
-        except Exception:
-            raise Http404
+    def get_node(node_pk, sensor_id, predicate, fields=None, denied=None):
+        """
+        Load node which has sensor_id, authorized by permission predicate in the same query.
+        """
+        node = get_permitted(Nodes, {'pk': node_pk, 'sensors__id': sensor_id}, predicate,
+                             fields=fields, denied=denied)
+        return {
+            'node': node,
+            'sensor': node.sensors.get(id=sensor_id) if fields is None or 'sensors' in fields else None
+        }
 
     def get(self, request, pk, sensorid):
         if not is_objectid_valid(pk):
             return Response({
                 'detail': '%s is not valid ObjectId.' % pk
             }, status=status.HTTP_400_BAD_REQUEST)
-        data = self.get_node(pk, sensorid)
         # no access to another user private node
-        if request.user != data.get('node').user and 0 == data.get('node').is_public:
-            return Response({
-                'detail': 'Not found.'
-            }, status=status.HTTP_404_NOT_FOUND)
+        data = self.get_node(pk, sensorid, visible_to(request.user), fields=('label', 'sensors'))
 
-        serializer = NodeSensorSerializer(data.get('sensor'), context={'request': request, 'nodeid': pk})
+        serializer = NodeSensorSerializer(data.get('sensor'), context={
+            'request': request, 'nodeid': pk, 'node': data.get('node')
+        })
         return Response(serializer.data)
 
     def put(self, request, pk, sensorid):
@@ -129,7 +120,8 @@ class SensorDetail(GenericAPIView):
         Manual validation
         cause any selializer cannot handle EmbededDocummentList update
         """
-        data = self.get_node(pk, sensorid)
+        data = self.get_node(pk, sensorid, owned_by(request.user),
+                             denied='You can not update another person node.')
         node = data.get('node')
         serializer = NodeSensorSerializer(data=request.data, context={
             'request': request, 'nodeid': pk, 'isupdate': True
@@ -151,9 +143,10 @@ class SensorDetail(GenericAPIView):
 
             node.sensors = tmp_sensors
             node.save()
+            index_sensor(SensorIndex.NODE, node.id, request.user.id, self_sensor)
             return Response(
                 NodeSensorSerializer(
-                    self_sensor, context={'request': request, 'nodeid': pk}
+                    self_sensor, context={'request': request, 'nodeid': pk, 'node': node}
                 ).data, status=status.HTTP_200_OK
             )
         else:
@@ -164,18 +157,14 @@ class SensorDetail(GenericAPIView):
             return Response({
                 'detail': '%s is not valid ObjectId.' % pk
             }, status=status.HTTP_400_BAD_REQUEST)
-        # check that nodeid and sensorid is valid
-        data = self.get_node(pk, sensorid)
-        # no access to delete another user sensor node
-        if request.user != data.get('node').user:
-            return Response({
-                'detail': 'You can not delete another person node.'
-            }, status=status.HTTP_403_FORBIDDEN)
+        # check that nodeid and sensorid is valid, no access to delete another user sensor node
+        self.get_node(pk, sensorid, owned_by(request.user), fields=('id',),
+                      denied='You can not delete another person node.')
 
-        Nodes.objects(pk=pk).update_one(pull__sensors__id=sensorid)
-        # delete referer subscription
-        Sensordatas.objects(sensor=sensorid).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        # sensordatas of the sensor are hidden now and removed by deletionworker
+        job = delete_sensor(Nodes, pk, sensorid, request.user)
+        return Response(DeletionJobSerializer(job, context={'request': request}).data,
+                        status=status.HTTP_202_ACCEPTED)
 
 
 class SupernodeSensorsList(ListAPIView):
@@ -183,31 +172,20 @@ class SupernodeSensorsList(ListAPIView):
     permission_classes = (IsUser,)
     serializer_class = SupernodeSensorSerializer
 
-    @staticmethod
-    def get_object(pk):
-        try:
-            return Supernodes.objects.get(pk=pk)
-        except Exception:
-            raise Http404
-
     def get_queryset(self):
-        supernode = self.get_object(self.kwargs.get('pk'))
-        return supernode
+        # TODO supernode visibility? supernode has no is_public flag, only owner has access
+        return get_permitted(Supernodes, {'pk': self.kwargs.get('pk')}, owned_by(self.request.user),
+                             fields=('label', 'sensors'))
 
     def get(self, request, *args, **kwargs):
         # return node query set
         queryset = self.filter_queryset(self.get_queryset())
-        # TODO supernode visibility?
-        # no access to another user private node
-        if request.user != queryset.user and 0 == queryset.is_public:
-            return Response({
-                'detail': 'Not found.'
-            }, status=status.HTTP_404_NOT_FOUND)
 
         page = self.paginate_queryset(queryset.sensors)
         if page is not None:
+            # loaded supernode is shared by every sensor of the page, no query per sensor
             serializer = SupernodeSensorSerializer(page, many=True, context={
-                'request': request, 'supernodeid': kwargs.get('pk')
+                'request': request, 'supernodeid': kwargs.get('pk'), 'supernode': queryset
             })
             return self.get_paginated_response(serializer.data)
 
@@ -215,14 +193,9 @@ class SupernodeSensorsList(ListAPIView):
         return Response(serializer.data)
 
     def post(self, request, pk):
-        # validate nodeid in url kwargs
-        supernode = self.get_object(pk)
-        # no access to another user private supernode
-        # TODO supernode visibility?
-        if request.user != supernode.user and 0 == supernode.is_public:
-            return Response({
-                'detail': 'You can not create sensor for another person supernode.'
-            }, status=status.HTTP_403_FORBIDDEN)
+        # validate supernodeid in url kwargs, no access to another user supernode
+        get_permitted(Supernodes, {'pk': pk}, owned_by(request.user), fields=('id',),
+                      denied='You can not create sensor for another person supernode.')
 
         serializer = SupernodeSensorSerializer(data=request.data, context={
             'request': request, 'supernodeid': pk
@@ -238,14 +211,20 @@ class SupernodeSensorsList(ListAPIView):
             supernode.update_one(
                 push__sensors=Sensors(id=newid, label=serializer.data.get('label'))
             )
+            # supernode principal carries its sensors
+            principal_cache.invalidate_supernode(pk)
             """
             Get sensor data manually and serialize it again.
             Using serializer.data directly will raise ObjectID error cause
             EmbededDocument, normally, doesn`t have _id field.
             """
-            sensor = supernode.first().sensors.get(label=serializer.data.get('label'))
+            supernode = supernode.first()
+            # update_one sends no signal, ingestion must see the new sensor
+            engine.cache.invalidate(Supernodes, supernode.id)
+            sensor = supernode.sensors.get(label=serializer.data.get('label'))
+            index_sensor(SensorIndex.SUPERNODE, supernode.id, request.user.id, sensor)
             return Response(SupernodeSensorSerializer(
-                sensor, context={'request': request, 'supernodeid': pk}
+                sensor, context={'request': request, 'supernodeid': pk, 'supernode': supernode}
             ).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -258,31 +237,28 @@ class SupernodeSensorDetail(GenericAPIView):
     permission_classes = (IsUser,)
 
     @staticmethod
-    def get_supernode(supernode_pk, sensor_id):
-        try:
-            supernode = Supernodes.objects.get(pk=supernode_pk)
-            sensor = supernode.sensors.get(id=sensor_id)
-            return {
-                'supernode': supernode,
-                'sensor': sensor
-            }
-        except Exception:
-            raise Http404
+    def get_supernode(supernode_pk, sensor_id, predicate, fields=None, denied=None):
+        """
+        Load supernode which has sensor_id, authorized by permission predicate in the same query.
+        """
+        supernode = get_permitted(Supernodes, {'pk': supernode_pk, 'sensors__id': sensor_id}, predicate,
+                                  fields=fields, denied=denied)
+        return {
+            'supernode': supernode,
+            'sensor': supernode.sensors.get(id=sensor_id) if fields is None or 'sensors' in fields else None
+        }
 
     def get(self, request, pk, sensorid):
         if not is_objectid_valid(pk):
             return Response({
                 'detail': '%s is not valid ObjectId.' % pk
             }, status=status.HTTP_400_BAD_REQUEST)
-        data = self.get_supernode(pk, sensorid)
-        # TODO supernode visibility?
-        # no access to another user private node
-        if request.user != data.get('supernode').user and 0 == data.get('supernode').is_public:
-            return Response({
-                'detail': 'Not found.'
-            }, status=status.HTTP_404_NOT_FOUND)
+        # TODO supernode visibility? only owner has access
+        data = self.get_supernode(pk, sensorid, owned_by(request.user), fields=('label', 'sensors'))
 
-        serializer = SupernodeSensorSerializer(data.get('sensor'), context={'request': request, 'supernodeid': pk})
+        serializer = SupernodeSensorSerializer(data.get('sensor'), context={
+            'request': request, 'supernodeid': pk, 'supernode': data.get('supernode')
+        })
         return Response(serializer.data)
 
     def put(self, request, pk, sensorid):
@@ -298,7 +274,8 @@ class SupernodeSensorDetail(GenericAPIView):
         Manual validation
         cause any selializer cannot handle EmbededDocummentList update
         """
-        data = self.get_supernode(pk, sensorid)
+        data = self.get_supernode(pk, sensorid, owned_by(request.user),
+                                  denied='You can not update another person supernode.')
         supernode = data.get('supernode')
         serializer = SupernodeSensorSerializer(data=request.data, context={
             'request': request, 'supernodeid': pk, 'isupdate': True
@@ -320,9 +297,10 @@ class SupernodeSensorDetail(GenericAPIView):
 
             supernode.sensors = tmp_sensors
             supernode.save()
+            index_sensor(SensorIndex.SUPERNODE, supernode.id, request.user.id, self_sensor)
             return Response(
                 SupernodeSensorSerializer(
-                    self_sensor, context={'request': request, 'supernodeid': pk}
+                    self_sensor, context={'request': request, 'supernodeid': pk, 'supernode': supernode}
                 ).data, status=status.HTTP_200_OK
             )
         else:
@@ -333,15 +311,43 @@ class SupernodeSensorDetail(GenericAPIView):
             return Response({
                 'detail': '%s is not valid ObjectId.' % pk
             }, status=status.HTTP_400_BAD_REQUEST)
-        # check that nodeid and sensorid is valid
-        data = self.get_supernode(pk, sensorid)
-        # no access to delete another user sensor node
-        if request.user != data.get('supernode').user:
-            return Response({
-                'detail': 'You can not delete another person node.'
-            }, status=status.HTTP_403_FORBIDDEN)
+        # check that supernodeid and sensorid is valid, no access to delete another user sensor supernode
+        self.get_supernode(pk, sensorid, owned_by(request.user), fields=('id',),
+                           denied='You can not delete another person node.')
+
+        job = delete_sensor(Supernodes, pk, sensorid, request.user)
+        principal_cache.invalidate_supernode(pk)
+        return Response(DeletionJobSerializer(job, context={'request': request}).data,
+                        status=status.HTTP_202_ACCEPTED)
+
+
+class FleetSensorsList(ListAPIView):
+    """
+    Retrieve sensors of every node and supernode of authenticated user, from the sensor index.
+
+    Usage:
+    /sensors/                      => retrieve all user sensors
+    /sensors/?label=TEMP           => retrieve user sensors labeled TEMP
+    /sensors/?label=TEMP&kind=node => retrieve only node sensors labeled TEMP
+    """
+    authentication_classes = (JSONWebTokenAuthentication,)
+    permission_classes = (IsUser,)
+    serializer_class = SensorIndexSerializer
+
+    def get_queryset(self):
+        lookup = {'owner': self.request.user.id}
+        if self.request.GET.get('label'):
+            lookup['label'] = self.request.GET.get('label')
+        if self.request.GET.get('kind'):
+            lookup['parent_kind'] = self.request.GET.get('kind')
+        return SensorIndex.objects(**lookup).order_by('label')
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = SensorIndexSerializer(page, many=True, context={'request': request})
+            return self.get_paginated_response(serializer.data)
 
-        Supernodes.objects(pk=pk).update_one(pull__sensors__id=sensorid)
-        # delete referer subscription
-        Sensordatas.objects(sensor=sensorid).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
@@ -1,15 +1,16 @@
 from __future__ import unicode_literals
 
 from mongoengine.document import Document, EmbeddedDocument
+from mongoengine.queryset import QuerySetManager, queryset_manager
 from mongoengine import StringField, FloatField, ReferenceField, EmbeddedDocumentField, \
-    EmbeddedDocumentListField, CASCADE
+    EmbeddedDocumentListField, BooleanField, PointField, CASCADE
 from sensors.models import Sensors
 from users.models import User
 
 
 class Coordinates(EmbeddedDocument):
-    lat = FloatField(required=True, null=False)
-    long = FloatField(required=True, null=False)
+    lat = FloatField(required=True, null=False, min_value=-90, max_value=90)
+    long = FloatField(required=True, null=False, min_value=-180, max_value=180)
 
     def __unicode__(self):
         return str([self.lat, self.long])
@@ -22,6 +23,21 @@ class Supernodes(Document):
     description = StringField(max_length=140, required=False)
     sensors = EmbeddedDocumentListField(document_type=Sensors)
     coordinates = EmbeddedDocumentField(document_type=Coordinates, required=False, null=True)
+    # GeoJSON point of coordinates, set on save, mongoengine creates its 2dsphere index
+    location = PointField(required=False, null=True)
+    # set on delete, the document and its sensordatas are removed later by a deletion job
+    is_deleted = BooleanField(default=False)
+
+    # deleted documents included, for deletion jobs
+    all_objects = QuerySetManager()
+
+    @queryset_manager
+    def objects(doc_cls, queryset):
+        return queryset.filter(is_deleted__ne=True)
+
+    def clean(self):
+        # GeoJSON order is longitude first
+        self.location = [self.coordinates.long, self.coordinates.lat] if self.coordinates else None
 
     def __unicode__(self):
         return self.label
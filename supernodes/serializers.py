@@ -18,6 +18,8 @@ class SuperNodesSerializer(DocumentSerializer):
     )
     sensor_count = serializers.SerializerMethodField()
     node_count = serializers.SerializerMethodField()
+    reading_count = serializers.SerializerMethodField()
+    last_seen = serializers.SerializerMethodField()
     nodes_list = serializers.HyperlinkedIdentityField(
         view_name='supernodes-node-list',
         lookup_field='pk'
@@ -25,16 +27,31 @@ class SuperNodesSerializer(DocumentSerializer):
 
     class Meta:
         model = Supernodes
-        exclude = ('sensors',)
+        exclude = ('sensors', 'is_deleted', 'location')
 
     @staticmethod
     def get_sensor_count(obj):
         return obj.sensors.count()
 
-    @staticmethod
-    def get_node_count(obj):
+    def get_node_count(self, obj):
+        # listings pass counts of the whole page, computed with one aggregation
+        counts = self.context.get('node_counts')
+        if counts is not None:
+            return counts.get(obj.pk, {}).get('count', 0)
         return Nodes.objects.filter(supernode=obj).count()
 
+    def get_reading_count(self, obj):
+        stats = self.context.get('reading_stats')
+        if stats is None:
+            return None
+        return stats.get(obj.pk, {}).get('count', 0)
+
+    def get_last_seen(self, obj):
+        stats = self.context.get('reading_stats')
+        if stats is None:
+            return None
+        return stats.get(obj.pk, {}).get('last_seen')
+
     def validate_label(self, value):
         """
         rest_framework.validators.UniqueValidator can't handle label uniqueness
@@ -1,18 +1,28 @@
-from django.http import Http404
+from pymongo.errors import OperationFailure
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework_mongoengine.generics import ListAPIView, GenericAPIView
 from authenticate.authentication import JSONWebTokenAuthentication
-from authenticate.permissions import IsUser
-from cloud_platform.helpers import is_objectid_valid
+from authenticate.permissions import IsUser, get_permitted, owned_by
+from cloud_platform.helpers import is_objectid_valid, group_by, prefetch_references, geo_lookup
 
+from jobs.deletion import delete_supernode, pending_sensors
+from jobs.serializers import DeletionJobSerializer
+from nodes.models import Nodes
+from sensordatas.models import Sensordatas
 from supernodes.models import Supernodes
 from supernodes.serializers import SuperNodesSerializer
+from users.models import User
 
 
 class SuperNodesList(ListAPIView):
     """
     Retrieve  SuperNodes instance.
+
+    Spatial filters:
+    ?near=<lat>,<long>&distance=<meters>   => supernodes within distance (default 1000) of a point
+    ?polygon=<lat>,<long>;<lat>,<long>;... => supernodes inside a polygon
+    ?bbox=<south>,<west>,<north>,<east>    => supernodes inside a bounding box
     """
     authentication_classes = (JSONWebTokenAuthentication,)
     permission_classes = (IsUser,)
@@ -22,15 +32,52 @@ class SuperNodesList(ListAPIView):
     def get_supernodes(user):
         return Supernodes.objects.filter(user=user)
 
+    @staticmethod
+    def get_context(request, page):
+        """
+        Per page serializer context: node counts, and with ?stats=1 reading count and last seen,
+        each from one $group over the page supernodes instead of queries per supernode.
+        """
+        ids = [supernode.pk for supernode in page]
+        context = {
+            'request': request,
+            # soft-deleted nodes are counted by neither listing nor detail view
+            'node_counts': group_by(Nodes, 'supernode', ids, match={'is_deleted': {'$ne': True}})
+        }
+        if request.GET.get('stats') in ('1', 'true'):
+            # nor are sensordatas still waiting for their deletion job
+            match = {}
+            deleted = list(Nodes.all_objects(supernode__in=ids, is_deleted=True).scalar('id'))
+            if deleted:
+                match['node'] = {'$nin': deleted}
+            sensors = pending_sensors()
+            if sensors:
+                match['sensor'] = {'$nin': sensors}
+            context['reading_stats'] = group_by(
+                Sensordatas, 'supernode', ids, {'last_seen': {'$max': '$timestamp'}}, match
+            )
+        return context
+
     def get(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_supernodes(request.user))
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = SuperNodesSerializer(page, many=True, context={'request': request})
-            return self.get_paginated_response(serializer.data)
+        try:
+            geo = geo_lookup(request.GET)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = queryset.filter(**geo)
+        try:
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                prefetch_references(page, 'user', User, ('username',))
+                serializer = SuperNodesSerializer(page, many=True, context=self.get_context(request, page))
+                return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+            serializer = self.get_serializer(queryset, many=True)
+            return Response(serializer.data)
+        except OperationFailure:
+            if not geo:
+                raise
+            return Response({'detail': 'This area can not be queried.'}, status=status.HTTP_400_BAD_REQUEST)
 
     @staticmethod
     def post(request):
@@ -57,23 +104,12 @@ class SupernodeDetail(GenericAPIView):
     authentication_classes = (JSONWebTokenAuthentication,)
     permission_classes = (IsUser,)
 
-    @staticmethod
-    def get_object(pk):
-        try:
-            return Supernodes.objects.get(pk=pk)
-        except Exception:
-            raise Http404
-
     def get(self, request, pk, format=None):
         if not is_objectid_valid(pk):
             return Response({
                 'detail': '%s is not valid ObjectId.' % pk
             }, status=status.HTTP_400_BAD_REQUEST)
-        supernode = self.get_object(pk)
-        if request.user != supernode.user:
-            return Response({
-                'detail': 'Not found.'
-            }, status=status.HTTP_404_NOT_FOUND)
+        supernode = get_permitted(Supernodes, {'pk': pk}, owned_by(request.user))
         serializer = SuperNodesSerializer(supernode, context={'request': request})
         return Response(serializer.data)
 
@@ -82,11 +118,8 @@ class SupernodeDetail(GenericAPIView):
             return Response({
                 'detail': '%s is not valid ObjectId.' % pk
             }, status=status.HTTP_400_BAD_REQUEST)
-        supernode = self.get_object(pk)
-        if request.user != supernode.user:
-            return Response({
-                'detail': 'You can not update another person supernode.'
-            }, status=status.HTTP_403_FORBIDDEN)
+        supernode = get_permitted(Supernodes, {'pk': pk}, owned_by(request.user),
+                                  denied='You can not update another person supernode.')
         # SlugRelatedField, avoid 'query does not matching' exception on non valid data payload
         if request.data.get('user'):
             request.data.pop('user')
@@ -101,10 +134,9 @@ class SupernodeDetail(GenericAPIView):
             return Response({
                 'detail': '%s is not valid ObjectId.' % pk
             }, status=status.HTTP_400_BAD_REQUEST)
-        supernode = self.get_object(pk)
-        if request.user != supernode.user:
-            return Response({
-                'detail': 'You can not delete another person supernode.'
-            }, status=status.HTTP_403_FORBIDDEN)
-        supernode.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        supernode = get_permitted(Supernodes, {'pk': pk}, owned_by(request.user), fields=('id',),
+                                  denied='You can not delete another person supernode.')
+        # supernode and its nodes are hidden now, their sensordatas are removed by deletionworker
+        job = delete_supernode(supernode, request.user)
+        return Response(DeletionJobSerializer(job, context={'request': request}).data,
+                        status=status.HTTP_202_ACCEPTED)